@@ -0,0 +1,173 @@
+"""
+Asyncio registration engine for the CPR Bot.
+
+Runs CprBot registrations for many participants and bookings concurrently.
+The MyRC and Bookeo calls stay on requests; each one runs in a thread of the
+engine's own pool under a shared concurrency limit, so a batch job can keep
+many requests in flight over one authenticated session.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, List
+
+import requests
+
+import metrics
+from cpr_bot import CprBot
+from ledger import Ledger, ParticipantsInProgress
+from transport import classify_failure
+
+
+class AsyncCprBot:
+    """Concurrent registration engine built on a shared CprBot session."""
+
+    def __init__(self, dry_run: bool = False, concurrency: int = 8, bot: Optional[CprBot] = None):
+        """
+        Initialize the async engine.
+
+        Args:
+            dry_run: If True, performs all steps except final registration.
+            concurrency: Max registration steps (login, lookup, enrollment,
+                         Bookeo update) running at once.
+            bot: Bot whose session, login and course cache are shared.
+                 A new CprBot is created if not given.
+        """
+        self.bot = bot if bot is not None else CprBot(dry_run=dry_run)
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # asyncio's default executor stops at min(32, CPUs + 4) threads, fewer than a batch job may ask for
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cpr-bot")
+
+        # Let every worker keep its connection alive instead of discarding it
+        self.bot.configure_transport(pool_maxsize=max(concurrency, 10))
+
+    async def _call(self, func: Callable, *args: Any) -> Any:
+        """Run a blocking CprBot call in the engine's thread pool under the concurrency limit."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        # Like asyncio.to_thread, carry the caller's context so metrics spans nest
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    # Same operations as CprBot, awaitable
+
+    async def login(self) -> bool:
+        """Log in to MyRC, or reuse the shared session if it is still valid."""
+        return await self._call(self.bot.ensure_logged_in)
+
+    async def _search_courses(self, verif_token: str, page: int = 1) -> requests.Response:
+        return await self._call(self.bot._search_courses, verif_token, page)
+
+    async def _search_contact_api(self, verif_token: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.bot._search_contact_api, verif_token)
+
+    async def _create_contact_api(self, verif_token: str) -> Optional[str]:
+        return await self._call(self.bot._create_contact_api, verif_token)
+
+    async def _add_participant_api(self, verif_token: str, contact_id: str) -> bool:
+        return await self._call(self.bot._add_participant_api, verif_token, contact_id)
+
+    async def bookeo_put(self, response_code: str, event: Dict[str, Any]) -> Optional[requests.Response]:
+        return await self._call(self.bot.bookeo_put, response_code, event)
+
+    # Booking orchestration
+
+    @metrics.per_booking
+    async def run_async(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Process one Bookeo webhook event, enrolling its participants concurrently."""
+        bot = self.bot.fork()
+        participants = bot.parse_event(event)
+        valid = [p for p in participants if p is not None]
+
+        # Webhook redeliveries skip participants the ledger already settled
+        statuses = await self._call(bot.claim_participants, event, valid)
+        todo = [i for i, s in enumerate(statuses) if s is None]
+        if valid and not todo:
+            if Ledger.IN_PROGRESS in statuses:
+                raise ParticipantsInProgress(f"Participants of {event.get('itemId', 'unknown')} are being registered by another run")
+            print(f"All participants already processed for {event.get('itemId', 'unknown')}, skipping")
+            bot.bookeo_response = statuses
+            return {'statusCode': 200, 'body': '', 'bookeo_response': bot.bookeo_response}
+
+        if todo:
+            try:
+                bot.parsed_webhook = valid[todo[0]]
+                bot.checkpoint = {}
+                status = await self._call(bot._prepare_booking_with_retries)
+
+                if status in ("Multiple Courses Found", "No Courses Found"):
+                    for i in todo:
+                        statuses[i] = status
+                    await self._call(bot.record_outcomes, event, [valid[i] for i in todo], [status] * len(todo))
+                    if status == "No Courses Found" and bot.pending_queue is not None and not bot.dry_run:
+                        await self._call(bot.pending_queue.add, event, bot.parsed_webhook['course_date'])
+                    bot.bookeo_response = ["Malformed Data"] * participants.index(valid[0]) + [status]
+                    await self._call(bot.report, event, bot.bookeo_response, status)
+                    return {'statusCode': 200, 'body': '', 'bookeo_response': bot.bookeo_response}
+
+                if status:
+                    for i in todo:
+                        statuses[i] = status
+                elif bot.batch_writes and not bot.dry_run and len(todo) > 1:
+                    try:
+                        results = await self._call(bot.enroll_participants_batch, [valid[i] for i in todo])
+                        for i, result in zip(todo, results):
+                            statuses[i] = result
+                    except requests.exceptions.RequestException as e:
+                        print(f"Batch enrollment failed, falling back to single requests: {e}")
+                        if classify_failure(e) == "auth":
+                            bot._forget_session()
+
+                # Anything the batch didn't settle is enrolled concurrently
+                pending = [i for i in todo if statuses[i] is None]
+                results = await asyncio.gather(*(self._call(self._enroll, bot, valid[i]) for i in pending))
+                for i, result in zip(pending, results):
+                    statuses[i] = result
+
+                await self._call(bot.record_outcomes, event, [valid[i] for i in todo], [statuses[i] for i in todo])
+            except Exception:
+                await self._call(bot.release_claims, event, valid, todo, statuses)
+                raise
+
+        remaining = iter(statuses)
+        bot.bookeo_response = [next(remaining) if p is not None else "Malformed Data" for p in participants]
+
+        status = "SUCCESS" if all(r == "Success" for r in bot.bookeo_response) else "FAILURE"
+        await self._call(bot.report, event, bot.bookeo_response, status)
+        return {'statusCode': 200, 'body': '', 'bookeo_response': bot.bookeo_response}
+
+    @staticmethod
+    def _enroll(bot: CprBot, participant: Dict[str, Any]) -> str:
+        """Enroll one participant on its own fork of the prepared booking bot."""
+        participant_bot = bot.fork()
+        participant_bot.parsed_webhook = participant
+        participant_bot.checkpoint.pop('contact_id', None)
+        return participant_bot._enroll_with_retries()
+
+    async def run_many_async(self, events: List[Dict[str, Any]], return_exceptions: bool = False) -> List[Any]:
+        """
+        Process many Bookeo events concurrently; results are in event order.
+
+        Args:
+            events: Bookeo webhook events
+            return_exceptions: Return a failed event's exception in its slot
+                               instead of raising it
+        """
+        return list(await asyncio.gather(*(self.run_async(event) for event in events),
+                                         return_exceptions=return_exceptions))
+
+    # Sync wrappers
+
+    def run(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Process one Bookeo webhook event (sync wrapper for Lambda)."""
+        self._semaphore = None  # Bound to the loop asyncio.run() creates
+        return asyncio.run(self.run_async(event))
+
+    def run_many(self, events: List[Dict[str, Any]], return_exceptions: bool = False) -> List[Any]:
+        """Process many Bookeo events concurrently (sync wrapper)."""
+        self._semaphore = None
+        return asyncio.run(self.run_many_async(events, return_exceptions))
@@ -0,0 +1,160 @@
+"""
+Bulk backfill of Bookeo bookings into MyRC.
+
+Reads bookings from a JSONL file, one per line, in the webhook shape: either the
+full event ({"itemId": ..., "item": {...}}) or just the "item" object. Bookings
+are processed through AsyncCprBot over one shared MyRC session, sorted by course
+date so each date's course search is done once and served from the cache.
+
+Every finished booking is appended to the results file as it completes. Rerunning
+with the same results file skips bookings that succeeded or failed for a reason
+a retry can't fix (see TERMINAL_STATUSES), so an interrupted backfill resumes
+where it stopped. Dry runs keep their own results file, so checking a file first
+doesn't mark its bookings as done for the real run.
+
+Usage:
+    python backfill.py bookings.jsonl                        # Results in bookings.results.jsonl
+    python backfill.py bookings.jsonl --results out.jsonl --concurrency 16
+    python backfill.py bookings.jsonl --retry-failed         # Resume, retrying terminal failures too
+    python backfill.py bookings.jsonl --dry-run              # No registrations; results in bookings.dry-run.results.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Set
+
+from async_bot import AsyncCprBot
+from cpr_bot import CprBot
+from ledger import Ledger
+from pending import PendingQueue
+
+# Outcomes rerunning the same booking won't change; "No Courses Found" is retried by the pending queue
+TERMINAL_STATUSES = frozenset({"Success", "Malformed Data", "Multiple Courses Found", "No Courses Found"})
+
+
+def load_events(path: Path) -> List[Dict[str, Any]]:
+    """Read webhook events from a JSONL file, wrapping bare "item" objects."""
+    events = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'item' not in record:
+                record = {'itemId': record.get('bookingNumber') or f"line-{line_number}", 'item': record}
+            events.append(record)
+    return events
+
+
+def is_terminal(outcome: Dict[str, Any]) -> bool:
+    """Whether a failed result only has statuses a rerun would repeat."""
+    bookeo_response = outcome.get('bookeo_response') or []
+    return bool(bookeo_response) and all(status in TERMINAL_STATUSES for status in bookeo_response)
+
+
+def load_done(results_path: Path, retry_failed: bool = False) -> Set[str]:
+    """
+    Return the itemIds a results file records as done.
+
+    A booking is done when its latest result succeeded or failed terminally.
+    Errors, transient failures and dry-run results are never done.
+
+    Args:
+        results_path: JSONL results file from earlier runs
+        retry_failed: Leave out terminal failures too, so only successes are done
+    """
+    if not results_path.exists():
+        return set()
+    latest = {}
+    with open(results_path) as f:
+        for line in f:
+            try:
+                outcome = json.loads(line)
+                latest[str(outcome['itemId'])] = outcome
+            except (ValueError, KeyError):
+                continue  # Partial line from an interrupted run
+    return {item_id for item_id, outcome in latest.items()
+            if outcome.get('ok') or (not retry_failed and is_terminal(outcome))}
+
+
+async def backfill(engine: AsyncCprBot, events: List[Dict[str, Any]], results_path: Path) -> Dict[str, int]:
+    """
+    Process events concurrently, appending each result as it finishes.
+
+    Args:
+        engine: Async engine whose concurrency bounds the in-flight bookings
+        events: Webhook events still to process
+        results_path: JSONL file results are appended to
+
+    Returns:
+        Counts of succeeded and failed bookings
+    """
+    slots = asyncio.Semaphore(engine.concurrency)
+    stats = {'succeeded': 0, 'failed': 0}
+    started = time.monotonic()
+
+    async def process(event: Dict[str, Any]) -> Dict[str, Any]:
+        async with slots:
+            try:
+                result = await engine.run_async(event)
+                bookeo_response = result.get('bookeo_response') or []
+                ok = bool(bookeo_response) and all(r == "Success" for r in bookeo_response)
+            except Exception as e:
+                bookeo_response, ok = [f"Error: {e}"], False
+            return {'itemId': str(event.get('itemId', '')), 'ok': ok, 'bookeo_response': bookeo_response}
+
+    with open(results_path, 'a') as results:
+        tasks = [asyncio.ensure_future(process(event)) for event in events]
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            outcome = await task
+            results.write(json.dumps(outcome) + "\n")
+            results.flush()
+            stats['succeeded' if outcome['ok'] else 'failed'] += 1
+
+            elapsed = time.monotonic() - started
+            print(f"[{done}/{len(events)}] {outcome['itemId']}: {outcome['bookeo_response']} "
+                  f"({done / elapsed:.2f} bookings/s)")
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Bookeo bookings into MyRC")
+    parser.add_argument("bookings", type=Path, help="JSONL file of webhook events or items")
+    parser.add_argument("--results", type=Path,
+                        help="Resumable results file (default: <bookings>.results.jsonl, "
+                             "or <bookings>.dry-run.results.jsonl with --dry-run)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Bookings and requests in flight (default: 8)")
+    parser.add_argument("--retry-failed", action="store_true", help="Also reprocess bookings whose last result failed terminally")
+    parser.add_argument("--dry-run", action="store_true", help="Perform all steps except final registration")
+    args = parser.parse_args()
+
+    results_path = args.results or args.bookings.with_suffix(".dry-run.results.jsonl" if args.dry_run else ".results.jsonl")
+    events = load_events(args.bookings)
+    done = load_done(results_path, args.retry_failed)
+    todo = [event for event in events if str(event.get('itemId', '')) not in done]
+    # Same-date bookings run together so each date's course search is shared
+    todo.sort(key=lambda event: event['item'].get('startTime', ''))
+
+    print(f"Backfill: {len(events)} bookings, {len(events) - len(todo)} already done, {len(todo)} to process")
+    print(f"Mode: {'DRY RUN (no actual registration)' if args.dry_run else 'REAL REGISTRATION'}")
+    if not todo:
+        return
+
+    bot = CprBot(dry_run=args.dry_run, ledger=Ledger(), pending_queue=PendingQueue())
+    engine = AsyncCprBot(concurrency=args.concurrency, bot=bot)
+
+    started = time.monotonic()
+    stats = asyncio.run(backfill(engine, todo, results_path))
+    elapsed = time.monotonic() - started
+
+    print(f"Done: {stats['succeeded']} succeeded, {stats['failed']} failed in {elapsed:.1f}s "
+          f"({len(todo) / elapsed:.2f} bookings/s). Results: {results_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Micro-benchmarks for the per-booking parsing, matching and normalization code.
+
+Covers course matching (parse_and_find_ids) on entity-grid payloads of 10 to
+10,000 records, the B2C and MyRC page extraction done during login on pages of
+100 KB and 1 MB, and the course name, province and phone normalizers. Each
+case reports the best time per call and the peak memory allocated by one call
+(tracemalloc), and is compared with a stored baseline. Matching runs at the
+production INFO level, so near-miss diagnostics are timed, with the log
+output discarded.
+
+Usage:
+    python bench_parsing.py                    # Compare with bench_parsing_baseline.json
+    python bench_parsing.py --save             # Store this run as the new baseline
+    python bench_parsing.py --filter grid      # Only cases whose name contains "grid"
+    python bench_parsing.py --max-regression 1.5   # Exit 1 if a case is 1.5x slower than baseline
+"""
+
+import base64
+import json
+import logging
+import os
+import secrets
+import sys
+import timeit
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Callable, Tuple
+
+from cpr_bot import CprBot, course_name_parser, province_abbreviator, phone_parser
+
+ROOT = Path(__file__).resolve().parent
+BASELINE_PATH = ROOT / "bench_parsing_baseline.json"
+
+GRID_SIZES = (10, 100, 1000, 10000)
+PAGE_SIZES_KB = (100, 1000)
+
+COURSE_TYPES = ("Standard First Aid (Recert)", "Emergency First Aid Blended", "CPR/AED Blended",
+                "Basic Life Support", "Basic Life Support Recertification", "Babysitter Course")
+
+
+def grid_records(count: int) -> List[Dict[str, Any]]:
+    """Entity-grid records with exactly one "Standard First Aid Blended" course in Cambridge."""
+    records = []
+    for n in range(count):
+        if n == count // 2:
+            course_type, facility = "Standard First Aid Blended", "Cambridge Training Centre"
+        else:
+            course_type, facility = COURSE_TYPES[n % len(COURSE_TYPES)], f"Community Centre {n:05d}"
+        records.append({
+            'Id': str(uuid.uuid5(uuid.NAMESPACE_URL, str(n))),
+            'Attributes': [
+                {'Name': 'crc_coursetype', 'Value': {'Name': course_type}},
+                {'Name': 'crc_facility', 'Value': {'Name': facility}},
+                {'Name': 'crc_name', 'Value': f"CRS-{n:06d}"},
+                {'Name': 'crc_startdate', 'Value': "2030-01-14T09:00:00Z"},
+            ],
+        })
+    return records
+
+
+def padding(size_kb: int) -> str:
+    """Script and markup filler like the bundles B2C and portal pages inline."""
+    chunk = ("<script>window.__i18n=" + json.dumps({f"key{i}": "x" * 40 for i in range(10)}) + ";</script>\n"
+             "<div class=\"form-group\"><label for=\"field\">Field</label><input type=\"text\" id=\"field\"/></div>\n")
+    return chunk * (size_kb * 1024 // len(chunk) + 1)
+
+
+def b2c_settings_page(size_kb: int) -> str:
+    """B2C sign-in page with its SETTINGS object after the inlined bundles."""
+    settings = {'csrf': secrets.token_urlsafe(64), 'transId': f"StateProperties={secrets.token_urlsafe(48)}",
+                'api': "CombinedSigninAndSignup"}
+    return f"<html><head>{padding(size_kb)}<script>var SETTINGS = {json.dumps(settings)};</script></head></html>"
+
+
+def b2c_token_page(size_kb: int) -> str:
+    """Final B2C confirmation page with the form that posts the tokens to MyRC."""
+    return (f"<html><body>{padding(size_kb)}<form id='auto' method='post' action='https://myrc.redcross.ca/'>"
+            f"<input type='hidden' name='state' id='state' value='{secrets.token_urlsafe(32)}'/>"
+            f"<input type='hidden' name='id_token' id='id_token' value='{secrets.token_urlsafe(900)}'/>"
+            "</form></body></html>")
+
+
+def course_management_page(size_kb: int) -> str:
+    """CourseManagement page with the grid's data-view-layouts attribute."""
+    layouts = [{'Base64SecureConfiguration': base64.b64encode(secrets.token_bytes(3000)).decode()}]
+    encoded = base64.b64encode(json.dumps(layouts).encode()).decode()
+    return f"<html><body>{padding(size_kb)}<div class='entitylist' data-view-layouts='{encoded}'></div></body></html>"
+
+
+def matcher(records: List[Dict[str, Any]], course_type: str) -> Callable[[], Any]:
+    """parse_and_find_ids on raw records, as for a cold course cache."""
+    bot = CprBot.__new__(CprBot)  # Matching needs no session, notifier or Bookeo client
+    bot.parsed_webhook = {'course_type': course_type, 'course_location': "Cambridge"}
+    return lambda: bot.parse_and_find_ids(records)
+
+
+def cases() -> List[Tuple[str, Callable[[], Any]]]:
+    """Return (name, zero-argument callable) for every benchmark case."""
+    result = []
+    for count in GRID_SIZES:
+        records = grid_records(count)
+        result.append((f"grid.match/{count}", matcher(records, "Standard First Aid Blended")))
+        result.append((f"grid.no_match/{count}", matcher(records, "Stay Safe!")))
+
+    for size_kb in PAGE_SIZES_KB:
+        settings_page = b2c_settings_page(size_kb)
+        token_page = b2c_token_page(size_kb)
+        layouts_page = course_management_page(size_kb)
+        result.append((f"login.b2c_settings/{size_kb}KB", lambda page=settings_page: CprBot._extract_b2c_settings(page)))
+        result.append((f"login.signin_tokens/{size_kb}KB", lambda page=token_page: CprBot._extract_signin_tokens(page)))
+        result.append((f"login.secure_config/{size_kb}KB", lambda page=layouts_page: CprBot._extract_secure_config(page)))
+
+    names = ["Standard First Aid", "Red Cross First Aid Course - Recertification", "Private Babysitter Course",
+             "Basic Life Support Recertification", "Stay Safe! (Ages 9-13)", "CPR/AED Level C"] * 100
+    provinces = ["Ontario", "British Columbia", "Newfoundland and Labrador", "Prince Edward Island",
+                 "Quebec", "Yukon"] * 100
+    phones = ["519-555-1234", "+1 (226) 555-0199", "5195550100", "555-0100", "", "1-800-555-0199 ext. 12"] * 100
+    result.append(("normalize.course_name/600", lambda: [course_name_parser(n, "") for n in names]))
+    result.append(("normalize.province/600", lambda: [province_abbreviator(p) for p in provinces]))
+    result.append(("normalize.phone/600", lambda: [phone_parser(p) for p in phones]))
+    return result
+
+
+def measure(func: Callable[[], Any], repeat: int = 5) -> Dict[str, float]:
+    """Best microseconds per call over `repeat` timed runs, and peak KB allocated by one call."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'us': round(best * 1e6, 2), 'peak_kb': round(peak / 1024, 1)}
+
+
+def main():
+    save = "--save" in sys.argv
+    name_filter = sys.argv[sys.argv.index("--filter") + 1] if "--filter" in sys.argv else ""
+    max_regression = float(sys.argv[sys.argv.index("--max-regression") + 1]) if "--max-regression" in sys.argv else None
+
+    # Keep the production INFO level, match diagnostics included, but format them into /dev/null
+    log = logging.getLogger("cpr_bot")
+    for handler in log.handlers:
+        handler.setStream(open(os.devnull, "w"))
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    results = {}
+    regressions = []
+
+    print(f"{'case':<32} {'us/call':>12} {'peak KB':>10} {'baseline':>12} {'ratio':>7}")
+    print("-" * 77)
+    for name, func in cases():
+        if name_filter not in name:
+            continue
+        result = results[name] = measure(func)
+        previous = baseline.get(name)
+        if previous:
+            ratio = result['us'] / previous['us']
+            if max_regression is not None and ratio > max_regression:
+                regressions.append(name)
+            print(f"{name:<32} {result['us']:>12.1f} {result['peak_kb']:>10.1f} {previous['us']:>12.1f} {ratio:>6.2f}x")
+        else:
+            print(f"{name:<32} {result['us']:>12.1f} {result['peak_kb']:>10.1f} {'-':>12} {'-':>7}")
+
+    if save:
+        BASELINE_PATH.write_text(json.dumps(dict(baseline, **results), indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {BASELINE_PATH.name}")
+
+    if regressions:
+        print(f"FAIL: {len(regressions)} case(s) slower than {max_regression:.2f}x baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Startup benchmark for the Lambda entry point.
+
+Measures, each in a fresh interpreter (as in a Lambda cold start):
+  - import time of handler (the ack path) versus cpr_bot (the processing path)
+  - webhook ack latency through handler.lambda_handler, cold and warm, with a
+    stub Lambda client so only our own overhead is timed
+  - boto3 import plus client creation, if boto3 is installed
+
+Usage:
+    python bench_startup.py                   # 10 runs each, median reported
+    python bench_startup.py --runs 30
+    python bench_startup.py --max-ack-ms 50   # Exit 1 if the cold ack is slower
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent
+
+IMPORT_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'ms': (time.perf_counter() - start) * 1000}}))
+"""
+
+ACK_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import handler
+
+class StubClient:
+    def invoke(self, **kwargs):
+        pass
+
+class Context:
+    function_name = 'cpr-bot'
+
+handler._lambda_client = StubClient()
+event = {'body': json.dumps({'itemId': 'BENCH-1', 'item': {'bookingNumber': 'BENCH'}})}
+handler.lambda_handler(dict(event), Context())
+cold = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+handler.lambda_handler(dict(event), Context())
+warm = (time.perf_counter() - start) * 1000
+print(json.dumps({'cold_ms': cold, 'warm_ms': warm}))
+"""
+
+BOTO3_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import boto3
+client = boto3.client('lambda', region_name='ca-central-1')
+print(json.dumps({'ms': (time.perf_counter() - start) * 1000}))
+"""
+
+
+def run_snippet(snippet: str) -> Dict[str, float]:
+    """Run a snippet in a fresh interpreter and return the JSON it prints last."""
+    result = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(snippet: str, key: str, runs: int) -> float:
+    """Median of one timing over several fresh interpreters."""
+    samples: List[float] = [run_snippet(snippet)[key] for _ in range(runs)]
+    return statistics.median(samples)
+
+
+def has_boto3() -> bool:
+    result = subprocess.run([sys.executable, "-c", "import boto3"], capture_output=True)
+    return result.returncode == 0
+
+
+def main():
+    runs = int(sys.argv[sys.argv.index("--runs") + 1]) if "--runs" in sys.argv else 10
+    max_ack_ms = float(sys.argv[sys.argv.index("--max-ack-ms") + 1]) if "--max-ack-ms" in sys.argv else None
+
+    print(f"Startup benchmark (median of {runs} fresh interpreters)")
+    print("-" * 50)
+    for module in ("handler", "cpr_bot"):
+        ms = median_of(IMPORT_SNIPPET.format(module=module), 'ms', runs)
+        print(f"import {module:<10} {ms:8.1f} ms")
+
+    samples = [run_snippet(ACK_SNIPPET) for _ in range(runs)]
+    cold = statistics.median(s['cold_ms'] for s in samples)
+    warm = statistics.median(s['warm_ms'] for s in samples)
+    print(f"ack (cold)        {cold:8.1f} ms   import + first webhook, stub client")
+    print(f"ack (warm)        {warm:8.1f} ms")
+
+    if has_boto3():
+        ms = median_of(BOTO3_SNIPPET, 'ms', runs)
+        print(f"boto3 client      {ms:8.1f} ms   paid once per container, in the init phase on Lambda")
+    else:
+        print("boto3 client           n/a   boto3 not installed")
+
+    if max_ack_ms is not None and cold > max_ack_ms:
+        print(f"FAIL: cold ack {cold:.1f} ms exceeds {max_ack_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Bookeo API client for the CPR Bot.
+
+Writes registration status back to Bookeo bookings over its own pooled
+session. Update payloads are built from a copy of the webhook item, so the
+caller's event is left intact. Throttled requests are retried with backoff,
+honouring Retry-After, and a booking that stays throttled pauses every caller
+sharing the client. Status updates for one booking that arrive while its PUT
+is in flight are coalesced into a single follow-up PUT with the latest status.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+import metrics
+from transport import TRANSIENT_STATUS_CODES, TransportRetry
+
+# Fields Bookeo rejects or would overwrite when PUT back from a webhook item
+READ_ONLY_FIELDS = ('startTime', 'endTime', 'customer')
+
+
+def build_update(item: Dict[str, Any], external_ref: str) -> Dict[str, Any]:
+    """
+    Build the PUT payload for a booking without modifying the webhook item.
+
+    Args:
+        item: Booking from the webhook event ("item")
+        external_ref: Status string stored in the booking's externalRef
+
+    Returns:
+        A new dict: the item minus read-only fields and participant details
+    """
+    payload = {key: value for key, value in item.items() if key not in READ_ONLY_FIELDS}
+    if 'participants' in payload:
+        payload['participants'] = {key: value for key, value in payload['participants'].items()
+                                   if key != 'details'}
+    payload['externalRef'] = external_ref
+    return payload
+
+
+class BookeoClient:
+    """Pooled, rate-limit aware client for Bookeo booking updates."""
+
+    BASE_URL = "https://api.bookeo.com"
+
+    # Transport retries on 429/5xx; PUT is idempotent so every transient status is retried
+    RETRY_TOTAL = 4
+    BACKOFF_FACTOR = 1.0
+
+    # Seconds every caller waits after a request is still throttled once its retries run out
+    THROTTLE_COOLDOWN = 10.0
+
+    # Bookings whose last sent payload is remembered to skip identical repeats
+    SENT_HISTORY = 1000
+
+    def __init__(self, base_url: Optional[str] = None, pool_maxsize: int = 10,
+                 transport: Optional[Callable[[HTTPAdapter], BaseAdapter]] = None):
+        """
+        Args:
+            base_url: Bookeo API root. Defaults to BASE_URL.
+            pool_maxsize: Connections kept alive for concurrent updates.
+            transport: Wraps the mounted adapter, e.g. Cassette.wrap.
+        """
+        self.base_url = base_url or self.BASE_URL
+        self.session = requests.Session()
+        metrics.instrument(self.session)
+        retry = TransportRetry(
+            total=self.RETRY_TOTAL,
+            backoff_factor=self.BACKOFF_FACTOR,
+            status_forcelist=TRANSIENT_STATUS_CODES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
+        self.session.mount(self.base_url, transport(adapter) if transport else adapter)
+
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        # item_id -> newest payload waiting behind an in-flight PUT (None if nothing waiting)
+        self._in_flight: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._sent: "OrderedDict[str, str]" = OrderedDict()
+
+    def update_booking(self, item_id: str, item: Dict[str, Any], external_ref: str) -> Optional[requests.Response]:
+        """
+        Store a registration status on a booking.
+
+        Args:
+            item_id: Bookeo booking id (webhook "itemId")
+            item: Booking from the webhook event; not modified
+            external_ref: Status string for the booking's externalRef
+
+        Returns:
+            The response of the last PUT this call sent, or None if the update
+            was handed to an in-flight PUT or matched the last one sent
+        """
+        payload = build_update(item, external_ref)
+        with self._lock:
+            if item_id in self._in_flight:
+                self._in_flight[item_id] = payload  # Sent by the in-flight caller when it finishes
+                return None
+            self._in_flight[item_id] = None
+
+        response = None
+        try:
+            while payload is not None:
+                response = self._put_once(item_id, payload)
+                with self._lock:
+                    payload = self._in_flight[item_id]
+                    self._in_flight[item_id] = None
+        finally:
+            with self._lock:
+                del self._in_flight[item_id]
+        return response
+
+    def _put_once(self, item_id: str, payload: Dict[str, Any]) -> Optional[requests.Response]:
+        """PUT a payload unless it is the same as the last one sent for the booking."""
+        data = json.dumps(payload, sort_keys=True)
+        with self._lock:
+            if self._sent.get(item_id) == data:
+                print(f"Bookeo booking {item_id} already has this status, skipping update")
+                return None
+
+        print(f"Updating Bookeo with response: {payload['externalRef']}")
+        self._wait_for_cooldown()
+        response = self.session.put(
+            f'{self.base_url}/v2/bookings/{item_id}',
+            params={
+                'secretKey': os.environ.get('BOOKEO_SECRET_KEY'),
+                'mode': 'backend',
+                'apiKey': os.environ.get('BOOKEO_API_KEY'),
+            },
+            data=data,
+            headers={'Content-Type': 'application/json'},
+        )
+
+        with self._lock:
+            if response.status_code == 429:
+                retry_after = response.headers.get('Retry-After', '')
+                cooldown = float(retry_after) if retry_after.isdigit() else self.THROTTLE_COOLDOWN
+                self._resume_at = max(self._resume_at, time.monotonic() + cooldown)
+                print(f"Bookeo is throttling updates, pausing for {cooldown:.0f}s")
+            elif response.ok:
+                self._sent[item_id] = data
+                self._sent.move_to_end(item_id)
+                while len(self._sent) > self.SENT_HISTORY:
+                    self._sent.popitem(last=False)
+        return response
+
+    def _wait_for_cooldown(self) -> None:
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_default_client: Optional[BookeoClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> BookeoClient:
+    """Return the process-wide Bookeo client, so every bot shares its connection pool."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = BookeoClient()
+    return _default_client
@@ -0,0 +1,209 @@
+"""
+Record/replay HTTP cassettes for the CPR Bot.
+
+A Cassette wraps the transport adapters of CprBot and BookeoClient sessions.
+In record mode every exchange goes to the real servers and is saved to a JSON
+file with credentials redacted. In replay mode responses come from the file,
+matched in order per method and URL, so scenarios run offline and
+deterministically. A request budget turns any scenario into a round-trip
+regression check.
+
+Usage:
+    cassette = Cassette("cassettes/dry_run.json", mode="replay", budget=12)
+    bot = CprBot(transport=cassette.wrap, bookeo=BookeoClient(transport=cassette.wrap))
+    bot.run(event)
+    cassette.save()        # record mode only
+"""
+
+import base64
+import json
+import os
+import re
+import threading
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+REDACTED = "REDACTED"
+
+# Query parameters, form fields and headers that carry credentials
+SECRET_PARAMS = frozenset({'secretKey', 'apiKey', 'password', 'signInName', 'csrf_token', 'id_token', 'state'})
+SECRET_HEADERS = frozenset({'cookie', 'set-cookie', 'authorization', 'x-csrf-token', '__requestverificationtoken'})
+
+# Tokens in response bodies; group 1 is kept and the value after it is redacted
+SECRET_BODY_PATTERNS = (
+    re.compile(r"(name=['\"]id_token['\"][^>]*value=['\"])[^'\"]+"),
+    re.compile(r"(id=['\"]id_token['\"] value=['\"])[^'\"]+"),
+)
+
+# Environment values scrubbed from any recorded body or URL
+SECRET_ENV_VARS = ('MYRC_EMAIL', 'MYRC_PASSWORD', 'BOOKEO_API_KEY', 'BOOKEO_SECRET_KEY',
+                   'EMAIL_USER', 'EMAIL_PASSWORD')
+
+
+class CassetteError(AssertionError):
+    """A replayed request has no recorded response, or a request budget was exceeded."""
+
+
+class Cassette:
+    """Recorded HTTP exchanges for one scenario."""
+
+    def __init__(self, path: str, mode: str = "replay", budget: Optional[int] = None):
+        """
+        Args:
+            path: JSON cassette file
+            mode: "record" to hit the network and save, "replay" to serve from the file
+            budget: Max requests the scenario may make; exceeding it raises CassetteError
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.budget = budget
+        self.requests_made = 0
+        self.counts: Counter = Counter()  # Requests per host
+        self._exchanges: List[Dict[str, Any]] = []
+        self._queues: Dict[Tuple[str, str], deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        if mode == "replay":
+            for exchange in json.loads(self.path.read_text())['exchanges']:
+                request = exchange['request']
+                self._queues[(request['method'], request['url'])].append(exchange['response'])
+
+    def wrap(self, adapter: BaseAdapter) -> "CassetteAdapter":
+        """Transport hook for CprBot/BookeoClient: route an adapter through this cassette."""
+        return CassetteAdapter(self, adapter)
+
+    def save(self) -> None:
+        """Write recorded exchanges to the cassette file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps({'version': 1, 'exchanges': self._exchanges}, indent=2))
+
+    def _count(self, url: str) -> None:
+        with self._lock:
+            self.requests_made += 1
+            self.counts[urlsplit(url).netloc] += 1
+            if self.budget is not None and self.requests_made > self.budget:
+                raise CassetteError(f"Request budget exceeded: request {self.requests_made} "
+                                    f"({url}) over a budget of {self.budget}")
+
+    def _record(self, request: requests.PreparedRequest, response: requests.Response) -> None:
+        body, encoding = _encode_body(response.content)
+        exchange = {
+            'request': {
+                'method': request.method,
+                'url': redact_url(request.url),
+                'headers': _redact_headers(request.headers),
+                'body': redact_text(_decode(request.body)),
+            },
+            'response': {
+                'status': response.status_code,
+                'reason': response.reason,
+                'url': redact_url(response.url),
+                'headers': _redact_headers(response.headers),
+                'body': redact_text(body) if encoding == 'text' else body,
+                'body_encoding': encoding,
+            },
+        }
+        with self._lock:
+            self._exchanges.append(exchange)
+
+    def _replay(self, request: requests.PreparedRequest) -> requests.Response:
+        key = (request.method, redact_url(request.url))
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise CassetteError(f"No recorded response for {key[0]} {key[1]}")
+            recorded = queue.popleft()
+
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded['reason']
+        response.url = request.url
+        response.headers = CaseInsensitiveDict(recorded['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.request = request
+        if recorded['body_encoding'] == 'base64':
+            response._content = base64.b64decode(recorded['body'])
+        else:
+            response._content = recorded['body'].encode('utf-8')
+        response._content_consumed = True
+        return response
+
+
+class CassetteAdapter(BaseAdapter):
+    """Transport adapter that records through, or replays instead of, an inner adapter."""
+
+    def __init__(self, cassette: Cassette, inner: BaseAdapter):
+        super().__init__()
+        self.cassette = cassette
+        self.inner = inner
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        self.cassette._count(request.url)
+        if self.cassette.mode == "replay":
+            return self.cassette._replay(request)
+        response = self.inner.send(request, **kwargs)
+        response.content  # Read the body so it can be recorded
+        self.cassette._record(request, response)
+        return response
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def _secret_values() -> List[str]:
+    return [value for value in (os.environ.get(name) for name in SECRET_ENV_VARS) if value]
+
+
+def redact_text(text: Optional[str]) -> Optional[str]:
+    """Replace credential values from the environment and secret form fields."""
+    if not text:
+        return text
+    for value in _secret_values():
+        text = text.replace(value, REDACTED)
+    for pattern in SECRET_BODY_PATTERNS:
+        text = pattern.sub(lambda match: match.group(1) + REDACTED, text)
+    if '=' in text and not text.lstrip().startswith(('{', '[', '<', '--')):
+        pairs = parse_qsl(text, keep_blank_values=True)
+        if pairs and any(name in SECRET_PARAMS for name, _ in pairs):
+            text = urlencode([(name, REDACTED if name in SECRET_PARAMS else value) for name, value in pairs])
+    return text
+
+
+def redact_url(url: str) -> str:
+    """Redact secret query parameters; recorded and replayed URLs normalize the same way."""
+    parts = urlsplit(url)
+    query = [(name, REDACTED if name in SECRET_PARAMS else value)
+             for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+    url = urlunsplit(parts._replace(query=urlencode(sorted(query))))
+    for value in _secret_values():
+        url = url.replace(value, REDACTED)
+    return url
+
+
+def _redact_headers(headers: Any) -> Dict[str, str]:
+    return {name: REDACTED if name.lower() in SECRET_HEADERS else value for name, value in headers.items()}
+
+
+def _decode(body: Any) -> Optional[str]:
+    if body is None or isinstance(body, str):
+        return body
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode('ascii')
+
+
+def _encode_body(content: bytes) -> Tuple[str, str]:
+    try:
+        return content.decode('utf-8'), 'text'
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode('ascii'), 'base64'
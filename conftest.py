@@ -0,0 +1,37 @@
+"""
+Shared fixtures for the offline tests.
+
+They run CprBot against the local simulator (simulator.py) with their own
+caches, ledger and cookie file, so no credentials or network are needed.
+"""
+
+import pytest
+
+from cpr_bot import CourseSearchCache, SecureConfigCache
+from ledger import Ledger
+from simulator import Simulator
+
+
+@pytest.fixture
+def simulator():
+    with Simulator() as sim:
+        yield sim
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return Ledger(str(tmp_path / "ledger.sqlite3"))
+
+
+@pytest.fixture
+def make_bot(simulator, tmp_path, monkeypatch):
+    """Return a factory for bots pointed at the simulator, with empty caches and no email."""
+    monkeypatch.setenv('EMAIL_RECIPIENTS', '[]')
+
+    def make(**kwargs):
+        kwargs.setdefault('course_cache', CourseSearchCache())
+        kwargs.setdefault('config_cache', SecureConfigCache())
+        bot = simulator.bot(**kwargs)
+        bot.cookies_path = tmp_path / "cookies.pkl"
+        return bot
+    return make
@@ -7,15 +7,35 @@ into the Canadian Red Cross MyRC system.
 """
 
 import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
 import pickle
-import re
 import json
 import os
-import smtplib
 import base64
-from typing import Optional, Dict, Any, List
+import time
+import threading
+import copy
+import heapq
+import logging
+import sys
+import contextvars
+import uuid
+from email import message_from_bytes
+from email.message import Message
+from urllib.parse import urlencode, quote
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Any, Callable, Iterable, Iterator, List, Tuple, Union
 from pathlib import Path
 
+from ledger import DynamoLedger, Ledger, ParticipantsInProgress, participant_fingerprint
+from transport import TRANSIENT_STATUS_CODES, SessionExpired, backoff_delay, classify_failure, TransportRetry
+from pending import PendingQueue
+from notify import NotificationDispatcher, default_dispatcher
+from bookeo import BookeoClient, default_client
+from extract import Extraction, B2C_SETTINGS, SIGNIN_FORM, COURSE_LAYOUTS, VERIFICATION_TOKEN
+import metrics
+
 # Load .env for local development (ignored in Lambda)
 try:
     from dotenv import load_dotenv
@@ -23,6 +43,420 @@ try:
 except ImportError:
     pass
 
+# Leveled logging: LOG_LEVEL=DEBUG restores the per-step detail. Messages use
+# lazy %-formatting so disabled levels cost a level check, not a format.
+log = logging.getLogger("cpr_bot")
+log.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+if not log.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.propagate = False  # Lambda's root handler would print every line twice
+
+# Near-miss courses listed when a booking matches no course or several
+MATCH_DIAGNOSTICS_LIMIT = 5
+# Most facility names compared with the search location per near-miss scan
+MATCH_DIAGNOSTICS_MAX_SCORED = 200
+
+# Error text MyRC returns when it rejects a __RequestVerificationToken
+ANTIFORGERY_MARKERS = ('anti-forgery', 'antiforgery')
+
+# Error text the entity grid returns for an outdated or undecryptable SecureConfiguration
+STALE_CONFIG_MARKERS = ('secureconfiguration', 'secure configuration', 'configuration is invalid')
+
+
+def is_antiforgery_rejection(response: requests.Response) -> bool:
+    """Whether MyRC refused a request because of its verification token."""
+    if response.status_code not in (400, 403, 500):
+        return False
+    text = response.text.lower()
+    return any(marker in text for marker in ANTIFORGERY_MARKERS)
+
+
+def is_stale_config_rejection(response: requests.Response) -> bool:
+    """Whether the entity grid refused a search because of its SecureConfiguration."""
+    if response.status_code not in (400, 500):
+        return False
+    text = response.text.lower()
+    return any(marker in text for marker in STALE_CONFIG_MARKERS)
+
+
+class CourseIndex:
+    """
+    Course search records indexed by normalized course type and facility.
+
+    Search strings are normalized once per lookup and results are memoized,
+    so every participant and booking targeting the same date reuses the index.
+    """
+
+    def __init__(self, records: Iterable[Dict[str, Any]] = ()):
+        self.total_records = 0
+        # normalized course type -> normalized facility -> matching courses
+        self._by_type: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+        self._lookups: Dict[Tuple[str, str], Tuple[List[Dict[str, str]], List[Dict[str, str]]]] = {}
+        self._lock = threading.Lock()
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return self.total_records
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Index a single entity-grid record."""
+        course_id = "0"
+        course_type = ""
+        location = ""
+
+        for attribute in record.get("Attributes", []):
+            attr_name = attribute.get("Name", "")
+            attr_value = attribute.get("Value", {})
+
+            if attr_name == "crc_coursetype":
+                if isinstance(attr_value, dict):
+                    course_type = attr_value.get("Name", "")
+            elif attr_name == "crc_facility":
+                if isinstance(attr_value, dict):
+                    location = attr_value.get("Name", "")
+            elif attr_name == "crc_name":
+                course_id = attr_value
+
+        course = {
+            "course_id": course_id,
+            "ref_id": record.get("Id", ""),
+            "course_type": course_type,
+            "location": location,
+        }
+        with self._lock:
+            facilities = self._by_type.setdefault(course_type.lower(), {})
+            facilities.setdefault(location.lower(), []).append(course)
+            self.total_records += 1
+            self._lookups.clear()
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Index every record from an iterable of entity-grid records."""
+        for record in records:
+            self.add(record)
+
+    def courses(self) -> Iterator[Dict[str, str]]:
+        """Yield every indexed course."""
+        for facilities in self._by_type.values():
+            for courses in facilities.values():
+                yield from courses
+
+    def find(self, course_type: str, location: str) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """
+        Look up courses at a location by course type.
+
+        Type matching is case-insensitive: exact matches are a dict lookup,
+        substring matches scan the distinct course types rather than records.
+        Location uses case-insensitive substring matching.
+
+        Returns:
+            (exact type matches, substring-only type matches)
+        """
+        key = (course_type.lower(), location.lower())
+        with self._lock:
+            if key in self._lookups:
+                return self._lookups[key]
+
+            search_type, search_location = key
+            exact_matches = []
+            substring_matches = []
+            if search_type and search_location:
+                for type_key, facilities in self._by_type.items():
+                    if type_key == search_type:
+                        target = exact_matches
+                    elif search_type in type_key:
+                        target = substring_matches
+                    else:
+                        continue
+                    for facility_key, courses in facilities.items():
+                        if search_location in facility_key:
+                            target.extend(courses)
+
+            self._lookups[key] = (exact_matches, substring_matches)
+            return exact_matches, substring_matches
+
+    def near_misses(self, course_type: str, location: str, limit: int = MATCH_DIAGNOSTICS_LIMIT,
+                    max_scored: int = MATCH_DIAGNOSTICS_MAX_SCORED) -> List[Tuple[float, str, str, int]]:
+        """
+        Rank the indexed (course type, facility) pairs by similarity to a search.
+
+        Course types are visited best first. Facilities containing the search
+        location always score 1.0; at most max_scored others are compared with
+        it, so a catalogue of thousands of facilities costs a bounded amount of
+        difflib work. A compared facility is only scored with ratio() when its
+        cheap upper bounds (real_quick_ratio, quick_ratio) could still place the
+        pair among the best `limit`.
+
+        Returns:
+            Up to limit (score, course type, facility, course count) tuples, best first
+        """
+        search_type, search_location = course_type.lower(), location.lower()
+        best: List[Tuple[float, str, str, int]] = []  # Min-heap of the current top `limit`
+        location_scores: Dict[str, float] = {}
+        # The bounds are symmetric, so one matcher keyed on the search reuses its character counts
+        bounds = SequenceMatcher(None, "", search_location)
+        scored = 0
+
+        def location_score(facility_key: str, needed: float) -> Optional[float]:
+            """Similarity of a facility to the search, or None if it can't reach `needed`."""
+            nonlocal scored
+            if facility_key in location_scores:
+                return location_scores[facility_key]
+            if search_location and search_location in facility_key:
+                score = 1.0
+            elif scored >= max_scored:
+                return None
+            else:
+                scored += 1
+                bounds.set_seq1(facility_key)
+                if bounds.real_quick_ratio() < needed or bounds.quick_ratio() < needed:
+                    return None
+                score = SequenceMatcher(None, search_location, facility_key).ratio()
+            location_scores[facility_key] = score
+            return score
+
+        with self._lock:
+            types = sorted(((1.0 if search_type and search_type in type_key
+                             else SequenceMatcher(None, search_type, type_key).ratio(), type_key)
+                            for type_key in self._by_type), reverse=True)
+            for type_score, type_key in types:
+                # Scores are rounded to 2 places, so a pair within 0.005 of the floor can still tie it
+                if len(best) == limit and (type_score + 1) / 2 < best[0][0] - 0.005:
+                    break
+                for facility_key, courses in self._by_type[type_key].items():
+                    needed = 2 * (best[0][0] - 0.005) - type_score if len(best) == limit else 0.0
+                    score = location_score(facility_key, needed)
+                    if score is None:
+                        continue
+                    candidate = (round((type_score + score) / 2, 2), courses[0]["course_type"],
+                                 courses[0]["location"], len(courses))
+                    if len(best) < limit:
+                        heapq.heappush(best, candidate)
+                    else:
+                        heapq.heappushpop(best, candidate)
+        return sorted(best, reverse=True)
+
+
+class CourseSearchCache:
+    """
+    In-process cache of indexed course search records keyed by search date.
+
+    Dates that returned no records are cached as short-lived negative entries
+    so repeated bookings for a course that doesn't exist in MyRC yet don't
+    re-query the entity grid on every participant.
+    """
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 60):
+        """
+        Args:
+            ttl: Seconds a date with course records stays cached
+            negative_ttl: Seconds a date with zero records stays cached
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[str, Tuple[float, CourseIndex]] = {}
+        self._fill_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, course_date: str) -> Optional[CourseIndex]:
+        """Return the cached index for a date, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(course_date)
+            if entry is None:
+                return None
+            expires_at, index = entry
+            if expires_at <= time.monotonic():
+                del self._entries[course_date]
+                return None
+            return index
+
+    def put(self, course_date: str, index: CourseIndex) -> None:
+        """Cache the index for a date, evicting any expired entries."""
+        now = time.monotonic()
+        ttl = self.ttl if len(index) else self.negative_ttl
+        with self._lock:
+            for date in [d for d, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[date]
+            self._entries[course_date] = (now + ttl, index)
+
+    def fill_lock(self, course_date: str) -> threading.Lock:
+        """Lock held while one caller fetches a date, so concurrent misses search once."""
+        with self._lock:
+            return self._fill_locks.setdefault(course_date, threading.Lock())
+
+    def invalidate(self, course_date: Optional[str] = None) -> None:
+        """Drop one date from the cache, or everything if no date is given."""
+        with self._lock:
+            if course_date is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(course_date, None)
+
+
+# Shared across bot instances so warm Lambda containers reuse lookups
+COURSE_SEARCH_CACHE = CourseSearchCache()
+
+
+class SecureConfigCache:
+    """
+    Cache of the course grid's Base64SecureConfiguration.
+
+    The configuration belongs to the CourseManagement grid view, not to a login
+    session, so it outlives re-logins and is shared by every bot in the process.
+    It is fetched on the first course search and again only when it expires or
+    the grid rejects it.
+    """
+
+    def __init__(self, ttl: float = 86400):
+        """
+        Args:
+            ttl: Seconds a configuration is used before it is fetched again
+        """
+        self.ttl = ttl
+        self.value = ""
+        self.fetched_at = 0.0
+        self.lock = threading.RLock()  # Held while one caller fetches, so concurrent misses fetch once
+
+    def get(self) -> Optional[str]:
+        """Return the cached configuration, or None if there is none or it expired."""
+        if self.value and time.monotonic() - self.fetched_at < self.ttl:
+            return self.value
+        return None
+
+    def put(self, value: str) -> None:
+        self.value = value
+        self.fetched_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self.value = ""
+
+
+SECURE_CONFIG_CACHE = SecureConfigCache()
+
+
+class ODataBatch:
+    """
+    Builds a Dynamics/PowerApps OData $batch request and parses its response.
+
+    Standalone requests (e.g. GETs) become their own batch part. Requests in a
+    change set run atomically, and later requests can bind to an entity created
+    earlier in the same change set by referencing "$<Content-ID>".
+    """
+
+    def __init__(self, api_url: str):
+        """
+        Args:
+            api_url: OData service root, e.g. https://myrc.redcross.ca/_api
+        """
+        self.api_url = api_url.rstrip('/')
+        self.boundary = f"batch_{uuid.uuid4()}"
+        self.next_content_id = 1
+        self._parts: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    def add_request(self, method: str, path: str, params: Optional[Dict[str, str]] = None) -> None:
+        """Add a standalone request as its own batch part."""
+        self._parts.append(self._http_part(method, path, params=params))
+
+    def add_changeset(self, operations: List[Tuple[str, str, Dict[str, Any]]]) -> List[str]:
+        """
+        Add an atomic change set of (method, path, body) operations.
+
+        Returns:
+            The Content-ID assigned to each operation, in order
+        """
+        boundary = f"changeset_{uuid.uuid4()}"
+        content_ids = []
+        lines = [f"Content-Type: multipart/mixed; boundary={boundary}", ""]
+        for method, path, body in operations:
+            content_id = str(self.next_content_id)
+            self.next_content_id += 1
+            content_ids.append(content_id)
+            lines += [f"--{boundary}", self._http_part(method, path, body=body, content_id=content_id)]
+        lines.append(f"--{boundary}--")
+        self._parts.append("\r\n".join(lines))
+        return content_ids
+
+    def body(self) -> str:
+        """Render the multipart/mixed request body."""
+        lines = []
+        for part in self._parts:
+            lines += [f"--{self.boundary}", part]
+        lines.append(f"--{self.boundary}--")
+        return "\r\n".join(lines) + "\r\n"
+
+    def _http_part(self, method: str, path: str, params: Optional[Dict[str, str]] = None,
+                   body: Optional[Dict[str, Any]] = None, content_id: Optional[str] = None) -> str:
+        """Render one embedded HTTP request with its MIME headers."""
+        url = self.api_url + path
+        if params:
+            url += "?" + urlencode(params, quote_via=quote, safe="$")
+
+        lines = ["Content-Type: application/http", "Content-Transfer-Encoding: binary"]
+        if content_id:
+            lines.append(f"Content-ID: {content_id}")
+        lines += ["", f"{method} {url} HTTP/1.1"]
+        if body is None:
+            lines += ["Accept: application/json", "", ""]
+        else:
+            lines += ["Content-Type: application/json; type=entry", "", json.dumps(body)]
+        return "\r\n".join(lines)
+
+    @staticmethod
+    def parse_response(content_type: str, content: bytes) -> List[List[Dict[str, Any]]]:
+        """
+        Parse a multipart $batch response.
+
+        Returns:
+            One list of responses per batch part, in request order. A change set
+            that succeeded yields one response per operation; a failed change set
+            yields the single error response. Each response is a dict with
+            status, headers (lower-cased names), body and content_id.
+        """
+        message = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + content)
+        results = []
+        for part in message.get_payload():
+            if part.is_multipart():
+                results.append([ODataBatch._parse_http(p) for p in part.get_payload()])
+            else:
+                results.append([ODataBatch._parse_http(part)])
+        return results
+
+    @staticmethod
+    def _parse_http(part: Message) -> Dict[str, Any]:
+        """Parse one embedded HTTP response."""
+        raw = part.get_payload(decode=True) or b""
+        text = raw.decode('utf-8', errors='replace').replace("\r\n", "\n")
+        head, _, body = text.partition("\n\n")
+        status_line, *header_lines = head.strip().split("\n")
+
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        status_parts = status_line.split()
+        return {
+            'status': int(status_parts[1]) if len(status_parts) > 1 and status_parts[1].isdigit() else 0,
+            'headers': headers,
+            'body': body.strip(),
+            'content_id': part.get('Content-ID'),
+        }
+
+
+class SessionState:
+    """Authentication state shared by a bot and every fork() of it."""
+
+    def __init__(self):
+        self.logged_in = False
+        self.checked_at = 0.0  # time.monotonic() of the last successful login or probe
+        self.verif_token = ""
+        self.verif_token_at = 0.0  # time.monotonic() when verif_token was fetched
+        self.lock = threading.RLock()
+
 
 class CprBot:
     """Handles automated registration of CPR course participants."""
@@ -35,44 +469,123 @@ class CprBot:
     # MyRC Portal URLs
     MYRC_BASE_URL = "https://myrc.redcross.ca"
     MYRC_SIGNIN_URL = f"{MYRC_BASE_URL}/en/SignIn"
+    B2C_BASE_URL = "https://crcsb2c.b2clogin.com"
+
+    # Transport retry policy per host: retries and backoff base in seconds
+    RETRY_POLICIES = {
+        MYRC_BASE_URL: {'total': 3, 'backoff_factor': 0.5},
+        B2C_BASE_URL: {'total': 2, 'backoff_factor': 1.0},
+    }
+
+    # Registration attempts per booking step (prepare, per-participant enrollment)
+    MAX_ATTEMPTS = 4
 
-    def __init__(self, dry_run: bool = False):
+    # Seconds a successful session probe is trusted before probing again
+    SESSION_PROBE_INTERVAL = 60
+
+    # Seconds a verification token is reused before a new one is fetched
+    VERIFICATION_TOKEN_TTL = 1200
+
+    # Max concurrent requests when fetching course search pages 2..N (1 = sequential)
+    SEARCH_PAGE_WORKERS = 4
+
+    # Max participants packed into one OData $batch request
+    BATCH_MAX_PARTICIPANTS = 100
+
+    def __init__(self, dry_run: bool = False, reuse_session: bool = True,
+                 course_cache: Optional[CourseSearchCache] = None, config_cache: Optional[SecureConfigCache] = None,
+                 batch_writes: bool = True,
+                 ledger: Optional[Union[Ledger, DynamoLedger]] = None, pending_queue: Optional[PendingQueue] = None,
+                 notifier: Optional[NotificationDispatcher] = None, bookeo: Optional[BookeoClient] = None,
+                 transport: Optional[Callable[[HTTPAdapter], BaseAdapter]] = None):
         """
         Initialize the CPR Bot.
 
         Args:
             dry_run: If True, performs all steps except final registration.
                      Useful for testing the flow without creating real registrations.
+            reuse_session: If True, keep one authenticated MyRC session across
+                     participants and retries, logging in again only when a
+                     cheap probe shows the session has expired.
+            course_cache: Cache for course search records. Defaults to the
+                     module-level cache shared by every bot in the process.
+            config_cache: Cache for the course grid's SecureConfiguration.
+                     Defaults to the module-level cache shared by every bot.
+            batch_writes: If True, enroll multi-participant bookings through
+                     OData $batch requests instead of one POST per write.
+            ledger: Idempotency ledger (SQLite or DynamoDB). Participants it already records as
+                     registered for the same Bookeo itemId are skipped.
+            pending_queue: Queue that parks "No Courses Found" bookings so
+                     process_pending() can retry them once the MyRC course exists.
+            notifier: Dispatcher that sends status emails in the background.
+                     Defaults to the process-wide one (see notify.py).
+            bookeo: Client for Bookeo status updates. Defaults to the
+                     process-wide one, so all bots share its connection pool.
+            transport: Wraps each mounted adapter, e.g. Cassette.wrap to
+                     record or replay MyRC and B2C traffic (see cassette.py).
         """
         self.dry_run = dry_run
+        self.batch_writes = batch_writes
+        self.ledger = ledger
+        self.pending_queue = pending_queue
+        self.notifier = notifier if notifier is not None else default_dispatcher()
+        self.bookeo = bookeo if bookeo is not None else default_client()
+        self.reuse_session = reuse_session
+        self.transport = transport
+        self.auth = SessionState()
         self.session = requests.Session()
+        metrics.instrument(self.session)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
-        self.secure_config = ""
+        self.configure_transport()
         self.job_ids = ""
+        self.verif_token = ""
+        self.checkpoint: Dict[str, Any] = {}  # Completed registration steps, see prepare_booking()
         self.parsed_webhook = {}
         self.output_myrc_id = "N/A"
         self.course_type = ""
+        self.bookeo_response: List[str] = []
         self.cookies_path = Path("/tmp/cookies.pkl")
+        self.course_cache = course_cache if course_cache is not None else COURSE_SEARCH_CACHE
+        self.config_cache = config_cache if config_cache is not None else SECURE_CONFIG_CACHE
 
         if self.dry_run:
             print("=" * 60)
             print("🔍 DRY RUN MODE - No actual registrations will be made")
             print("=" * 60)
 
-    def send_email(self, subject: str, bookeo_response: List[str], booking_number: str) -> None:
-        """Send email notification about registration status."""
-        recipients = json.loads(os.environ.get('EMAIL_RECIPIENTS', '[]'))
-        if not recipients:
-            print("Warning: No email recipients configured")
-            return
+    def configure_transport(self, pool_maxsize: int = 10) -> None:
+        """Mount an adapter with its host's retry policy for every host in RETRY_POLICIES."""
+        for base_url, policy in self.RETRY_POLICIES.items():
+            retry = TransportRetry(
+                total=policy['total'],
+                backoff_factor=policy['backoff_factor'],
+                status_forcelist=TRANSIENT_STATUS_CODES,
+                raise_on_status=False,  # Hand the last response back for classification
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
+            self.session.mount(base_url, self.transport(adapter) if self.transport else adapter)
+        if self.transport:
+            # Redirects can leave the configured hosts; route those through the transport too
+            for prefix in ('https://', 'http://'):
+                self.session.mount(prefix, self.transport(HTTPAdapter(pool_maxsize=pool_maxsize)))
+
+    def fork(self) -> "CprBot":
+        """
+        Create a bot for another booking or participant.
 
-        email_text = f"""\
-From: {os.environ.get('EMAIL_USER')}
-To: {", ".join(recipients)}
-Subject: {subject}
+        The fork shares this bot's HTTP session, login state and course cache,
+        but has its own per-booking fields, so forks can run concurrently.
+        """
+        clone = copy.copy(self)
+        clone.checkpoint = dict(self.checkpoint)
+        return clone
 
+    @metrics.timed("email.queue")
+    def send_email(self, subject: str, bookeo_response: List[str], booking_number: str) -> None:
+        """Queue an email notification about registration status; it is sent in the background."""
+        body = f"""\
 Status Codes: {str(bookeo_response)}
 Booking Number: {booking_number}
 Myrc Course Number: {str(self.output_myrc_id)}
@@ -82,40 +595,13 @@ Course Type: {self.course_type}
 in this booking had when being entered. They are in the same order as
 the participants in bookeo.
 """
-        try:
-            server = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-            server.ehlo()
-            server.login(os.environ['EMAIL_USER'], os.environ['EMAIL_PASSWORD'])
-            server.sendmail(os.environ['EMAIL_USER'], recipients, email_text)
-            server.close()
-            print(f"Email sent successfully: {subject}")
-        except Exception as e:
-            print(f"Failed to send email: {e}")
-
-    def bookeo_put(self, response_code: str, event: Dict[str, Any]) -> requests.Response:
-        """Update Bookeo with registration status."""
-        print(f"Updating Bookeo with response: {response_code}")
-
-        headers = {'Content-Type': 'application/json'}
-        params = {
-            'secretKey': os.environ.get('BOOKEO_SECRET_KEY'),
-            'mode': 'backend',
-            'apiKey': os.environ.get('BOOKEO_API_KEY'),
-        }
-
-        event['item']['externalRef'] = f"{response_code}, myrc: {self.output_myrc_id}"
-
-        # Remove fields that shouldn't be in PUT request
-        for field in ['startTime', 'endTime', 'customer']:
-            event['item'].pop(field, None)
-        if 'participants' in event['item']:
-            event['item']['participants'].pop('details', None)
+        self.notifier.notify(subject, body)
 
-        return self.session.put(
-            f'https://api.bookeo.com/v2/bookings/{event["itemId"]}',
-            params=params,
-            data=json.dumps(event['item']),
-            headers=headers
+    @metrics.timed("bookeo.update")
+    def bookeo_put(self, response_code: str, event: Dict[str, Any]) -> Optional[requests.Response]:
+        """Update Bookeo with registration status. The event is not modified."""
+        return self.bookeo.update_booking(
+            str(event['itemId']), event['item'], f"{response_code}, myrc: {self.output_myrc_id}"
         )
 
     def _get_signin_page(self) -> requests.Response:
@@ -123,26 +609,14 @@ the participants in bookeo.
         params = {'returnUrl': '/en/'}
         return self.session.get(self.MYRC_SIGNIN_URL, params=params, allow_redirects=True)
 
-    def _extract_b2c_settings(self, html: str) -> Dict[str, str]:
-        """Extract Azure B2C settings from login page HTML."""
-        settings = {}
-
-        # Extract CSRF token
-        csrf_match = re.search(r'"csrf"\s*:\s*"([^"]+)"', html)
-        if csrf_match:
-            settings['csrf'] = csrf_match.group(1)
-
-        # Extract transaction ID (StateProperties)
-        trans_match = re.search(r'"transId"\s*:\s*"StateProperties=([^"]+)"', html)
-        if trans_match:
-            settings['state_properties'] = trans_match.group(1)
-
-        # Extract API endpoint
-        api_match = re.search(r'"api"\s*:\s*"([^"]+)"', html)
-        if api_match:
-            settings['api'] = api_match.group(1)
+    @staticmethod
+    def _extract_b2c_settings(html: str) -> Extraction:
+        """
+        Extract Azure B2C settings (csrf, state_properties, api) from login page HTML.
 
-        return settings
+        The returned dict's `missing` attribute lists the settings not found.
+        """
+        return B2C_SETTINGS.extract(html)
 
     def _submit_credentials(self, state_properties: str, csrf: str) -> requests.Response:
         """Submit login credentials to Azure B2C."""
@@ -160,7 +634,7 @@ the participants in bookeo.
             'password': os.environ.get('MYRC_PASSWORD')
         }
 
-        url = f'https://crcsb2c.b2clogin.com/{self.B2C_TENANT}/{self.B2C_POLICY}/SelfAsserted'
+        url = f'{self.B2C_BASE_URL}/{self.B2C_TENANT}/{self.B2C_POLICY}/SelfAsserted'
         return self.session.post(url, headers=headers, params=params, data=data)
 
     def _confirm_signin(self, state_properties: str, csrf: str) -> requests.Response:
@@ -170,7 +644,7 @@ the participants in bookeo.
             'tx': f'StateProperties={state_properties}',
             'p': self.B2C_POLICY,
         }
-        url = f'https://crcsb2c.b2clogin.com/{self.B2C_TENANT}/{self.B2C_POLICY}/api/CombinedSigninAndSignup/confirmed'
+        url = f'{self.B2C_BASE_URL}/{self.B2C_TENANT}/{self.B2C_POLICY}/api/CombinedSigninAndSignup/confirmed'
         return self.session.get(url, params=params)
 
     def _complete_signin(self, state: str, id_token: str) -> requests.Response:
@@ -181,15 +655,34 @@ the participants in bookeo.
         }
         return self.session.post(self.MYRC_BASE_URL + '/', data=data)
 
+    @metrics.timed("myrc.search_page")
     def _search_courses(self, verif_token: str, page: int = 1) -> requests.Response:
-        """Search for courses matching the booking."""
+        """
+        Search for courses matching the booking.
+
+        If the grid rejects the cached SecureConfiguration, a new one is
+        fetched and the search is sent again.
+        """
+        # Entity grid endpoint for course search
+        url = f'{self.MYRC_BASE_URL}/_services/entity-grid-data.json/6d6b3012-e709-4c45-a00d-df4b3befc518'
+        log.debug("Searching MyRC for date: %s (page %s)", self.parsed_webhook['course_date'], page)
+        secure_config = self._get_secure_config()
+        response = self._post_course_search(url, verif_token, secure_config, page)
+        if is_stale_config_rejection(response):
+            print("Course grid rejected the SecureConfiguration, fetching it again")
+            secure_config = self._get_secure_config(stale=secure_config)
+            response = self._post_course_search(url, self.verif_token or verif_token, secure_config, page)
+        log.debug("Course search response status: %s", response.status_code)
+        return response
+
+    def _post_course_search(self, url: str, verif_token: str, secure_config: str, page: int) -> requests.Response:
+        """POST one entity-grid search request."""
         headers = {
             'Content-Type': 'application/json; charset=UTF-8',
             'X-Requested-With': 'XMLHttpRequest',
-            '__RequestVerificationToken': verif_token,
         }
         data = json.dumps({
-            "base64SecureConfiguration": self.secure_config,
+            "base64SecureConfiguration": secure_config,
             "sortExpression": "crc_startdate ASC",
             "search": self.parsed_webhook["course_date"],
             "page": page,
@@ -201,14 +694,61 @@ the participants in bookeo.
             "timezoneOffset": 0,  # Let MyRC handle timezone (date search is by string, not timestamp)
             "customParameters": []
         })
+        return self._send_with_token('POST', url, verif_token, headers=headers, data=data)
 
-        # Entity grid endpoint for course search
-        url = f'{self.MYRC_BASE_URL}/_services/entity-grid-data.json/6d6b3012-e709-4c45-a00d-df4b3befc518'
-        print(f"DEBUG: Searching MyRC for date: {self.parsed_webhook['course_date']}")
-        response = self.session.post(url, headers=headers, data=data)
-        print(f"DEBUG: Course search response status: {response.status_code}")
-        return response
+    @staticmethod
+    def _contact_search_params(participant: Dict[str, Any]) -> Dict[str, str]:
+        """Build the OData query that finds a participant's existing contact."""
+        # OData query to search contacts by last name and email
+        # Escape apostrophes in OData strings by doubling them (e.g., O'Brien -> O''Brien)
+        last_name_escaped = participant['last_name'].replace("'", "''")
+        email_escaped = participant['email'].replace("'", "''")
+
+        return {
+            '$select': 'contactid,fullname,birthdate,adx_identity_username,address1_line1,address1_line2,address1_city,address1_stateorprovince,address1_postalcode',
+            '$filter': f"(lastname eq '{last_name_escaped}' and emailaddress1 eq '{email_escaped}' and statecode eq 0)"
+        }
 
+    @staticmethod
+    def _contact_data(participant: Dict[str, Any]) -> Dict[str, str]:
+        """Build the OData payload that creates a contact for a participant."""
+        contact_data = {
+            'firstname': participant['first_name'],
+            'lastname': participant['last_name'],
+            'emailaddress1': participant['email'],
+            'address1_line1': participant['line1'],
+            'address1_line2': participant['line2'],
+            'address1_city': participant['city'],
+            'address1_stateorprovince': participant['province'],
+            'address1_postalcode': participant['postal_code'],
+            'telephone1': participant['phone'],
+        }
+
+        # Remove empty values
+        return {k: v for k, v in contact_data.items() if v}
+
+    def _participant_data(self, contact_ref: str, participant: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Build the OData payload that adds a participant to the matched course session.
+
+        Args:
+            contact_ref: OData bind target, e.g. "/contacts(GUID)" or "$1" inside a $batch change set
+            participant: Parsed participant data
+        """
+        # Build participant data using OData binding syntax
+        participant_data = {
+            'crc_attendee@odata.bind': contact_ref,
+            'crc_coursesession@odata.bind': f'/crc_coursesessions({self.job_ids["ref_id"]})',
+            'crc_participanttype': '0',  # 0 = Participant
+            'crc_status': '171120001',  # Status code
+        }
+
+        # Add CPR level if specified
+        if participant.get('cpr_level'):
+            participant_data['crc_cprlevel'] = participant['cpr_level']
+        return participant_data
+
+    @metrics.timed("myrc.contact_search")
     def _search_contact_api(self, verif_token: str) -> Optional[Dict[str, Any]]:
         """
         Search for existing contact using new OData API (Updated Nov 2025).
@@ -219,23 +759,14 @@ the participants in bookeo.
         headers = {
             'Content-Type': 'application/json',
             'X-Requested-With': 'XMLHttpRequest',
-            '__RequestVerificationToken': verif_token,
-        }
-
-        # OData query to search contacts by last name and email
-        # Escape apostrophes in OData strings by doubling them (e.g., O'Brien -> O''Brien)
-        last_name_escaped = self.parsed_webhook['last_name'].replace("'", "''")
-        email_escaped = self.parsed_webhook['email'].replace("'", "''")
-
-        params = {
-            '$select': 'contactid,fullname,birthdate,adx_identity_username,address1_line1,address1_line2,address1_city,address1_stateorprovince,address1_postalcode',
-            '$filter': f"(lastname eq '{last_name_escaped}' and emailaddress1 eq '{email_escaped}' and statecode eq 0)"
         }
 
-        response = self.session.get(
+        response = self._send_with_token(
+            'GET',
             f'{self.MYRC_BASE_URL}/_api/contacts',
+            verif_token,
             headers=headers,
-            params=params
+            params=self._contact_search_params(self.parsed_webhook)
         )
         response.raise_for_status()
 
@@ -246,6 +777,7 @@ the participants in bookeo.
             return contacts[0]  # Return first matching contact
         return None
 
+    @metrics.timed("myrc.contact_create")
     def _create_contact_api(self, verif_token: str) -> Optional[str]:
         """
         Create a new contact using OData API (Updated Nov 2025).
@@ -256,31 +788,19 @@ the participants in bookeo.
         headers = {
             'Content-Type': 'application/json',
             'X-Requested-With': 'XMLHttpRequest',
-            '__RequestVerificationToken': verif_token,
-        }
-
-        # Build contact data
-        contact_data = {
-            'firstname': self.parsed_webhook['first_name'],
-            'lastname': self.parsed_webhook['last_name'],
-            'emailaddress1': self.parsed_webhook['email'],
-            'address1_line1': self.parsed_webhook['line1'],
-            'address1_line2': self.parsed_webhook['line2'],
-            'address1_city': self.parsed_webhook['city'],
-            'address1_stateorprovince': self.parsed_webhook['province'],
-            'address1_postalcode': self.parsed_webhook['postal_code'],
-            'telephone1': self.parsed_webhook['phone'],
         }
 
-        # Remove empty values
-        contact_data = {k: v for k, v in contact_data.items() if v}
-
-        response = self.session.post(
+        response = self._send_with_token(
+            'POST',
             f'{self.MYRC_BASE_URL}/_api/contacts',
+            verif_token,
             headers=headers,
-            json=contact_data
+            json=self._contact_data(self.parsed_webhook)
         )
 
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            response.raise_for_status()  # Transient - let the retry loop handle it
+
         if response.status_code in (200, 201, 204):
             # Contact ID is returned in the entityid header
             contact_id = response.headers.get('entityid')
@@ -289,6 +809,7 @@ the participants in bookeo.
         print(f"Failed to create contact: {response.status_code} - {response.text}")
         return None
 
+    @metrics.timed("myrc.participant_add")
     def _add_participant_api(self, verif_token: str, contact_id: str) -> bool:
         """
         Add participant to course session using OData API (Updated Nov 2025).
@@ -303,27 +824,19 @@ the participants in bookeo.
         headers = {
             'Content-Type': 'application/json',
             'X-Requested-With': 'XMLHttpRequest',
-            '__RequestVerificationToken': verif_token,
-        }
-
-        # Build participant data using OData binding syntax
-        participant_data = {
-            'crc_attendee@odata.bind': f'/contacts({contact_id})',
-            'crc_coursesession@odata.bind': f'/crc_coursesessions({self.job_ids["ref_id"]})',
-            'crc_participanttype': '0',  # 0 = Participant
-            'crc_status': '171120001',  # Status code
         }
 
-        # Add CPR level if specified
-        if self.parsed_webhook.get('cpr_level'):
-            participant_data['crc_cprlevel'] = self.parsed_webhook['cpr_level']
-
-        response = self.session.post(
+        response = self._send_with_token(
+            'POST',
             f'{self.MYRC_BASE_URL}/_api/crc_courseparticipants',
+            verif_token,
             headers=headers,
-            json=participant_data
+            json=self._participant_data(f'/contacts({contact_id})', self.parsed_webhook)
         )
 
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            response.raise_for_status()  # Transient - let the retry loop handle it
+
         if response.status_code in (200, 201, 204):
             return True
 
@@ -335,79 +848,86 @@ the participants in bookeo.
         print(f"Failed to add participant: {response.status_code} - {response.text}")
         return False
 
-    def parse_and_find_ids(self, json_response_arr: str) -> Optional[Dict[str, str]]:
-        """Parse course search results and find matching course."""
-        self.output_myrc_id = "N/A"
+    def _get_course_index(self, verif_token: str) -> CourseIndex:
+        """
+        Return the indexed course search results for the booking date.
 
-        try:
-            jsonified = json.loads(json_response_arr)
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse course search results: {e}")
-            return None
+        Served from the per-date cache when possible; otherwise every page is
+        decoded and indexed as it arrives, then the index is cached.
+        """
+        course_date = self.parsed_webhook["course_date"]
+        with self.course_cache.fill_lock(course_date):
+            index = self.course_cache.get(course_date)
+            if index is not None:
+                log.debug("Using cached course search for %s (%d records)", course_date, len(index))
+                return index
+
+            index = CourseIndex()
+            for page_records in self._iter_course_pages(verif_token):
+                index.extend(page_records)
+
+            self.course_cache.put(course_date, index)
+            return index
+
+    def _iter_course_pages(self, verif_token: str) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the records of each course search page in page order."""
+        first_page = self._fetch_course_page(verif_token, 1)
+        num_pages = first_page.get("PageCount") or 1
+        yield first_page.get("Records", [])
+
+        # Page 1 tells us how many pages there are; fetch the rest in parallel
+        remaining = range(2, num_pages + 1)
+        workers = min(self.SEARCH_PAGE_WORKERS, len(remaining))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Each page runs in a copy of this context so its requests count toward the open spans
+                contexts = [contextvars.copy_context() for _ in remaining]
+                fetch = lambda page, context: context.run(self._fetch_course_page, verif_token, page)
+                # executor.map yields in page order as soon as each page is ready
+                for page_data in executor.map(fetch, remaining, contexts):
+                    yield page_data.get("Records", [])
+        else:
+            for page in remaining:
+                yield self._fetch_course_page(verif_token, page).get("Records", [])
+
+    def _fetch_course_page(self, verif_token: str, page: int) -> Dict[str, Any]:
+        """Fetch and decode one page of course search results."""
+        response = self._search_courses(verif_token, page)
+        response.raise_for_status()
+        return response.json()
+
+    def parse_and_find_ids(self, records: Union[CourseIndex, Iterable[Dict[str, Any]]]) -> Optional[Dict[str, str]]:
+        """Find the course matching the booking among course search records (or a prebuilt index)."""
+        self.output_myrc_id = "N/A"
+        index = records if isinstance(records, CourseIndex) else CourseIndex(records)
 
-        exact_matches = []
-        substring_matches = []
         search_type = self.parsed_webhook["course_type"]
         search_location = self.parsed_webhook["course_location"]
 
-        print(f"DEBUG: Looking for courses matching type='{search_type}', location='{search_location}'")
-
-        total_records = 0
-        for container in jsonified:
-            records = container.get("Records", [])
-            total_records += len(records)
-            for record in records:
-                exact_type_match = False
-                substring_type_match = False
-                matched_location = False
-                course_id = "0"
-                ref_id = record.get("Id", "")
-                course_type_found = ""
-                location_found = ""
-
-                for attribute in record.get("Attributes", []):
-                    attr_name = attribute.get("Name", "")
-                    attr_value = attribute.get("Value", {})
-
-                    if attr_name == "crc_coursetype":
-                        if isinstance(attr_value, dict):
-                            course_type_found = attr_value.get("Name", "")
-                            # Check for exact match (case-insensitive)
-                            if search_type and search_type.lower() == course_type_found.lower():
-                                exact_type_match = True
-                                substring_type_match = True
-                            # Check for substring match (for backwards compatibility)
-                            elif search_type and search_type.lower() in course_type_found.lower():
-                                substring_type_match = True
-                    elif attr_name == "crc_facility":
-                        if isinstance(attr_value, dict):
-                            location_found = attr_value.get("Name", "")
-                            # Use substring matching for location
-                            if search_location and search_location.lower() in location_found.lower():
-                                matched_location = True
-                    elif attr_name == "crc_name":
-                        course_id = attr_value
-
-                match_info = "exact" if exact_type_match else ("substring" if substring_type_match else "none")
-                print(f"DEBUG: Course {course_id} - Type: '{course_type_found}' (match={match_info}), Location: '{location_found}' (match={matched_location})")
-
-                if matched_location:
-                    if exact_type_match:
-                        exact_matches.append({"course_id": course_id, "ref_id": ref_id})
-                    elif substring_type_match:
-                        substring_matches.append({"course_id": course_id, "ref_id": ref_id})
+        exact_matches, substring_matches = index.find(search_type, search_location)
 
         # Prefer exact matches over substring matches
         # This prevents "Basic Life Support" from matching "Basic Life Support Recertification"
         matched_ids = exact_matches if exact_matches else substring_matches
         match_type = "exact" if exact_matches else "substring"
-        print(f"DEBUG: Total records: {total_records}, Exact matches: {len(exact_matches)}, Substring matches: {len(substring_matches)}, Using: {match_type}")
+        log.info("Course match for type='%s', location='%s': %d records, %d exact, %d substring, using %s",
+                 search_type, search_location, len(index), len(exact_matches), len(substring_matches), match_type)
 
         if len(matched_ids) == 1:
             self.output_myrc_id = matched_ids[0]["course_id"]
-            return matched_ids[0]
+            return {"course_id": matched_ids[0]["course_id"], "ref_id": matched_ids[0]["ref_id"]}
         if len(matched_ids) == 0:
+            # Near misses are only logged at INFO; skip scoring them otherwise
+            if not log.isEnabledFor(logging.INFO):
+                return None
+            for score, course_type, location, count in index.near_misses(search_type, search_location):
+                log.info("  Near miss (%.2f): type='%s', location='%s' (%d courses)", score, course_type, location, count)
             return None
+
+        for course in matched_ids[:MATCH_DIAGNOSTICS_LIMIT]:
+            log.info("  Candidate %s: type='%s', location='%s'", course["course_id"], course["course_type"], course["location"])
+        if len(matched_ids) > MATCH_DIAGNOSTICS_LIMIT:
+            log.info("  ... and %d more", len(matched_ids) - MATCH_DIAGNOSTICS_LIMIT)
         return "multiple"
 
     def _load_cookies(self) -> bool:
@@ -429,28 +949,78 @@ the participants in bookeo.
         except Exception as e:
             print(f"Failed to save cookies: {e}")
 
+    @metrics.timed("myrc.session_probe")
+    def _probe_session(self) -> bool:
+        """Check with one small OData read whether the MyRC session is still authenticated."""
+        if not self.auth.logged_in:
+            return False
+
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        params = {'$select': 'contactid', '$top': '1'}
+        response = self.session.get(
+            f'{self.MYRC_BASE_URL}/_api/contacts',
+            headers=headers,
+            params=params,
+            allow_redirects=False  # Expired sessions redirect to SignIn
+        )
+        return response.status_code == 200
+
+    def invalidate_session(self) -> None:
+        """Force the next ensure_logged_in() call to re-check the session."""
+        self.auth.checked_at = 0.0
+
+    def ensure_logged_in(self) -> bool:
+        """
+        Make sure the bot holds an authenticated MyRC session.
+
+        With reuse_session enabled, a session that was validated within
+        SESSION_PROBE_INTERVAL seconds is trusted as-is; otherwise it is probed
+        and the full B2C login only runs when the probe fails.
+
+        Returns:
+            True if the session is usable, False if login failed
+        """
+        # Forks share the session, so only one of them logs in at a time
+        with self.auth.lock:
+            if self.reuse_session and self.auth.logged_in:
+                if time.monotonic() - self.auth.checked_at < self.SESSION_PROBE_INTERVAL:
+                    return True
+                try:
+                    if self._probe_session():
+                        print("Reusing existing MyRC session")
+                        self.auth.checked_at = time.monotonic()
+                        return True
+                except requests.exceptions.RequestException as e:
+                    print(f"Session probe failed: {e}")
+                print("MyRC session expired, logging in again")
+
+            # Clear any stale cookies and start fresh
+            # Old cookies can interfere with the B2C login flow
+            self.session.cookies.clear()
+            self.auth.logged_in = False
+            self.auth.verif_token = ""  # Tokens are bound to the old session
+            self.invalidate_session()
+
+            if not self.login():
+                return False
+            self.auth.checked_at = time.monotonic()
+            return True
+
+    @metrics.timed("login")
     def login(self) -> bool:
         """Perform full two-step login flow to MyRC portal (Updated Nov 2025)."""
-        import time
         print("Starting login flow...")
 
         # Step 1: Get sign-in page (follows redirect to B2C)
-        response = self._get_signin_page()
+        with metrics.span("login.step1_signin_page"):
+            response = self._get_signin_page()
         response.raise_for_status()
 
         # Extract B2C settings from the login page
         settings = self._extract_b2c_settings(response.text)
 
         if 'csrf' not in settings or 'state_properties' not in settings:
-            state_match = re.search(r'StateProperties=([^"&\s]+)', response.text)
-            csrf_match = re.search(r'"csrf"\s*:\s*"([^"]+)"', response.text)
-            if state_match:
-                settings['state_properties'] = state_match.group(1)
-            if csrf_match:
-                settings['csrf'] = csrf_match.group(1)
-
-        if 'csrf' not in settings or 'state_properties' not in settings:
-            print("Failed to extract B2C settings from login page")
+            print(f"Failed to extract B2C settings from login page (missing: {', '.join(settings.missing)})")
             return False
 
         csrf = settings['csrf']
@@ -472,8 +1042,9 @@ the participants in bookeo.
             'signInName': os.environ.get('MYRC_EMAIL'),
             'password': os.environ.get('MYRC_PASSWORD'),
         }
-        url = f'https://crcsb2c.b2clogin.com/{self.B2C_TENANT}/{self.B2C_POLICY}/SelfAsserted'
-        response = self.session.post(url, headers=headers, params=params, data=data)
+        url = f'{self.B2C_BASE_URL}/{self.B2C_TENANT}/{self.B2C_POLICY}/SelfAsserted'
+        with metrics.span("login.step2_submit_email"):
+            response = self.session.post(url, headers=headers, params=params, data=data)
         response.raise_for_status()
         print(f"First credential submit: {response.text}")
 
@@ -484,15 +1055,15 @@ the participants in bookeo.
             'tx': f'StateProperties={state_properties}',
             'p': self.B2C_POLICY,
         }
-        url = f'https://crcsb2c.b2clogin.com/{self.B2C_TENANT}/{self.B2C_POLICY}/api/CombinedSigninAndSignup/confirmed'
-        response = self.session.get(url, params=params)
+        url = f'{self.B2C_BASE_URL}/{self.B2C_TENANT}/{self.B2C_POLICY}/api/CombinedSigninAndSignup/confirmed'
+        with metrics.span("login.step3_confirm"):
+            response = self.session.get(url, params=params)
 
         # Extract new CSRF and state for step 2
-        new_csrf = re.search(r'"csrf"\s*:\s*"([^"]+)"', response.text)
-        new_trans = re.search(r'"transId"\s*:\s*"StateProperties=([^"]+)"', response.text)
-        if new_csrf and new_trans:
-            csrf = new_csrf.group(1)
-            state_properties = new_trans.group(1)
+        new_settings = self._extract_b2c_settings(response.text)
+        if 'csrf' in new_settings and 'state_properties' in new_settings:
+            csrf = new_settings['csrf']
+            state_properties = new_settings['state_properties']
             print("Got new CSRF for step 2")
 
         # Step 4: Submit password again (second step of two-step flow)
@@ -509,8 +1080,9 @@ the participants in bookeo.
             'request_type': 'RESPONSE',
             'password': os.environ.get('MYRC_PASSWORD'),
         }
-        url = f'https://crcsb2c.b2clogin.com/{self.B2C_TENANT}/{self.B2C_POLICY}/SelfAsserted'
-        response = self.session.post(url, headers=headers, params=params, data=data)
+        url = f'{self.B2C_BASE_URL}/{self.B2C_TENANT}/{self.B2C_POLICY}/SelfAsserted'
+        with metrics.span("login.step4_submit_password"):
+            response = self.session.post(url, headers=headers, params=params, data=data)
         response.raise_for_status()
         print(f"Second password submit: {response.text}")
 
@@ -523,150 +1095,287 @@ the participants in bookeo.
             'tx': f'StateProperties={state_properties}',
             'p': self.B2C_POLICY,
         }
-        url = f'https://crcsb2c.b2clogin.com/{self.B2C_TENANT}/{self.B2C_POLICY}/api/CombinedSigninAndSignup/confirmed'
-        response = self.session.get(url, params=params, allow_redirects=True)
+        url = f'{self.B2C_BASE_URL}/{self.B2C_TENANT}/{self.B2C_POLICY}/api/CombinedSigninAndSignup/confirmed'
+        with metrics.span("login.step5_tokens"):
+            response = self.session.get(url, params=params, allow_redirects=True)
 
         # Extract state and id_token
-        state_match = re.search(r"name=['\"]state['\"][^>]*value=['\"]([^'\"]+)['\"]", response.text)
-        token_match = re.search(r"name=['\"]id_token['\"][^>]*value=['\"]([^'\"]+)['\"]", response.text)
-        if not state_match:
-            state_match = re.search(r"id=['\"]state['\"] value=['\"]([^'\"]+)['\"]", response.text)
-        if not token_match:
-            token_match = re.search(r"id=['\"]id_token['\"] value=['\"]([^'\"]+)['\"]", response.text)
-
-        if not state_match or not token_match:
-            print("Failed to extract state/token from confirmation response")
+        form = self._extract_signin_tokens(response.text)
+        if form.missing:
+            print(f"Failed to extract state/token from confirmation response (missing: {', '.join(form.missing)})")
             return False
 
-        state = state_match.group(1)
-        id_token = token_match.group(1)
+        state, id_token = form['state'], form['id_token']
         print("Extracted state and id_token")
 
         # Step 6: Complete sign-in to MyRC
-        response = self._complete_signin(state, id_token)
+        with metrics.span("login.step6_complete_signin"):
+            response = self._complete_signin(state, id_token)
         response.raise_for_status()
         print(f"Logged into MyRC: {response.url}")
 
-        # Step 7: Get SecureConfiguration from CourseManagement page
-        response = self.session.get(f'{self.MYRC_BASE_URL}/en/CourseManagement/')
+        # The grid's SecureConfiguration is cached separately (see _get_secure_config),
+        # so logging in no longer loads the CourseManagement page
+        self.auth.logged_in = True
+        print("Login successful!")
+        self._save_cookies()
+        return True
+
+    @staticmethod
+    def _extract_signin_tokens(html: str) -> Extraction:
+        """
+        Extract state and id_token from the B2C form that posts back to MyRC.
+
+        The returned dict's `missing` attribute lists the fields not found.
+        """
+        return SIGNIN_FORM.extract(html)
+
+    @staticmethod
+    def _extract_secure_config(html: str) -> str:
+        """
+        Extract the grid's Base64SecureConfiguration from the CourseManagement page.
 
+        Raises:
+            ValueError: If the page has no data-view-layouts attribute, it can't
+                        be decoded, or its first layout has no configuration
+        """
         # Extract data-view-layouts attribute (base64 encoded JSON)
-        # Try both single and double quote patterns
-        layouts_match = re.search(r"data-view-layouts=['\"]([^'\"]+)['\"]", response.text)
-        if not layouts_match:
-            print("Failed to find data-view-layouts attribute in CourseManagement page")
-            return False
+        page = COURSE_LAYOUTS.extract(html)
+        if page.missing:
+            raise ValueError("Failed to find data-view-layouts attribute in CourseManagement page")
 
         try:
             # Decode the base64 outer layer
-            layouts_b64 = layouts_match.group(1)
+            layouts_b64 = page['layouts']
             layouts_json = base64.b64decode(layouts_b64).decode('utf-8')
             layouts = json.loads(layouts_json)
-
-            # Get Base64SecureConfiguration from the first layout
-            if layouts and 'Base64SecureConfiguration' in layouts[0]:
-                self.secure_config = layouts[0]['Base64SecureConfiguration']
-                print(f"Login successful! Got SecureConfiguration (length: {len(self.secure_config)})")
-                self._save_cookies()
-                return True
-            else:
-                print("No Base64SecureConfiguration found in layouts")
-                return False
         except Exception as e:
-            print(f"Failed to parse data-view-layouts: {e}")
-            return False
+            raise ValueError(f"Failed to parse data-view-layouts: {e}")
 
-    def register_participant(self) -> str:
-        """
-        Main registration flow for a single participant.
-        Updated Nov 2025 to use new OData REST API instead of ASP.NET forms.
+        # Get Base64SecureConfiguration from the first layout
+        if layouts and isinstance(layouts, list) and 'Base64SecureConfiguration' in layouts[0]:
+            return layouts[0]['Base64SecureConfiguration']
+        raise ValueError("No Base64SecureConfiguration found in layouts")
+
+    @metrics.timed("myrc.secure_config")
+    def _fetch_secure_config(self) -> str:
         """
-        # Clear any stale cookies and start fresh
-        # Old cookies can interfere with the B2C login flow
-        self.session.cookies.clear()
+        Load the CourseManagement page and extract the grid's SecureConfiguration.
 
-        # Always perform fresh login for reliability
-        if not self.login():
-            return "Login Failed"
+        Raises:
+            SessionExpired: If the session expired and the page redirected to sign-in
+            requests.exceptions.HTTPError: If the page fails to load or holds no configuration
+        """
+        response = self.session.get(f'{self.MYRC_BASE_URL}/en/CourseManagement/')
+        response.raise_for_status()
+        try:
+            return self._extract_secure_config(response.text)
+        except ValueError as e:
+            if response.url.startswith((self.MYRC_SIGNIN_URL, self.B2C_BASE_URL)):
+                raise SessionExpired(f"CourseManagement redirected to sign-in: {e}", response=response)
+            raise requests.exceptions.HTTPError(str(e), response=response)
 
-        if self.dry_run:
-            print("✅ Step 1/5: Login successful")
+    def _get_secure_config(self, stale: Optional[str] = None) -> str:
+        """
+        Return the course grid's SecureConfiguration, fetching it only when needed.
 
-        # Get verification token
+        Args:
+            stale: A configuration the grid just rejected. If it is still the
+                   cached one, a new one is fetched; if another caller already
+                   replaced it, the replacement is returned.
+        """
+        cache = self.config_cache
+        with cache.lock:
+            config = cache.get()
+            if config and config != stale:
+                return config
+            config = self._fetch_secure_config()
+            cache.put(config)
+            print(f"Got SecureConfiguration (length: {len(config)})")
+            return config
+
+    @metrics.timed("myrc.verification_token")
+    def _fetch_verification_token(self) -> Optional[str]:
+        """Fetch the __RequestVerificationToken required by OData and grid calls."""
         response = self.session.get(f'{self.MYRC_BASE_URL}/_layout/tokenhtml')
-        token_match = re.search(r'value="([^"]+)"', response.text)
-        if not token_match:
-            return "Failed to get verification token"
-        verif_token = token_match.group(1)
+        return VERIFICATION_TOKEN.extract(response.text).get('token')
 
-        if self.dry_run:
-            print(f"✅ Step 2/5: Got verification token: {verif_token[:20]}...")
+    def _verification_token(self, rejected: Optional[str] = None) -> Optional[str]:
+        """
+        Return the session's verification token, fetching one only when needed.
 
-        # Search for the course
-        response = self._search_courses(verif_token, 1)
-        json_response_arr = "[" + response.text
+        The token is cached on the shared session state for VERIFICATION_TOKEN_TTL
+        seconds, so forks and later bookings reuse it.
 
-        page_match = re.search(r'"PageCount":(\d+)', response.text)
-        num_pages = int(page_match.group(1)) if page_match else 1
+        Args:
+            rejected: A token MyRC just refused. If it is still the cached one,
+                      a new token is fetched; if another fork already replaced
+                      it, the replacement is returned.
+        """
+        with self.auth.lock:
+            auth = self.auth
+            fresh = time.monotonic() - auth.verif_token_at < self.VERIFICATION_TOKEN_TTL
+            if auth.verif_token and fresh and auth.verif_token != rejected:
+                return auth.verif_token
+            token = self._fetch_verification_token()
+            auth.verif_token = token or ""
+            auth.verif_token_at = time.monotonic()
+            return token
+
+    def _send_with_token(self, method: str, url: str, verif_token: str, **kwargs: Any) -> requests.Response:
+        """
+        Send a MyRC request with a verification token.
 
-        for page in range(2, num_pages + 1):
-            response = self._search_courses(verif_token, page)
-            json_response_arr += "," + response.text
-        json_response_arr += "]"
+        If MyRC rejects the token, a new one is fetched and the request is
+        replayed once with it. A rejected request wasn't applied, so replaying
+        a POST is safe.
+        """
+        headers = kwargs.pop('headers', {})
+        response = self.session.request(method, url, headers={**headers, '__RequestVerificationToken': verif_token}, **kwargs)
+        if not is_antiforgery_rejection(response):
+            return response
+
+        print("Verification token rejected, fetching a new one")
+        token = self._verification_token(rejected=verif_token)
+        if not token:
+            return response
+        self.verif_token = token
+        if 'verif_token' in self.checkpoint:
+            self.checkpoint['verif_token'] = token
+        return self.session.request(method, url, headers={**headers, '__RequestVerificationToken': token}, **kwargs)
+
+    def search_course_date(self, course_date: str, refresh: bool = False) -> Optional[CourseIndex]:
+        """
+        Return the indexed course search for a date, logging in if needed.
 
-        response.raise_for_status()
+        Args:
+            course_date: Date to search (YYYY-MM-DD)
+            refresh: Drop any cached result first so the grid is searched again
 
-        # Find matching course
-        self.job_ids = self.parse_and_find_ids(json_response_arr)
-        if self.job_ids is None:
-            if self.dry_run:
-                print("❌ Step 3/5: No matching courses found")
-                print(f"   Searched for: {self.parsed_webhook.get('course_date')} | {self.parsed_webhook.get('course_location')} | {self.parsed_webhook.get('course_type')}")
-            return "No Courses Found"
-        if self.job_ids == "multiple":
-            if self.dry_run:
-                print("⚠️ Step 3/5: Multiple matching courses found - manual review needed")
-            return "Multiple Courses Found"
+        Returns:
+            The course index, or None if login or the verification token failed
+        """
+        if refresh:
+            self.course_cache.invalidate(course_date)
+        if not self.ensure_logged_in():
+            return None
+        verif_token = self._verification_token()
+        if not verif_token:
+            return None
+        self.parsed_webhook = {'course_date': course_date}
+        return self._get_course_index(verif_token)
 
-        if self.dry_run:
-            print(f"✅ Step 3/5: Found matching course")
-            print(f"   MyRC Course ID: {self.output_myrc_id}")
-            print(f"   Reference ID: {self.job_ids.get('ref_id', 'N/A')}")
+    def register_participant(self) -> str:
+        """
+        Main registration flow for a single participant.
+        Updated Nov 2025 to use new OData REST API instead of ASP.NET forms.
+        """
+        self.checkpoint = {}
+        status = self.prepare_booking()
+        if status:
+            return status
+        return self.enroll_participant()
+
+    def prepare_booking(self) -> Optional[str]:
+        """
+        Resolve the inputs shared by every participant in a booking.
 
-        # Search for existing contact using new OData API
-        contact = self._search_contact_api(verif_token)
-        contact_id = None
+        Logs in (or reuses the session), fetches the verification token and
+        finds the course session for the booking's type, location and date.
+        Each result is recorded in self.checkpoint, so a retry resumes from
+        the step that failed instead of starting over.
+
+        Returns:
+            None if participants can now be enrolled, otherwise a status code
+        """
+        checkpoint = self.checkpoint
+
+        # Reuse the authenticated session when it is still valid
+        if 'session' not in checkpoint:
+            if not self.ensure_logged_in():
+                return "Login Failed"
+            checkpoint['session'] = True
 
-        if contact:
-            contact_id = contact.get('contactid')
             if self.dry_run:
-                print(f"✅ Step 4/5: Found existing contact")
-                print(f"   Contact ID: {contact_id}")
-                print(f"   Name: {contact.get('fullname', 'N/A')}")
-        else:
+                print("✅ Step 1/5: Login successful")
+
+        # Get verification token (cached per session)
+        if 'verif_token' not in checkpoint:
+            verif_token = self._verification_token()
+            if not verif_token:
+                return "Failed to get verification token"
+            checkpoint['verif_token'] = verif_token
+
             if self.dry_run:
-                print(f"✅ Step 4/5: No existing contact found")
-                print(f"   Would create: {self.parsed_webhook.get('first_name')} {self.parsed_webhook.get('last_name')}")
-                print(f"   Email: {self.parsed_webhook.get('email')}")
+                print(f"✅ Step 2/5: Got verification token: {checkpoint['verif_token'][:20]}...")
+        self.verif_token = checkpoint['verif_token']
+
+        # Search for the course (indexed and cached per date)
+        if 'job_ids' not in checkpoint:
+            job_ids = self.parse_and_find_ids(self._get_course_index(self.verif_token))
+            if job_ids is None:
+                if self.dry_run:
+                    print("❌ Step 3/5: No matching courses found")
+                    print(f"   Searched for: {self.parsed_webhook.get('course_date')} | {self.parsed_webhook.get('course_location')} | {self.parsed_webhook.get('course_type')}")
+                return "No Courses Found"
+            if job_ids == "multiple":
+                if self.dry_run:
+                    print("⚠️ Step 3/5: Multiple matching courses found - manual review needed")
+                return "Multiple Courses Found"
+            checkpoint['job_ids'] = job_ids
 
-            # In dry run, don't actually create the contact
             if self.dry_run:
-                print("=" * 60)
-                print("🔍 DRY RUN COMPLETE - All steps passed!")
-                print("=" * 60)
-                print("   ✅ Login: Success")
-                print(f"   ✅ Course Found: {self.output_myrc_id}")
-                print("   ✅ Contact: Would create new")
-                print("   ⏸️ Registration: SKIPPED (dry run)")
-                print("")
-                print("To perform actual registration, run without dry_run=True")
-                return "Dry Run Success"
-
-            # Create new contact
-            contact_id = self._create_contact_api(verif_token)
-            if not contact_id:
-                return "Failed to Create Contact"
-            print(f"Created new contact: {contact_id}")
+                print(f"✅ Step 3/5: Found matching course")
+                print(f"   MyRC Course ID: {job_ids['course_id']}")
+                print(f"   Reference ID: {job_ids.get('ref_id', 'N/A')}")
+        self.job_ids = checkpoint['job_ids']
+        self.output_myrc_id = self.job_ids['course_id']
+        return None
+
+    def enroll_participant(self) -> str:
+        """
+        Register the current participant into the course found by prepare_booking().
+
+        The contact ID is recorded in self.checkpoint, so a retry after a
+        failed participant add doesn't look the contact up again.
+        """
+        contact_id = self.checkpoint.get('contact_id')
+
+        if not contact_id:
+            # Search for existing contact using new OData API
+            contact = self._search_contact_api(self.verif_token)
+
+            if contact:
+                contact_id = contact.get('contactid')
+                if self.dry_run:
+                    print(f"✅ Step 4/5: Found existing contact")
+                    print(f"   Contact ID: {contact_id}")
+                    print(f"   Name: {contact.get('fullname', 'N/A')}")
+            else:
+                if self.dry_run:
+                    print(f"✅ Step 4/5: No existing contact found")
+                    print(f"   Would create: {self.parsed_webhook.get('first_name')} {self.parsed_webhook.get('last_name')}")
+                    print(f"   Email: {self.parsed_webhook.get('email')}")
+
+                # In dry run, don't actually create the contact
+                if self.dry_run:
+                    print("=" * 60)
+                    print("🔍 DRY RUN COMPLETE - All steps passed!")
+                    print("=" * 60)
+                    print("   ✅ Login: Success")
+                    print(f"   ✅ Course Found: {self.output_myrc_id}")
+                    print("   ✅ Contact: Would create new")
+                    print("   ⏸️ Registration: SKIPPED (dry run)")
+                    print("")
+                    print("To perform actual registration, run without dry_run=True")
+                    return "Dry Run Success"
+
+                # Create new contact
+                contact_id = self._create_contact_api(self.verif_token)
+                if not contact_id:
+                    return "Failed to Create Contact"
+                print(f"Created new contact: {contact_id}")
+            self.checkpoint['contact_id'] = contact_id
 
         # In dry run with existing contact, stop here
         if self.dry_run:
@@ -682,20 +1391,190 @@ the participants in bookeo.
             return "Dry Run Success"
 
         # Add participant to course session
-        success = self._add_participant_api(verif_token, contact_id)
+        success = self._add_participant_api(self.verif_token, contact_id)
         if success:
             print(f"Successfully registered participant to course {self.output_myrc_id}")
             return "Success"
         else:
             return "Failed to Add Participant"
 
-    def run(self, event: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a Bookeo webhook event."""
+    def enroll_participants_batch(self, participants: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Enroll participants into the prepared course with OData $batch requests.
+
+        The first batch looks up every participant's contact. The second holds
+        one change set per participant that creates the contact when needed and
+        binds the course participant to it by Content-ID, so a booking costs
+        two round trips per BATCH_MAX_PARTICIPANTS participants.
+
+        Returns:
+            Status code per participant, or None for participants the batch
+            couldn't settle and that should go through enroll_participant()
+        """
+        statuses: List[Optional[str]] = []
+        for start in range(0, len(participants), self.BATCH_MAX_PARTICIPANTS):
+            chunk = participants[start:start + self.BATCH_MAX_PARTICIPANTS]
+            statuses += self._enroll_batch_chunk(chunk)
+        return statuses
+
+    def _enroll_batch_chunk(self, participants: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Look up and enroll one chunk of participants in two $batch round trips."""
+        lookup = ODataBatch(f'{self.MYRC_BASE_URL}/_api')
+        for participant in participants:
+            lookup.add_request('GET', '/contacts', params=self._contact_search_params(participant))
+
+        results = self._send_batch(lookup)
+        if results is None or len(results) != len(participants):
+            return [None] * len(participants)
+
+        writes = ODataBatch(f'{self.MYRC_BASE_URL}/_api')
+        plans = []  # (participant index, created contact?, content IDs)
+        for i, (participant, result) in enumerate(zip(participants, results)):
+            response = result[0]
+            if response['status'] != 200:
+                print(f"Batch contact lookup failed: {response['status']} - {response['body']}")
+                continue
+
+            try:
+                contacts = json.loads(response['body'] or '{}').get('value', [])
+            except ValueError:
+                # e.g. the sign-in page; the single path re-checks the session
+                print(f"Batch contact lookup returned no JSON: {response['body'][:200]}")
+                continue
+            if contacts:
+                contact_ref = f"/contacts({contacts[0]['contactid']})"
+                operations = [('POST', '/crc_courseparticipants', self._participant_data(contact_ref, participant))]
+            else:
+                contact_ref = f"${writes.next_content_id}"
+                operations = [
+                    ('POST', '/contacts', self._contact_data(participant)),
+                    ('POST', '/crc_courseparticipants', self._participant_data(contact_ref, participant)),
+                ]
+            plans.append((i, not contacts, writes.add_changeset(operations)))
+
+        statuses: List[Optional[str]] = [None] * len(participants)
+        if not plans:
+            return statuses
+
+        results = self._send_batch(writes)
+        if results is None:
+            return statuses
+
+        # Portals that stop at the first failed change set return fewer parts;
+        # the rest fall back to single requests
+        for (i, created_contact, content_ids), result in zip(plans, results):
+            failed = next((r for r in result if r['status'] >= 400), None)
+            if failed is None:
+                print(f"Successfully registered participant to course {self.output_myrc_id}")
+                statuses[i] = "Success"
+            elif 'already registered' in failed['body'].lower():
+                print("Participant already registered in this course")
+                statuses[i] = "Success"  # Consider this a success
+            elif failed['status'] in TRANSIENT_STATUS_CODES:
+                # Change sets are atomic, so nothing was written; the single path retries it
+                print(f"Batch enrollment got {failed['status']}, retrying participant with single requests")
+            elif created_contact and failed['content_id'] != content_ids[-1]:
+                print(f"Failed to create contact: {failed['status']} - {failed['body']}")
+                statuses[i] = "Failed to Create Contact"
+            else:
+                print(f"Failed to add participant: {failed['status']} - {failed['body']}")
+                statuses[i] = "Failed to Add Participant"
+        return statuses
+
+    @metrics.timed("myrc.batch")
+    def _send_batch(self, batch: ODataBatch) -> Optional[List[List[Dict[str, Any]]]]:
+        """
+        POST a $batch request; returns parsed parts, or None if the portal rejected it.
+
+        Raises:
+            SessionExpired: If the request was redirected to the sign-in page
+        """
+        headers = {
+            'Content-Type': f'multipart/mixed; boundary={batch.boundary}',
+            'Accept': 'application/json',
+            'OData-MaxVersion': '4.0',
+            'OData-Version': '4.0',
+            'Prefer': 'odata.continue-on-error',
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+        response = self._send_with_token(
+            'POST',
+            f'{self.MYRC_BASE_URL}/_api/$batch',
+            self.verif_token,
+            headers=headers,
+            data=batch.body().encode('utf-8')
+        )
+        if response.status_code != 200:
+            print(f"Batch request rejected: {response.status_code} - {response.text[:500]}")
+            return None
+        content_type = response.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/mixed'):
+            if response.url.startswith((self.MYRC_SIGNIN_URL, self.B2C_BASE_URL)):
+                raise SessionExpired("$batch redirected to sign-in", response=response)
+            print(f"Batch response is not multipart ({content_type or 'no Content-Type'}): {response.text[:500]}")
+            return None
+        return ODataBatch.parse_response(content_type, response.content)
+
+    def _forget_session(self) -> None:
+        """Make the next prepare_booking() re-check the session and fetch a token for it."""
+        self.invalidate_session()
+        self.checkpoint.pop('session', None)
+        self.checkpoint.pop('verif_token', None)
+        self.auth.verif_token = ""
+
+    def _retry_after_failure(self, attempt: int, error: requests.exceptions.RequestException) -> bool:
+        """
+        Decide whether a failed attempt should be retried, backing off if so.
+
+        Returns:
+            True if the caller should make another attempt
+        """
+        failure = classify_failure(error)
+        print(f"Attempt {attempt} failed ({failure}): {error}")
+        if failure == "permanent" or attempt == self.MAX_ATTEMPTS:
+            return False
+        if failure == "auth":
+            self._forget_session()
+        time.sleep(backoff_delay(attempt))
+        return True
+
+    def _prepare_booking_with_retries(self) -> Optional[str]:
+        """Run prepare_booking(), retrying transient and auth failures."""
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                return self.prepare_booking()
+            except requests.exceptions.RequestException as e:
+                if not self._retry_after_failure(attempt, e):
+                    break
+        return "Failure"
+
+    def _enroll_with_retries(self) -> str:
+        """Enroll the current participant, retrying transient and auth failures from the failed step."""
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                # Resumes from the checkpoint, so only failed steps are repeated
+                status = self.prepare_booking()
+                if status:
+                    return status
+                return self.enroll_participant()
+            except requests.exceptions.RequestException as e:
+                if not self._retry_after_failure(attempt, e):
+                    break
+        return "Failure"
+
+    def parse_event(self, event: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Parse a Bookeo webhook event into per-participant registration data.
+
+        Returns:
+            One parsed dict per participant, in Bookeo order, or None for
+            participants with malformed data
+        """
         print(f"Processing event: {event.get('itemId', 'unknown')}")
-        print(f"DEBUG RAW EVENT: {json.dumps(event, indent=2, default=str)[:2000]}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Raw event: %s", json.dumps(event, indent=2, default=str)[:2000])
 
         customer_selected_level = "171120001"  # Default Level C
-        bookeo_response = []
         self.course_type = ""
 
         # Parse course options
@@ -728,17 +1607,16 @@ the participants in bookeo.
         except (KeyError, IndexError):
             pass
 
-        # Process each participant
+        # Parse every participant first; None marks malformed data
+        participants: List[Optional[Dict[str, Any]]] = []
         for participant in event.get('item', {}).get('participants', {}).get('details', []):
             try:
                 person = participant.get('personDetails', {})
                 address = person.get('streetAddress', {})
                 phones = person.get('phoneNumbers', [])
 
-                # Debug logging
-                print(f"DEBUG: productName = {event['item'].get('productName')}")
-                print(f"DEBUG: startTime = {event['item'].get('startTime')}")
-                print(f"DEBUG: course_type = {self.course_type}")
+                log.debug("productName = %s, startTime = %s, course_type = %s",
+                          event['item'].get('productName'), event['item'].get('startTime'), self.course_type)
 
                 # Determine CPR level based on course type:
                 # - Recert courses: Keep customer's selection (don't upgrade)
@@ -751,13 +1629,13 @@ the participants in bookeo.
 
                 if is_no_cpr_level:
                     cpr_level = None  # These courses don't have CPR levels
-                    print(f"DEBUG: {self.course_type} - no CPR level needed")
+                    log.debug("%s - no CPR level needed", self.course_type)
                 elif is_recert or is_bls:
                     cpr_level = customer_selected_level  # Keep customer's choice
-                    print(f"DEBUG: Recert/BLS course - keeping customer level: {'A' if cpr_level == '171120000' else 'C'}")
+                    log.debug("Recert/BLS course - keeping customer level: %s", 'A' if cpr_level == '171120000' else 'C')
                 else:
                     cpr_level = "171120001"  # Always Level C for regular courses
-                    print(f"DEBUG: Regular course - upgrading to Level C")
+                    log.debug("Regular course - upgrading to Level C")
 
                 # Parse location from productName
                 # Expected format: "Location: Course Name" (e.g., "Cambridge: Standard First Aid")
@@ -768,9 +1646,9 @@ the participants in bookeo.
                 else:
                     # Virtual/Zoom courses without location prefix - default to Cambridge
                     course_location = "Cambridge"
-                    print(f"DEBUG: No location prefix found in '{product_name}', defaulting to Cambridge")
+                    log.debug("No location prefix found in '%s', defaulting to Cambridge", product_name)
 
-                self.parsed_webhook = {
+                parsed = {
                     "course_type": self.course_type,
                     "course_location": course_location,
                     "course_date": event['item']['startTime'].split("T", 1)[0],
@@ -785,34 +1663,129 @@ the participants in bookeo.
                     "postal_code": address.get('postcode', ''),
                     "cpr_level": cpr_level
                 }
-                print(f"DEBUG: Searching for - Date: {self.parsed_webhook['course_date']}, Location: {self.parsed_webhook['course_location']}, Type: {self.parsed_webhook['course_type']}")
+                log.debug("Searching for - Date: %s, Location: %s, Type: %s",
+                          parsed['course_date'], parsed['course_location'], parsed['course_type'])
+                participants.append(parsed)
             except (KeyError, IndexError, TypeError) as e:
                 print(f"Malformed participant data: {e}")
-                bookeo_response.append("Malformed Data")
-                continue
+                participants.append(None)
 
-            # Attempt registration with retries
-            for attempt in range(1, 5):
-                try:
-                    result = self.register_participant()
-                    bookeo_response.append(result)
+        return participants
 
-                    if result in ("Multiple Courses Found", "No Courses Found"):
-                        self.send_email(result, bookeo_response, event['item']['bookingNumber'])
-                        self.bookeo_put(str(bookeo_response), event)
-                        return {'statusCode': 200, 'body': ''}
-                    break
+    def report(self, event: Dict[str, Any], bookeo_response: List[str], subject: str) -> None:
+        """Send the booking's status codes to Bookeo and by email."""
+        self.bookeo_put(str(bookeo_response), event)
+        self.send_email(subject, bookeo_response, event['item']['bookingNumber'])
 
-                except requests.exceptions.RequestException as e:
-                    print(f"Attempt {attempt} failed: {e}")
-                    if attempt == 4:
-                        bookeo_response.append("Failure")
+    def claim_participants(self, event: Dict[str, Any], valid: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Check the ledger before any network call.
 
-        # Determine overall status
-        status = "SUCCESS" if all(r == "Success" for r in bookeo_response) else "FAILURE"
+        Returns:
+            Per valid participant: "Success" if already registered, "In Progress"
+            if another invocation is registering them, None if claimed for this run
+        """
+        statuses: List[Optional[str]] = [None] * len(valid)
+        if self.ledger is None or self.dry_run:
+            return statuses
+
+        item_id = str(event.get('itemId', ''))
+        recorded = self.ledger.outcomes(item_id)
+        claimed = set()  # The same person listed twice in one booking
+        for i, participant in enumerate(valid):
+            fingerprint = participant_fingerprint(participant)
+            if recorded.get(fingerprint) == Ledger.SUCCESS:
+                statuses[i] = "Success"
+            elif fingerprint in claimed or self.ledger.claim(item_id, fingerprint):
+                claimed.add(fingerprint)
+            else:
+                statuses[i] = Ledger.IN_PROGRESS
+        return statuses
 
-        self.bookeo_put(str(bookeo_response), event)
-        self.send_email(status, bookeo_response, event['item']['bookingNumber'])
+    def record_outcomes(self, event: Dict[str, Any], participants: List[Dict[str, Any]], statuses: List[str]) -> None:
+        """Record the outcome of every participant this run processed."""
+        if self.ledger is None or self.dry_run:
+            return
+        item_id = str(event.get('itemId', ''))
+        for participant, status in zip(participants, statuses):
+            self.ledger.record(item_id, participant_fingerprint(participant), status)
+
+    def release_claims(self, event: Dict[str, Any], valid: List[Dict[str, Any]], todo: List[int],
+                       statuses: List[Optional[str]]) -> None:
+        """
+        Record the claimed participants of a run that raised, so a retry of the event takes them again.
+
+        Participants the run settled keep their outcome; the rest are recorded as "Failure".
+        """
+        try:
+            self.record_outcomes(event, [valid[i] for i in todo], [statuses[i] or "Failure" for i in todo])
+        except Exception as e:
+            print(f"Could not release ledger claims for {event.get('itemId', 'unknown')}: {e}")
+
+    @metrics.per_booking
+    def run(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Process a Bookeo webhook event."""
+        participants = self.parse_event(event)
+        valid = [p for p in participants if p is not None]
+
+        # Webhook redeliveries skip participants the ledger already settled
+        statuses = self.claim_participants(event, valid)
+        todo = [i for i, s in enumerate(statuses) if s is None]
+        if valid and not todo:
+            if Ledger.IN_PROGRESS in statuses:
+                raise ParticipantsInProgress(f"Participants of {event.get('itemId', 'unknown')} are being registered by another run")
+            print(f"All participants already processed for {event.get('itemId', 'unknown')}, skipping")
+            self.bookeo_response = statuses
+            return {'statusCode': 200, 'body': ''}
+
+        # Login, verification token and course lookup are shared by the whole
+        # booking, so only the contact lookup and enrollment run per participant
+        if todo:
+            try:
+                self.parsed_webhook = valid[todo[0]]
+                self.checkpoint = {}
+                status = self._prepare_booking_with_retries()
+
+                if status in ("Multiple Courses Found", "No Courses Found"):
+                    for i in todo:
+                        statuses[i] = status
+                    self.record_outcomes(event, [valid[i] for i in todo], [status] * len(todo))
+                    if status == "No Courses Found" and self.pending_queue is not None and not self.dry_run:
+                        self.pending_queue.add(event, self.parsed_webhook['course_date'])
+                    self.bookeo_response = ["Malformed Data"] * participants.index(valid[0]) + [status]
+                    self.report(event, self.bookeo_response, status)
+                    return {'statusCode': 200, 'body': ''}
+
+                if status:
+                    for i in todo:
+                        statuses[i] = status
+                elif self.batch_writes and not self.dry_run and len(todo) > 1:
+                    try:
+                        for i, result in zip(todo, self.enroll_participants_batch([valid[i] for i in todo])):
+                            statuses[i] = result
+                    except requests.exceptions.RequestException as e:
+                        print(f"Batch enrollment failed, falling back to single requests: {e}")
+                        if classify_failure(e) == "auth":
+                            self._forget_session()
+
+                # Anything the batch didn't settle goes through the single-request path
+                for i in todo:
+                    if statuses[i] is None:
+                        self.parsed_webhook = valid[i]
+                        self.checkpoint.pop('contact_id', None)
+                        statuses[i] = self._enroll_with_retries()
+
+                self.record_outcomes(event, [valid[i] for i in todo], [statuses[i] for i in todo])
+            except Exception:
+                self.release_claims(event, valid, todo, statuses)
+                raise
+
+        remaining = iter(statuses)
+        self.bookeo_response = [next(remaining) if p is not None else "Malformed Data" for p in participants]
+
+        # Determine overall status
+        status = "SUCCESS" if all(r == "Success" for r in self.bookeo_response) else "FAILURE"
+        self.report(event, self.bookeo_response, status)
 
         return {'statusCode': 200, 'body': ''}
 
@@ -879,37 +1852,9 @@ def course_name_parser(course_name: str, course_type: str) -> str:
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    """AWS Lambda entry point."""
-    import boto3
-
-    # API Gateway wraps the body as a JSON string
-    if 'body' in event:
-        body = event['body']
-        if isinstance(body, str):
-            event = json.loads(body)
-        else:
-            event = body
-
-    # Check if this is an async processing call (has _async flag)
-    if event.get('_async_process'):
-        # This is the async invocation - do the actual work
-        del event['_async_process']
-        return CprBot().run(event)
-
-    # First call from webhook - invoke ourselves asynchronously and return fast
-    print(f"Accepted webhook for event: {event.get('itemId', 'unknown')}")
-
-    # Add flag and invoke async
-    event['_async_process'] = True
-    lambda_client = boto3.client('lambda')
-    lambda_client.invoke(
-        FunctionName=context.function_name,
-        InvocationType='Event',  # Async invocation
-        Payload=json.dumps(event)
-    )
-
-    # Return immediately to Bookeo
-    return {'statusCode': 200, 'body': 'Accepted'}
+    """AWS Lambda entry point (kept for existing deployments; prefer handler.lambda_handler)."""
+    from handler import lambda_handler as handle
+    return handle(event, context)
 
 
 # For local testing
@@ -0,0 +1,86 @@
+"""
+Field extraction for the B2C and MyRC pages the login flow parses.
+
+Each PageExtractor holds the precompiled patterns for the fields one kind of
+page carries, plus a literal anchor that sits next to them: the B2C SETTINGS
+object, the sign-in token form, the grid's data-view-layouts attribute. The
+page is scanned once for the anchor and every field is matched in a window
+around it. Only fields that aren't in the window are searched for in the whole
+page, so a multi-hundred-KB page is read about once instead of once per field.
+The result says which fields were not found.
+"""
+
+import re
+from typing import Dict, Iterable, Sequence, Tuple
+
+
+class Extraction(dict):
+    """Field values found on a page; `missing` names the fields that were not found."""
+
+    def __init__(self, values: Dict[str, str], missing: Tuple[str, ...]):
+        super().__init__(values)
+        self.missing = missing
+
+
+class PageExtractor:
+    """Pulls a fixed set of fields from one kind of page."""
+
+    def __init__(self, anchor: str, fields: Dict[str, Sequence[str]], before: int = 8192, after: int = 8192):
+        """
+        Args:
+            anchor: Literal text found next to the fields
+            fields: Field name -> regex patterns tried in order; group 1 is the value
+            before: Characters before the anchor searched first
+            after: Characters after the anchor searched first
+        """
+        self.anchor = anchor
+        self.fields = {name: tuple(re.compile(pattern) for pattern in patterns)
+                       for name, patterns in fields.items()}
+        self.before = before
+        self.after = after
+
+    def extract(self, html: str) -> Extraction:
+        """Return every field found in the page."""
+        values: Dict[str, str] = {}
+        pos = html.find(self.anchor)
+        if pos != -1:
+            self._search(html, values, self.fields, max(0, pos - self.before), pos + len(self.anchor) + self.after)
+
+        missing = [name for name in self.fields if name not in values]
+        if missing:
+            self._search(html, values, missing, 0, len(html))
+        return Extraction(values, tuple(name for name in self.fields if name not in values))
+
+    def _search(self, html: str, values: Dict[str, str], names: Iterable[str], start: int, end: int) -> None:
+        for name in names:
+            for pattern in self.fields[name]:
+                match = pattern.search(html, start, end)
+                if match:
+                    values[name] = match.group(1)
+                    break
+
+
+# B2C sign-in and confirmation pages: var SETTINGS = {"csrf": ..., "transId": "StateProperties=...", "api": ...}
+B2C_SETTINGS = PageExtractor('"csrf"', {
+    'csrf': [r'"csrf"\s*:\s*"([^"]+)"'],
+    'state_properties': [r'"transId"\s*:\s*"StateProperties=([^"]+)"', r'StateProperties=([^"&\s]+)'],
+    'api': [r'"api"\s*:\s*"([^"]+)"'],
+})
+
+# Final B2C confirmation: the auto-submitted form that posts state and id_token to MyRC
+SIGNIN_FORM = PageExtractor('id_token', {
+    'state': [r"name=['\"]state['\"][^>]*value=['\"]([^'\"]+)['\"]", r"id=['\"]state['\"] value=['\"]([^'\"]+)['\"]"],
+    'id_token': [r"name=['\"]id_token['\"][^>]*value=['\"]([^'\"]+)['\"]",
+                 r"id=['\"]id_token['\"] value=['\"]([^'\"]+)['\"]"],
+})
+
+# CourseManagement page: base64 JSON layouts holding the grid's Base64SecureConfiguration.
+# The attribute starts at the anchor and can be tens of KB long
+COURSE_LAYOUTS = PageExtractor('data-view-layouts', {
+    'layouts': [r"data-view-layouts=['\"]([^'\"]+)['\"]"],
+}, before=0, after=1 << 20)
+
+# _layout/tokenhtml: <input name="__RequestVerificationToken" type="hidden" value="..." />
+VERIFICATION_TOKEN = PageExtractor('__RequestVerificationToken', {
+    'token': [r'value="([^"]+)"'],
+})
@@ -0,0 +1,177 @@
+"""
+AWS Lambda entry point for the CPR Bot.
+
+The webhook ack path only re-invokes the function asynchronously, so this module
+imports nothing beyond the standard library at load time. cpr_bot (requests,
+smtplib, dotenv, ...) is imported on first use by the processing paths, and the
+boto3 Lambda client and the ledger are created once per container and reused
+across warm invocations.
+
+The processing paths dedupe through a DynamoDB ledger ($LEDGER_TABLE) or a
+SQLite one ($LEDGER_PATH); with neither they warn and run without dedupe.
+
+With $EVENT_QUEUE_PATH set, the ack path queues events for worker.py instead of
+invoking the function per booking; a "_drain_queue" event drains that queue.
+
+Configure the function handler as ``handler.lambda_handler``.
+"""
+
+import json
+import os
+from typing import Optional, Dict, Any
+
+_lambda_client = None
+_stores_created = False
+_ledger = None
+_pending_queue = None
+_engine = None
+
+
+def get_lambda_client():
+    """Return the container's boto3 Lambda client, creating it on first use."""
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+        _lambda_client = boto3.client('lambda')
+    return _lambda_client
+
+
+def _stores():
+    """
+    Return the container's (ledger, pending queue), creating them on first use.
+
+    $LEDGER_TABLE selects a DynamoLedger, which dedupes across containers.
+    $LEDGER_PATH holds the pending queue, and the ledger too when there is no
+    table. /tmp belongs to one container, while redeliveries and retries
+    usually land in others, so stores there only dedupe within a container.
+    Either may be None: bookings then run without dedupe or are not parked.
+    """
+    global _stores_created, _ledger, _pending_queue
+    if not _stores_created:
+        table, path = os.environ.get('LEDGER_TABLE'), os.environ.get('LEDGER_PATH')
+        if path and path.startswith('/tmp/'):
+            print(f"Warning: LEDGER_PATH {path} is local to this container; "
+                  f"redeliveries handled by other containers are not deduped")
+        if table:
+            from ledger import DynamoLedger
+            _ledger = DynamoLedger(table)
+        elif path:
+            from ledger import Ledger
+            _ledger = Ledger(path)
+        else:
+            print("Warning: neither LEDGER_TABLE nor LEDGER_PATH is set; "
+                  "running without the idempotency ledger, so redeliveries are not deduped")
+        if path:
+            from pending import PendingQueue
+            _pending_queue = PendingQueue(path)
+        _stores_created = True
+    return _ledger, _pending_queue
+
+
+def _worker_engine():
+    """Return the container's AsyncCprBot; its login and course cache outlive one drain."""
+    global _engine
+    if _engine is None:
+        from async_bot import AsyncCprBot
+        from cpr_bot import CprBot
+        ledger, queue = _stores()
+        _engine = AsyncCprBot(bot=CprBot(ledger=ledger, pending_queue=queue))
+    return _engine
+
+
+def _flush_notifications() -> None:
+    """
+    Send due emails before Lambda freezes the container and its sender thread.
+
+    A frozen container runs neither the sender thread nor atexit, so a digest
+    is sent by the first invocation after its interval passes, from an outbox
+    in a $LEDGER_PATH every container shares. The scheduled {"_process_pending": true}
+    invocation bounds that delay to its schedule.
+    """
+    from notify import default_dispatcher
+    default_dispatcher().flush()
+
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Unwrap an API Gateway event; the body may be a JSON string."""
+    if 'body' in event:
+        body = event['body']
+        return json.loads(body) if isinstance(body, str) else body
+    return event
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """AWS Lambda entry point."""
+    event = parse_body(event)
+
+    # Scheduled retry of bookings parked as "No Courses Found" (e.g. EventBridge rule);
+    # it sees bookings parked by other containers only through a shared $LEDGER_PATH
+    if event.get('_process_pending'):
+        from cpr_bot import CprBot
+        from pending import process_pending
+        ledger, queue = _stores()
+        if queue is None:
+            print("No pending queue without LEDGER_PATH; nothing to retry")
+        else:
+            process_pending(queue, CprBot(ledger=ledger, pending_queue=queue))
+        _flush_notifications()
+        return {'statusCode': 200, 'body': ''}
+
+    # Check if this is an async processing call (has _async flag)
+    if event.get('_async_process'):
+        # This is the async invocation - do the actual work
+        from cpr_bot import CprBot
+        from ledger import Ledger, ParticipantsInProgress
+        del event['_async_process']
+        ledger, queue = _stores()
+        bot = CprBot(ledger=ledger, pending_queue=queue)
+        try:
+            result = bot.run(event)
+        finally:
+            _flush_notifications()
+        # Participants another invocation still holds are only registered by a retry
+        if Ledger.IN_PROGRESS in (bot.bookeo_response or []):
+            raise ParticipantsInProgress(f"Participants of {event.get('itemId', 'unknown')} are still in progress")
+        return result
+
+    # Worker mode: drain queued webhooks in batches over one session
+    if event.get('_drain_queue'):
+        from worker import EventQueue, drain
+        drain(EventQueue(), _worker_engine())
+        _flush_notifications()
+        return {'statusCode': 200, 'body': ''}
+
+    if os.environ.get('EVENT_QUEUE_PATH'):
+        from worker import EventQueue
+        print(f"Queued webhook for event: {event.get('itemId', 'unknown')}")
+        EventQueue().put(event)
+        return {'statusCode': 200, 'body': 'Accepted'}
+
+    return ack(event, context.function_name)
+
+
+def ack(event: Dict[str, Any], function_name: str, client: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Accept a webhook: invoke the function asynchronously with the event and return.
+
+    Args:
+        event: Parsed Bookeo webhook event
+        function_name: Function to invoke (normally this one)
+        client: Lambda client; defaults to the cached container client
+    """
+    print(f"Accepted webhook for event: {event.get('itemId', 'unknown')}")
+
+    event['_async_process'] = True
+    (client or get_lambda_client()).invoke(
+        FunctionName=function_name,
+        InvocationType='Event',  # Async invocation
+        Payload=json.dumps(event)
+    )
+
+    # Return immediately to Bookeo
+    return {'statusCode': 200, 'body': 'Accepted'}
+
+
+# Create the client during Lambda's init phase rather than on the first webhook
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    get_lambda_client()
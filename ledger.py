@@ -0,0 +1,223 @@
+"""
+Idempotency ledger for Bookeo webhook deliveries.
+
+Bookeo redelivers webhooks and Lambda retries failed async invocations, so the
+same booking can be processed more than once. The ledger records the outcome
+of every participant keyed by Bookeo itemId plus a participant fingerprint;
+participants already registered are skipped before any network call.
+
+Ledger is backed by SQLite, so processes sharing the file claim participants
+atomically. SQLite relies on file locks, which network filesystems such as EFS
+implement poorly, so Lambda containers should share a DynamoLedger instead:
+the same interface over a DynamoDB table with conditional writes. SqliteStore,
+the connection handling Ledger shares with the pending queue, event queue and
+email outbox, lives here too.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+DEFAULT_LEDGER_PATH = "/tmp/cpr_ledger.sqlite3"
+
+
+class ParticipantsInProgress(Exception):
+    """Every unsettled participant of a booking is claimed by another run; retry the event later."""
+
+
+def participant_fingerprint(participant: Dict[str, Any]) -> str:
+    """Stable fingerprint of a parsed participant: who they are and which course."""
+    fields = ('first_name', 'last_name', 'email', 'course_date', 'course_type', 'course_location')
+    key = "|".join(str(participant.get(field) or '').strip().lower() for field in fields)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+class SqliteStore:
+    """
+    Base for the SQLite-backed stores (ledger, pending queue, event queue, outbox).
+
+    Each thread gets its own autocommit connection. The default rollback
+    journal is kept rather than WAL, whose shared-memory index only works when
+    every process is on the same host. Writers wait up to 30 s for the lock.
+    Subclasses list their CREATE statements in SCHEMA, and ALTER statements
+    for files created by an older schema in MIGRATIONS.
+    """
+
+    SCHEMA: Tuple[str, ...] = ()
+    MIGRATIONS: Tuple[str, ...] = ()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, creating the schema on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            for statement in self.MIGRATIONS:
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError:
+                    pass  # Already applied (e.g. duplicate column)
+            self._local.conn = conn
+        return conn
+
+
+class Ledger(SqliteStore):
+    """SQLite-backed record of participant registration outcomes."""
+
+    SUCCESS = "Success"
+    IN_PROGRESS = "In Progress"
+
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS outcomes (
+            item_id TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (item_id, fingerprint)
+        )
+    """,)
+
+    def __init__(self, path: Optional[str] = None, claim_ttl: float = 900):
+        """
+        Args:
+            path: SQLite file. Defaults to $LEDGER_PATH or /tmp/cpr_ledger.sqlite3.
+            claim_ttl: Seconds after which an unfinished claim (e.g. from a
+                       timed-out invocation) can be taken over.
+        """
+        super().__init__(Path(path or os.environ.get('LEDGER_PATH', DEFAULT_LEDGER_PATH)))
+        self.claim_ttl = claim_ttl
+
+    def outcomes(self, item_id: str) -> Dict[str, str]:
+        """Return {fingerprint: status} for every participant recorded for a booking."""
+        rows = self._connect().execute(
+            "SELECT fingerprint, status FROM outcomes WHERE item_id = ?", (item_id,)
+        )
+        return dict(rows.fetchall())
+
+    def claim(self, item_id: str, fingerprint: str) -> bool:
+        """
+        Atomically claim a participant for registration.
+
+        Returns:
+            False if the participant is already registered or another
+            invocation holds a fresh claim, True otherwise
+        """
+        now = time.time()
+        cursor = self._connect().execute("""
+            INSERT INTO outcomes (item_id, fingerprint, status, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (item_id, fingerprint) DO UPDATE
+                SET status = excluded.status, updated_at = excluded.updated_at
+                WHERE outcomes.status != ?
+                  AND (outcomes.status != ? OR outcomes.updated_at < ?)
+        """, (item_id, fingerprint, self.IN_PROGRESS, now, self.SUCCESS, self.IN_PROGRESS, now - self.claim_ttl))
+        return cursor.rowcount == 1
+
+    def record(self, item_id: str, fingerprint: str, status: str) -> None:
+        """Record a participant's outcome, releasing its claim. Success is never overwritten."""
+        self._connect().execute("""
+            INSERT INTO outcomes (item_id, fingerprint, status, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (item_id, fingerprint) DO UPDATE
+                SET status = excluded.status, updated_at = excluded.updated_at
+                WHERE outcomes.status != ?
+        """, (item_id, fingerprint, status, time.time(), self.SUCCESS))
+
+
+class DynamoLedger:
+    """
+    Ledger over a DynamoDB table, for Lambda containers that share no filesystem.
+
+    The table has partition key item_id and sort key fingerprint (both
+    strings). Claims and records are conditional writes, so they carry the
+    same guarantees as Ledger's upserts across any number of containers.
+    """
+
+    SUCCESS = Ledger.SUCCESS
+    IN_PROGRESS = Ledger.IN_PROGRESS
+
+    def __init__(self, table: Optional[str] = None, claim_ttl: float = 900, client: Optional[Any] = None):
+        """
+        Args:
+            table: DynamoDB table name. Defaults to $LEDGER_TABLE.
+            claim_ttl: Seconds after which an unfinished claim can be taken over
+            client: boto3 DynamoDB client; created on first use if omitted
+        """
+        self.table = table or os.environ['LEDGER_TABLE']
+        self.claim_ttl = claim_ttl
+        self._client = client
+
+    @property
+    def client(self):
+        """Return the boto3 DynamoDB client, importing boto3 on first use."""
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('dynamodb')
+        return self._client
+
+    def outcomes(self, item_id: str) -> Dict[str, str]:
+        """Return {fingerprint: status} for every participant recorded for a booking."""
+        result: Dict[str, str] = {}
+        kwargs = {
+            'TableName': self.table,
+            'KeyConditionExpression': "item_id = :item_id",
+            'ExpressionAttributeValues': {':item_id': {'S': item_id}},
+            'ConsistentRead': True,
+        }
+        while True:
+            page = self.client.query(**kwargs)
+            for row in page['Items']:
+                result[row['fingerprint']['S']] = row['status']['S']
+            if 'LastEvaluatedKey' not in page:
+                return result
+            kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+    def _update(self, item_id: str, fingerprint: str, status: str, condition: str,
+                values: Dict[str, Any]) -> bool:
+        """Set a participant's status if condition holds; return whether it was written."""
+        try:
+            self.client.update_item(
+                TableName=self.table,
+                Key={'item_id': {'S': item_id}, 'fingerprint': {'S': fingerprint}},
+                UpdateExpression="SET #status = :status, updated_at = :now",
+                ConditionExpression=condition,
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':status': {'S': status},
+                    ':now': {'N': repr(time.time())},
+                    ':success': {'S': self.SUCCESS},
+                    **values,
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def claim(self, item_id: str, fingerprint: str) -> bool:
+        """
+        Atomically claim a participant for registration.
+
+        Returns:
+            False if the participant is already registered or another
+            invocation holds a fresh claim, True otherwise
+        """
+        return self._update(
+            item_id, fingerprint, self.IN_PROGRESS,
+            "attribute_not_exists(item_id) OR (#status <> :success AND "
+            "(#status <> :status OR updated_at < :stale))",
+            {':stale': {'N': repr(time.time() - self.claim_ttl)}},
+        )
+
+    def record(self, item_id: str, fingerprint: str, status: str) -> None:
+        """Record a participant's outcome, releasing its claim. Success is never overwritten."""
+        self._update(item_id, fingerprint, status,
+                     "attribute_not_exists(item_id) OR #status <> :success", {})
@@ -0,0 +1,161 @@
+"""
+Load generator for the CPR Bot, run against the local simulator.
+
+Replays synthetic Bookeo webhook events through AsyncCprBot at increasing
+concurrency and reports, per level, throughput and booking latency
+percentiles (p50/p95/p99) by booking size. Every level starts with a new bot
+and empty course and grid configuration caches, so it pays for its own login,
+course searches and configuration fetch.
+
+Usage:
+    python loadgen.py                                   # 60 bookings at 1, 2, 4, 8 and 16 in flight
+    python loadgen.py --bookings 200 --concurrency 1,8,32 --sizes 1,3,10
+    python loadgen.py --latency 0.05 --pages 5 --error-rate 0.02 --rate-limit 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple
+
+from async_bot import AsyncCprBot
+from cpr_bot import CourseSearchCache, SecureConfigCache
+from simulator import Simulator, COURSE_TYPES, FACILITIES
+
+COURSE_DATES = ("2030-01-14", "2030-01-15", "2030-01-16", "2030-01-17")
+
+
+def synthetic_event(run: str, n: int, size: int) -> Dict[str, Any]:
+    """
+    Build a Bookeo webhook event that matches exactly one simulated course.
+
+    Args:
+        run: Prefix keeping item ids and participants unique per run
+        n: Booking number within the run; picks the course date, type and facility
+        size: Participants in the booking
+    """
+    course_type = COURSE_TYPES[n % len(COURSE_TYPES)]
+    facility = FACILITIES[n % len(FACILITIES)]
+    course_date = COURSE_DATES[n % len(COURSE_DATES)]
+    details = [{
+        'personDetails': {
+            'firstName': "Load",
+            'lastName': f"Tester{run}x{n}x{i}",
+            'emailAddress': f"load.{run}.{n}.{i}@example.com",
+            'phoneNumbers': [{'number': "519-555-0100"}],
+            'streetAddress': {
+                'address1': f"{n} Test Street",
+                'address2': "",
+                'city': facility,
+                'state': "Ontario",
+                'postcode': "N1R 5S2",
+            },
+        },
+    } for i in range(size)]
+    return {
+        'itemId': f"LOAD-{run}-{n}",
+        'item': {
+            'bookingNumber': f"LOAD-{run}-{n}",
+            'productName': f"{facility}: {course_type}",
+            'startTime': f"{course_date}T09:00:00",
+            'endTime': f"{course_date}T17:00:00",
+            'participants': {'details': details},
+        },
+    }
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of samples (q in 0..100)."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def run_level(engine: AsyncCprBot, events: List[Dict[str, Any]], concurrency: int) -> List[Tuple[int, float, bool]]:
+    """
+    Process events with at most `concurrency` bookings in flight.
+
+    Returns:
+        (participants, seconds, succeeded) per booking, in completion order
+    """
+    slots = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def process(event: Dict[str, Any]) -> None:
+        async with slots:
+            started = time.perf_counter()
+            try:
+                result = await engine.run_async(event)
+                bookeo_response = result.get('bookeo_response') or []
+                ok = bool(bookeo_response) and all(r == "Success" for r in bookeo_response)
+            except Exception:
+                ok = False
+            results.append((len(event['item']['participants']['details']), time.perf_counter() - started, ok))
+
+    await asyncio.gather(*(process(event) for event in events))
+    return results
+
+
+def report(concurrency: int, results: List[Tuple[int, float, bool]], elapsed: float, requests: int) -> None:
+    """Print one concurrency level's throughput and per-size latency percentiles."""
+    bookings = len(results)
+    participants = sum(size for size, _, _ in results)
+    failed = sum(1 for _, _, ok in results if not ok)
+    print(f"Concurrency {concurrency}: {bookings} bookings ({participants} participants) in {elapsed:.2f}s, "
+          f"{bookings / elapsed:.1f} bookings/s, {participants / elapsed:.1f} participants/s, "
+          f"{requests / bookings:.1f} requests/booking, {failed} failed")
+
+    by_size = defaultdict(list)
+    for size, seconds, _ in results:
+        by_size[size].append(seconds * 1000)
+    print(f"  {'size':>6} {'bookings':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for size in sorted(by_size):
+        samples = by_size[size]
+        print(f"  {size:>6} {len(samples):>9} {percentile(samples, 50):>9.1f} "
+              f"{percentile(samples, 95):>9.1f} {percentile(samples, 99):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the CPR Bot against the local simulator")
+    parser.add_argument("--bookings", type=int, default=60, help="Bookings per concurrency level (default: 60)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated bookings in flight per level")
+    parser.add_argument("--sizes", default="1,2,5", help="Comma-separated participants per booking, cycled")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per response (default: 0.02)")
+    parser.add_argument("--pages", type=int, default=3, help="Course search pages per date (default: 3)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 503")
+    parser.add_argument("--rate-limit", type=float, help="Requests per second before the simulator answers 429")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for injected errors (default: 1)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's own output")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    sizes = [int(size) for size in args.sizes.split(",")]
+    os.environ['EMAIL_RECIPIENTS'] = '[]'  # Never email from a load test
+    if not args.verbose:
+        logging.getLogger("cpr_bot").setLevel(logging.WARNING)
+
+    with Simulator(latency=args.latency, pages=args.pages, error_rate=args.error_rate,
+                   rate_limit=args.rate_limit, seed=args.seed) as simulator:
+        print(f"Simulator at {simulator.base_url}: latency {args.latency * 1000:.0f}ms, {args.pages} pages/date, "
+              f"error rate {args.error_rate:.1%}, rate limit {args.rate_limit or 'none'}")
+        for concurrency in levels:
+            events = [synthetic_event(f"c{concurrency}", n, sizes[n % len(sizes)]) for n in range(args.bookings)]
+            bot = simulator.bot(course_cache=CourseSearchCache(), config_cache=SecureConfigCache())
+            engine = AsyncCprBot(concurrency=concurrency, bot=bot)
+
+            requests_before = sum(simulator.counts.values())
+            started = time.perf_counter()
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull):
+                    results = asyncio.run(run_level(engine, events, concurrency))
+            elapsed = time.perf_counter() - started
+            report(concurrency, results, elapsed, sum(simulator.counts.values()) - requests_before)
+
+
+if __name__ == "__main__":
+    main()
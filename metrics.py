@@ -0,0 +1,197 @@
+"""
+Per-step timing spans and metrics for the CPR Bot.
+
+Each span (a login step, a course search page, a contact lookup, a Bookeo
+update, ...) is emitted when it closes as one JSON line in CloudWatch Embedded
+Metric Format: duration, HTTP requests, network time, bytes and transport
+retries made inside it, plus the last HTTP status. A booking span wraps each
+booking and carries the per-booking rollup.
+
+HTTP numbers come from a requests response hook (record_response) installed on
+every session. Spans nest: a request counts toward every open span, so the
+booking span totals what its steps did.
+
+Enable with CPR_METRICS=1. When disabled, span() returns a shared no-op and
+the hook returns immediately.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, Tuple
+
+import requests
+
+ENABLED = os.environ.get('CPR_METRICS', '').lower() in ('1', 'true', 'yes')
+NAMESPACE = os.environ.get('CPR_METRICS_NAMESPACE', 'CprBot')
+
+METRIC_UNITS = {
+    'Duration': 'Milliseconds',
+    'Requests': 'Count',
+    'NetworkTime': 'Milliseconds',
+    'Bytes': 'Bytes',
+    'Retries': 'Count',
+}
+
+# Open spans of the current task or thread, innermost last
+_active: contextvars.ContextVar[Tuple["Span", ...]] = contextvars.ContextVar('cpr_spans', default=())
+
+
+def enable(enabled: bool = True) -> None:
+    """Turn metrics on or off at runtime (e.g. from a CLI flag)."""
+    global ENABLED
+    ENABLED = enabled
+
+
+class Span:
+    """A timed step and the HTTP traffic made inside it."""
+
+    def __init__(self, name: str, properties: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.properties = properties or {}
+        self.requests = 0
+        self.network_ms = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.status: Optional[int] = None
+        self._lock = threading.Lock()  # Requests from worker threads add to shared spans
+        self._started = 0.0
+        self._token = None
+
+    def add_response(self, status: int, network_ms: float, size: int, retries: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.network_ms += network_ms
+            self.bytes += size
+            self.retries += retries
+            self.status = status
+
+    def __enter__(self) -> "Span":
+        parents = _active.get()
+        for parent in parents:
+            for key, value in parent.properties.items():
+                self.properties.setdefault(key, value)
+        self._token = _active.set(parents + (self,))
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration_ms = (time.perf_counter() - self._started) * 1000
+        _active.reset(self._token)
+        if exc_type is not None:
+            self.properties['Error'] = exc_type.__name__
+        emit(self.name, {
+            'Duration': round(duration_ms, 1),
+            'Requests': self.requests,
+            'NetworkTime': round(self.network_ms, 1),
+            'Bytes': self.bytes,
+            'Retries': self.retries,
+        }, dict(self.properties, Status=self.status))
+
+
+class _NoopSpan:
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **properties: Any):
+    """
+    Time a step.
+
+    Args:
+        name: Step name, used as the EMF "Step" dimension
+        **properties: Extra fields for the record (not dimensions)
+    """
+    if not ENABLED:
+        return _NOOP
+    return Span(name, properties)
+
+
+def booking(item_id: str):
+    """Span for one booking; its record is the per-booking rollup."""
+    return span("booking", ItemId=item_id)
+
+
+def timed(name: str) -> Callable:
+    """Decorator that wraps every call of a function in a span."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def per_booking(func: Callable) -> Callable:
+    """Decorator for methods taking a webhook event: run each call in a booking span."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, event, *args, **kwargs):
+            with booking(str(event.get('itemId', ''))):
+                return await func(self, event, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, event, *args, **kwargs):
+        with booking(str(event.get('itemId', ''))):
+            return func(self, event, *args, **kwargs)
+    return wrapper
+
+
+def record_response(response: requests.Response, *args: Any, **kwargs: Any) -> requests.Response:
+    """requests response hook: count the response toward every open span."""
+    if not ENABLED:
+        return response
+    spans = _active.get()
+    if not spans:
+        return response
+
+    length = response.headers.get('Content-Length')
+    if length is not None and length.isdigit():
+        size = int(length)
+    elif not kwargs.get('stream'):
+        size = len(response.content)  # Read now instead of right after the hook
+    else:
+        size = 0
+    retry = getattr(response.raw, 'retries', None)
+    retries = len(retry.history) if retry is not None else 0
+    network_ms = response.elapsed.total_seconds() * 1000
+
+    for open_span in spans:
+        open_span.add_response(response.status_code, network_ms, size, retries)
+    return response
+
+
+def instrument(session: requests.Session) -> None:
+    """Install the metrics response hook on a session."""
+    if record_response not in session.hooks['response']:
+        session.hooks['response'].append(record_response)
+
+
+def emit(step: str, values: Dict[str, float], properties: Dict[str, Any]) -> None:
+    """Print one EMF record; CloudWatch Logs extracts the metrics from Lambda output."""
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Step']],
+                'Metrics': [{'Name': name, 'Unit': METRIC_UNITS[name]} for name in values],
+            }],
+        },
+        'Step': step,
+        **values,
+        **{key: value for key, value in properties.items() if value is not None},
+    }
+    print(json.dumps(record))
@@ -0,0 +1,259 @@
+"""
+Email notifications for the CPR Bot.
+
+Registration results are written to a local outbox and sent by a background
+thread over one reused, authenticated SMTP connection, so the registration path
+never waits on an SMTP handshake. In digest mode, results are held until the
+oldest has waited the digest interval, then sent as one summary email.
+
+Configuration (environment):
+    EMAIL_USER, EMAIL_PASSWORD, EMAIL_RECIPIENTS   as before
+    EMAIL_DIGEST_INTERVAL                          seconds; enables digest mode
+    LEDGER_PATH                                    SQLite file the outbox shares
+"""
+
+import atexit
+import json
+import os
+import smtplib
+import threading
+import time
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+import metrics
+from ledger import DEFAULT_LEDGER_PATH, SqliteStore
+
+
+class Outbox(SqliteStore):
+    """SQLite-backed store of notifications not yet sent."""
+
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            recipients TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claimed_at REAL
+        )
+    """,)
+    MIGRATIONS = ("ALTER TABLE outbox ADD COLUMN claimed_at REAL",)
+
+    def __init__(self, path: Optional[str] = None, max_attempts: int = 5, claim_ttl: float = 300):
+        """
+        Args:
+            path: SQLite file. Defaults to $LEDGER_PATH or /tmp/cpr_ledger.sqlite3.
+            max_attempts: Failed sends after which a message is no longer retried.
+            claim_ttl: Seconds after which messages claimed by a sender that
+                       never finished (e.g. a frozen or killed container) can
+                       be claimed again.
+        """
+        super().__init__(Path(path or os.environ.get('LEDGER_PATH', DEFAULT_LEDGER_PATH)))
+        self.max_attempts = max_attempts
+        self.claim_ttl = claim_ttl
+
+    def add(self, subject: str, body: str, recipients: List[str]) -> None:
+        """Queue a message."""
+        self._connect().execute(
+            "INSERT INTO outbox (subject, body, recipients, created_at) VALUES (?, ?, ?, ?)",
+            (subject, body, json.dumps(recipients), time.time())
+        )
+
+    def claim(self, min_age: float = 0) -> List[Tuple[int, str, str, List[str], float]]:
+        """
+        Atomically claim the messages still to send, oldest first.
+
+        Claimed messages are skipped by every other sender sharing the file
+        until they are removed, fail, or their claim is older than claim_ttl.
+
+        Args:
+            min_age: Claim nothing unless the oldest message has waited this
+                     many seconds (digest mode)
+
+        Returns:
+            (id, subject, body, recipients, created_at) of each claimed message
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, subject, body, recipients, created_at FROM outbox "
+                "WHERE attempts < ? AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY id",
+                (self.max_attempts, now - self.claim_ttl)
+            ).fetchall()
+            if rows and now - rows[0][4] < min_age:
+                rows = []
+            conn.executemany("UPDATE outbox SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(i, subject, body, json.loads(recipients), created_at)
+                for i, subject, body, recipients, created_at in rows]
+
+    def remove(self, ids: List[int]) -> None:
+        """Drop sent messages."""
+        self._connect().executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def failed(self, ids: List[int]) -> None:
+        """Count a failed send against each message and release its claim."""
+        self._connect().executemany(
+            "UPDATE outbox SET attempts = attempts + 1, claimed_at = NULL WHERE id = ?", [(i,) for i in ids]
+        )
+
+
+class SmtpConnection:
+    """One authenticated SMTP connection, reused across messages."""
+
+    HOST = 'smtp.gmail.com'
+    PORT = 465
+    IDLE_TIMEOUT = 60  # Gmail drops idle connections; reconnect rather than fail
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP_SSL] = None
+        self._used_at = 0.0
+
+    def _connect(self) -> smtplib.SMTP_SSL:
+        server = smtplib.SMTP_SSL(self.HOST, self.PORT, timeout=30)
+        server.ehlo()
+        server.login(os.environ['EMAIL_USER'], os.environ['EMAIL_PASSWORD'])
+        return server
+
+    def send(self, subject: str, body: str, recipients: List[str]) -> None:
+        """Send one message, reconnecting once if the server dropped the connection."""
+        sender = os.environ.get('EMAIL_USER')
+        email_text = f"From: {sender}\nTo: {', '.join(recipients)}\nSubject: {subject}\n\n{body}"
+
+        if self._server is not None and time.monotonic() - self._used_at > self.IDLE_TIMEOUT:
+            self.close()
+        for attempt in (1, 2):
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.sendmail(sender, recipients, email_text)
+                self._used_at = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt == 2:
+                    raise
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+class NotificationDispatcher:
+    """Sends outbox messages from a background thread, one by one or as digests."""
+
+    POLL_INTERVAL = 30  # Seconds between retries of messages that failed to send
+
+    def __init__(self, outbox: Optional[Outbox] = None, connection: Optional[SmtpConnection] = None,
+                 digest_interval: Optional[float] = None):
+        """
+        Args:
+            outbox: Message store. Defaults to an Outbox on $LEDGER_PATH.
+            connection: SMTP connection to reuse. A new one is created if not given.
+            digest_interval: If set, roll messages into one summary email sent
+                             once the oldest has waited this many seconds.
+        """
+        self.outbox = outbox if outbox is not None else Outbox()
+        self.connection = connection if connection is not None else SmtpConnection()
+        self.digest_interval = digest_interval
+        self._send_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, subject: str, body: str) -> None:
+        """Queue a notification for the background sender and return immediately."""
+        recipients = json.loads(os.environ.get('EMAIL_RECIPIENTS', '[]'))
+        if not recipients:
+            print("Warning: No email recipients configured")
+            return
+        self.outbox.add(subject, body, recipients)
+        self._start()
+        self._wake.set()
+
+    def _start(self) -> None:
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop = False
+                self._thread = threading.Thread(target=self._work, name="notify", daemon=True)
+                self._thread.start()
+
+    def _work(self) -> None:
+        while not self._stop:
+            self._wake.wait(min(self.POLL_INTERVAL, self.digest_interval or self.POLL_INTERVAL))
+            self._wake.clear()
+            if not self._stop:
+                self.flush()
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Send what is due now, in the calling thread.
+
+        Args:
+            force: Send a pending digest even if its interval hasn't passed
+
+        Returns:
+            Number of messages sent (each digest counts its rolled-up messages)
+        """
+        with self._send_lock:
+            if self.digest_interval is None:
+                return sum(self._send([message]) for message in self.outbox.claim())
+            messages = self.outbox.claim(0 if force else self.digest_interval)
+            return self._send(messages) if messages else 0
+
+    def _send(self, messages: List[Tuple[int, str, str, List[str], float]]) -> int:
+        ids = [message[0] for message in messages]
+        if len(messages) == 1:
+            _, subject, body, recipients, _ = messages[0]
+        else:
+            subjects = [message[1] for message in messages]
+            counts = ", ".join(f"{subjects.count(s)} {s}" for s in sorted(set(subjects)))
+            subject = f"CPR Bot digest: {len(messages)} bookings ({counts})"
+            body = "\n\n".join(f"=== {message[1]} ===\n{message[2]}" for message in messages)
+            recipients = sorted({r for message in messages for r in message[3]})
+
+        try:
+            with metrics.span("email.send", Messages=len(messages)):
+                self.connection.send(subject, body, recipients)
+        except (smtplib.SMTPException, OSError, KeyError) as e:
+            print(f"Failed to send email: {e}")
+            self.connection.close()
+            self.outbox.failed(ids)
+            return 0
+        self.outbox.remove(ids)
+        print(f"Email sent successfully: {subject}")
+        return len(messages)
+
+    def close(self) -> None:
+        """Stop the background thread and send everything still queued, digests included."""
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        self.flush(force=True)
+        self.connection.close()
+
+
+_default_dispatcher: Optional[NotificationDispatcher] = None
+
+
+def default_dispatcher() -> NotificationDispatcher:
+    """Return the process-wide dispatcher, configured from the environment."""
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        interval = os.environ.get('EMAIL_DIGEST_INTERVAL')
+        _default_dispatcher = NotificationDispatcher(digest_interval=float(interval) if interval else None)
+        atexit.register(_default_dispatcher.close)
+    return _default_dispatcher
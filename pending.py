@@ -0,0 +1,184 @@
+"""
+Pending-booking retry queue for the CPR Bot.
+
+Bookings that end as "No Courses Found" usually mean the course session hasn't
+been created in MyRC yet. They are parked here, and process_pending() retries
+them on a schedule: pending bookings are grouped by course date, each date is
+searched once per cycle, and every booking whose course now exists is
+registered. Hundreds of parked bookings cost one search per date.
+
+The queue is a table in the $LEDGER_PATH SQLite file, next to the ledger unless
+that is on DynamoDB. Whatever parks bookings and whatever retries them must
+open the same file, so on Lambda $LEDGER_PATH must be on shared storage such
+as EFS.
+
+Usage:
+    python pending.py                   # Run one retry cycle
+    python pending.py --interval 900    # Keep running, one cycle every 15 minutes
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+from typing import Optional, Dict, Any, List, TYPE_CHECKING
+
+import requests
+
+from ledger import DEFAULT_LEDGER_PATH, SqliteStore
+
+if TYPE_CHECKING:
+    from cpr_bot import CprBot
+
+
+class PendingQueue(SqliteStore):
+    """SQLite-backed queue of bookings waiting for their MyRC course session."""
+
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS pending (
+            item_id TEXT PRIMARY KEY,
+            course_date TEXT NOT NULL,
+            event TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            parked_at REAL NOT NULL,
+            checked_at REAL
+        )
+    """, "CREATE INDEX IF NOT EXISTS pending_course_date ON pending (course_date)")
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite file. Defaults to $LEDGER_PATH (shared with the ledger)
+                  or /tmp/cpr_ledger.sqlite3.
+        """
+        super().__init__(Path(path or os.environ.get('LEDGER_PATH', DEFAULT_LEDGER_PATH)))
+
+    def add(self, event: Dict[str, Any], course_date: str) -> None:
+        """Park a booking until its course date can be searched again."""
+        item_id = str(event.get('itemId', ''))
+        self._connect().execute("""
+            INSERT INTO pending (item_id, course_date, event, parked_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (item_id) DO UPDATE
+                SET course_date = excluded.course_date, event = excluded.event
+        """, (item_id, course_date, json.dumps(event), time.time()))
+        print(f"Parked booking {item_id} until a course exists on {course_date}")
+
+    def remove(self, item_id: str) -> None:
+        """Drop a booking from the queue."""
+        self._connect().execute("DELETE FROM pending WHERE item_id = ?", (item_id,))
+
+    def mark_checked(self, item_id: str) -> None:
+        """Record another unsuccessful check of a parked booking."""
+        self._connect().execute(
+            "UPDATE pending SET attempts = attempts + 1, checked_at = ? WHERE item_id = ?",
+            (time.time(), item_id)
+        )
+
+    def expire(self, before: str) -> int:
+        """Drop bookings whose course date is before the given date; returns how many."""
+        cursor = self._connect().execute("DELETE FROM pending WHERE course_date < ?", (before,))
+        return cursor.rowcount
+
+    def by_date(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Return parked booking events grouped by course date, oldest first."""
+        rows = self._connect().execute(
+            "SELECT course_date, event FROM pending ORDER BY course_date, parked_at"
+        )
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for course_date, event in rows.fetchall():
+            grouped.setdefault(course_date, []).append(json.loads(event))
+        return grouped
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+
+def process_pending(queue: PendingQueue, bot: "CprBot", today: Optional[str] = None) -> Dict[str, int]:
+    """
+    Run one retry cycle over parked bookings.
+
+    Each course date is searched once, bypassing the course cache. Bookings
+    whose course now matches are registered through bot.run() (which hits the
+    freshly cached search) and leave the queue once run() returns; the rest, and
+    any booking whose run raised, stay parked without another Bookeo update or
+    email.
+
+    Args:
+        queue: Pending queue to drain
+        bot: Logged-in or fresh CprBot; each booking runs on a fork of it
+        today: ISO date; bookings for earlier course dates are dropped
+
+    Returns:
+        Counts of registered, still pending and expired bookings
+    """
+    stats = {'registered': 0, 'pending': 0, 'expired': queue.expire(before=today or date.today().isoformat())}
+    if stats['expired']:
+        print(f"Dropped {stats['expired']} parked booking(s) whose course date has passed")
+
+    for course_date, events in queue.by_date().items():
+        try:
+            index = bot.search_course_date(course_date, refresh=True)
+        except requests.exceptions.RequestException as e:
+            print(f"Course search for {course_date} failed: {e}")
+            index = None
+        if index is None:
+            stats['pending'] += len(events)
+            continue
+
+        for event in events:
+            item_id = str(event.get('itemId', ''))
+            booking_bot = bot.fork()
+            valid = [p for p in booking_bot.parse_event(event) if p is not None]
+            if not valid:
+                queue.remove(item_id)
+                continue
+
+            booking_bot.parsed_webhook = valid[0]
+            if booking_bot.parse_and_find_ids(index) is None:
+                queue.mark_checked(item_id)
+                stats['pending'] += 1
+                continue
+
+            # A booking stays parked until run() returns, so a failure is retried next cycle
+            try:
+                booking_bot.run(event)
+            except Exception as e:
+                print(f"Retry of parked booking {item_id} failed: {e}")
+                queue.mark_checked(item_id)
+                stats['pending'] += 1
+                continue
+
+            # run() has re-parked the booking if the course disappeared again
+            if "No Courses Found" in (booking_bot.bookeo_response or []):
+                stats['pending'] += 1
+                continue
+            queue.remove(item_id)
+            stats['registered'] += 1
+
+    print(f"Pending cycle: {stats['registered']} registered, {stats['pending']} still pending, {stats['expired']} expired")
+    return stats
+
+
+def main():
+    from cpr_bot import CprBot
+    from ledger import Ledger
+
+    interval = None
+    if "--interval" in sys.argv:
+        interval = float(sys.argv[sys.argv.index("--interval") + 1])
+
+    queue = PendingQueue()
+    bot = CprBot(ledger=Ledger(), pending_queue=queue)
+    while True:
+        print(f"Checking {len(queue)} parked booking(s)...")
+        process_pending(queue, bot)
+        if interval is None:
+            break
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    main()
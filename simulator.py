@@ -0,0 +1,599 @@
+"""
+Local stand-in for the MyRC portal, Azure B2C and the Bookeo API.
+
+Serves every endpoint CprBot and BookeoClient call, with the page shapes their
+parsers expect: the B2C sign-in pages, the CourseManagement layouts, the
+verification token, the entity-grid course search, the OData contacts,
+course participants and $batch endpoints, and Bookeo booking updates. Latency,
+course search page count, error rate and throttling are configurable, so load
+tests and profiling can run without touching the live services.
+
+All three services share one HTTP server: MyRC at the root, B2C under /b2c and
+Bookeo under /bookeo. Simulator.bot() builds a CprBot pointed at it.
+
+Usage:
+    with Simulator(latency=0.02, pages=3, error_rate=0.01) as simulator:
+        bot = simulator.bot()
+        bot.run(event)
+        print(simulator.counts)
+
+    python simulator.py --port 8080 --latency 0.05   # Serve until interrupted
+"""
+
+import base64
+import json
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+
+# Course types and facilities every simulated date offers one course for
+COURSE_TYPES = (
+    "Standard First Aid Blended",
+    "Emergency First Aid Blended",
+    "CPR/AED Blended",
+    "Basic Life Support",
+    "Babysitter Course",
+)
+FACILITIES = ("Cambridge", "Kitchener", "Waterloo", "Guelph", "Hamilton", "Brantford")
+
+SESSION_COOKIE = ".AspNet.ApplicationCookie"
+
+# Request path prefixes of the simulated services
+B2C_PREFIX = "/b2c"
+BOOKEO_PREFIX = "/bookeo"
+
+_FILTER_PATTERN = re.compile(r"lastname eq '((?:[^']|'')*)' and emailaddress1 eq '((?:[^']|'')*)'")
+
+
+class Simulator:
+    """Threaded HTTP server imitating MyRC, B2C and Bookeo."""
+
+    def __init__(self, latency: float = 0.0, route_latency: Optional[Dict[str, float]] = None,
+                 pages: int = 3, page_size: int = 10, error_rate: float = 0.0,
+                 rate_limit: Optional[float] = None, token_ttl: Optional[float] = None,
+                 seed: Optional[int] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            latency: Seconds every response is delayed
+            route_latency: Per-route delays overriding latency, keyed by route name
+                           (signin, selfasserted, confirmed, complete_signin,
+                           course_management, tokenhtml, grid, contacts,
+                           participants, batch, bookeo)
+            pages: Pages the course search returns for every date
+            page_size: Records per course search page
+            error_rate: Fraction of requests answered with 503
+            rate_limit: Requests per second served before answering 429 with
+                        Retry-After; None disables throttling
+            token_ttl: Seconds a verification token is accepted before requests
+                       carrying it are rejected as anti-forgery failures
+            seed: Seed for error injection, for repeatable runs
+            host: Interface to bind
+            port: Port to bind; 0 picks a free one
+        """
+        self.latency = latency
+        self.route_latency = route_latency or {}
+        self.pages = pages
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.token_ttl = token_ttl
+        self.counts: Counter = Counter()  # (route, status) -> responses
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._window_count = 0
+        self._confirmed_tx: set = set()    # StateProperties whose next confirm returns tokens
+        self._sessions: set = set()
+        self._tokens: Dict[str, float] = {}  # Verification token -> time issued
+        self.secure_config = base64.b64encode(secrets.token_bytes(96)).decode()  # The grid accepts only this one
+        self._contacts: Dict[Tuple[str, str], str] = {}  # (last name, email) -> contactid
+        self._participants: set = set()  # (contactid, course session id)
+        self.bookings: Dict[str, Dict[str, Any]] = {}  # Bookeo itemId -> last PUT payload
+        self._part_faults: List[Tuple[int, str]] = []  # (status, body) answering the next $batch operations
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.simulator = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def myrc_url(self) -> str:
+        return self.base_url
+
+    @property
+    def b2c_url(self) -> str:
+        return self.base_url + B2C_PREFIX
+
+    @property
+    def bookeo_url(self) -> str:
+        return self.base_url + BOOKEO_PREFIX
+
+    def start(self) -> "Simulator":
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "Simulator":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def bot(self, **kwargs: Any):
+        """
+        Build a CprBot whose MyRC, B2C and Bookeo traffic goes to this simulator.
+
+        Args:
+            **kwargs: Passed to CprBot; a BookeoClient for the simulator is
+                      supplied unless "bookeo" is given
+        """
+        from bookeo import BookeoClient
+        from cpr_bot import CprBot
+
+        myrc_policy = CprBot.RETRY_POLICIES[CprBot.MYRC_BASE_URL]
+        b2c_policy = CprBot.RETRY_POLICIES[CprBot.B2C_BASE_URL]
+        simulated = type("SimulatedCprBot", (CprBot,), {
+            'MYRC_BASE_URL': self.myrc_url,
+            'MYRC_SIGNIN_URL': f"{self.myrc_url}/en/SignIn",
+            'B2C_BASE_URL': self.b2c_url,
+            'RETRY_POLICIES': {self.myrc_url: myrc_policy, self.b2c_url: b2c_policy},
+        })
+        kwargs.setdefault('bookeo', BookeoClient(base_url=self.bookeo_url))
+        return simulated(**kwargs)
+
+    def courses(self, course_date: str) -> List[Dict[str, str]]:
+        """
+        Return the course sessions the course search serves for a date.
+
+        The first records are one course per COURSE_TYPES and FACILITIES pair;
+        the rest of the pages are filled with courses at other facilities.
+        """
+        catalog = [(course_type, facility) for facility in FACILITIES for course_type in COURSE_TYPES]
+        total = self.pages * self.page_size
+        courses = []
+        for n in range(total):
+            if n < len(catalog):
+                course_type, facility = catalog[n]
+            else:
+                course_type, facility = COURSE_TYPES[n % len(COURSE_TYPES)], f"Community Centre {n:04d}"
+            courses.append({
+                'id': str(uuid.uuid5(uuid.NAMESPACE_URL, f"{course_date}/{n}")),
+                'name': f"CRS-{course_date.replace('-', '')}-{n:04d}",
+                'course_type': course_type,
+                'facility': facility,
+            })
+        return courses
+
+    # Fault injection
+
+    def _delay(self, route: str) -> None:
+        delay = self.route_latency.get(route, self.latency)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _fault(self) -> Optional[Tuple[int, Dict[str, str]]]:
+        """Return (status, headers) of an injected failure for this request, if any."""
+        with self._lock:
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start, self._window_count = now, 0
+                self._window_count += 1
+                if self._window_count > self.rate_limit:
+                    return 429, {'Retry-After': '1'}
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 503, {}
+        return None
+
+    # B2C
+
+    def _new_transaction(self) -> Tuple[str, str]:
+        return secrets.token_urlsafe(16), secrets.token_urlsafe(24)
+
+    def _settings_page(self, tx: str, csrf: str) -> str:
+        settings = {'csrf': csrf, 'transId': f"StateProperties={tx}", 'api': "CombinedSigninAndSignup"}
+        return f"<html><head><script>var SETTINGS = {json.dumps(settings)};</script></head><body></body></html>"
+
+    def confirm(self, tx: str) -> str:
+        """Second confirm of a sign-in returns the token form; the first asks for the password again."""
+        with self._lock:
+            if tx in self._confirmed_tx:
+                self._confirmed_tx.discard(tx)
+                state, id_token = secrets.token_urlsafe(16), secrets.token_urlsafe(48)
+                return ("<html><body><form id='auto' method='post' action='/'>"
+                        f"<input type='hidden' name='state' id='state' value='{state}'/>"
+                        f"<input type='hidden' name='id_token' id='id_token' value='{id_token}'/>"
+                        "</form></body></html>")
+            next_tx, csrf = self._new_transaction()
+            self._confirmed_tx.add(next_tx)
+        return self._settings_page(next_tx, csrf)
+
+    # MyRC
+
+    def new_session(self) -> str:
+        session = secrets.token_urlsafe(24)
+        with self._lock:
+            self._sessions.add(session)
+        return session
+
+    def has_session(self, session: Optional[str]) -> bool:
+        with self._lock:
+            return session in self._sessions
+
+    def new_token(self) -> str:
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._tokens[token] = time.monotonic()
+        return token
+
+    def has_token(self, token: Optional[str]) -> bool:
+        with self._lock:
+            issued = self._tokens.get(token)
+        if issued is None:
+            return False
+        return self.token_ttl is None or time.monotonic() - issued < self.token_ttl
+
+    def layouts(self) -> str:
+        layouts = [{'Base64SecureConfiguration': self.secure_config}]
+        return base64.b64encode(json.dumps(layouts).encode()).decode()
+
+    def rotate_config(self) -> None:
+        """Issue a new grid configuration, as after a portal deployment; searches with the old one fail."""
+        self.secure_config = base64.b64encode(secrets.token_bytes(96)).decode()
+
+    def grid_page(self, course_date: str, page: int) -> Dict[str, Any]:
+        courses = self.courses(course_date)
+        start = (page - 1) * self.page_size
+        records = [{
+            'Id': course['id'],
+            'Attributes': [
+                {'Name': 'crc_coursetype', 'Value': {'Name': course['course_type']}},
+                {'Name': 'crc_facility', 'Value': {'Name': course['facility']}},
+                {'Name': 'crc_name', 'Value': course['name']},
+            ],
+        } for course in courses[start:start + self.page_size]]
+        return {
+            'Records': records,
+            'PageCount': self.pages,
+            'ItemCount': len(courses),
+            'MoreRecords': page < self.pages,
+        }
+
+    def odata(self, method: str, path: str, query: str, body: Any,
+              bound: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], str]:
+        """
+        Handle one OData request, standalone or from a $batch.
+
+        Args:
+            method: HTTP method
+            path: Path below /_api, e.g. "/contacts"
+            query: Raw query string
+            body: Decoded JSON body, or None
+            bound: Content-ID -> entity path created earlier in the same change set
+
+        Returns:
+            (status, headers, body)
+        """
+        if path == "/contacts" and method == "GET":
+            params = {name: values[0] for name, values in parse_qs(query).items()}
+            match = _FILTER_PATTERN.search(params.get('$filter', ''))
+            contacts = []
+            if match:
+                key = (match.group(1).replace("''", "'").lower(), match.group(2).replace("''", "'").lower())
+                with self._lock:
+                    contact_id = self._contacts.get(key)
+                if contact_id:
+                    contacts.append({'contactid': contact_id, 'fullname': key[0].title()})
+            return 200, {'Content-Type': 'application/json'}, json.dumps({'value': contacts})
+
+        if path == "/contacts" and method == "POST":
+            key = (body.get('lastname', '').lower(), body.get('emailaddress1', '').lower())
+            with self._lock:
+                contact_id = self._contacts.setdefault(key, str(uuid.uuid4()))
+            entity = f"{self.myrc_url}/_api/contacts({contact_id})"
+            return 204, {'entityid': contact_id, 'OData-EntityId': entity}, ""
+
+        if path == "/crc_courseparticipants" and method == "POST":
+            attendee = body.get('crc_attendee@odata.bind', '')
+            attendee = (bound or {}).get(attendee, attendee)
+            key = (attendee, body.get('crc_coursesession@odata.bind', ''))
+            with self._lock:
+                if key in self._participants:
+                    error = {'error': {'message': "This contact is already registered in the course session."}}
+                    return 400, {'Content-Type': 'application/json'}, json.dumps(error)
+                self._participants.add(key)
+            return 204, {'entityid': str(uuid.uuid4())}, ""
+
+        return 404, {'Content-Type': 'application/json'}, json.dumps({'error': {'message': f"No route {path}"}})
+
+    def batch(self, content_type: str, content: bytes) -> Tuple[str, bytes]:
+        """Run a $batch request; returns the response's (Content-Type, body)."""
+        message = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + content)
+        boundary = f"batchresponse_{uuid.uuid4()}"
+        lines = []
+        for part in message.get_payload():
+            lines.append(f"--{boundary}")
+            if part.is_multipart():
+                changeset = f"changesetresponse_{uuid.uuid4()}"
+                lines += [f"Content-Type: multipart/mixed; boundary={changeset}", ""]
+                bound: Dict[str, str] = {}
+                responses = []
+                for operation in part.get_payload():
+                    content_id = operation.get('Content-ID')
+                    status, headers, body = self._batch_operation(operation, bound)
+                    if content_id and 'entityid' in headers:
+                        bound[f"${content_id}"] = f"/contacts({headers['entityid']})"
+                    responses.append(_http_part(status, headers, body, content_id))
+                    if status >= 400:
+                        responses = responses[-1:]  # A failed change set answers with its error only
+                        break
+                for response in responses:
+                    lines += [f"--{changeset}", response]
+                lines.append(f"--{changeset}--")
+            else:
+                status, headers, body = self._batch_operation(part, {})
+                lines.append(_http_part(status, headers, body))
+        lines.append(f"--{boundary}--")
+        return f"multipart/mixed; boundary={boundary}", ("\r\n".join(lines) + "\r\n").encode()
+
+    def _batch_operation(self, part, bound: Dict[str, str]) -> Tuple[int, Dict[str, str], str]:
+        with self._lock:
+            fault = self._part_faults.pop(0) if self._part_faults else None
+        if fault is not None:
+            return fault[0], {}, fault[1]
+        raw = (part.get_payload(decode=True) or b"").decode('utf-8').replace("\r\n", "\n")
+        head, _, body = raw.partition("\n\n")
+        method, url = head.strip().split("\n")[0].split()[:2]
+        parts = urlsplit(url)
+        path = unquote(parts.path).split("/_api", 1)[-1]
+        body = body.strip()
+        return self.odata(method, path, parts.query, json.loads(body) if body else None, bound)
+
+    def fail_batch_parts(self, *responses: Tuple[int, str]) -> None:
+        """Answer the next $batch operations with these (status, body) pairs instead of running them."""
+        with self._lock:
+            self._part_faults.extend(responses)
+
+    def update_booking(self, item_id: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self.bookings[item_id] = payload
+
+
+def _http_part(status: int, headers: Dict[str, str], body: str, content_id: Optional[str] = None) -> str:
+    """Render one embedded HTTP response of a $batch response."""
+    lines = ["Content-Type: application/http", "Content-Transfer-Encoding: binary"]
+    if content_id:
+        lines.append(f"Content-ID: {content_id}")
+    lines += ["", f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    lines += ["", body]
+    return "\r\n".join(lines)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes one request to the simulated service behind its path."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, so client connection pools behave as in production
+
+    @property
+    def simulator(self) -> Simulator:
+        return self.server.simulator
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._dispatch()
+
+    def do_POST(self) -> None:
+        self._dispatch()
+
+    def do_PUT(self) -> None:
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        parts = urlsplit(self.path)
+        self.path_only, self.query = parts.path, parts.query
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b""
+
+        route, handler = self._route()
+        self.simulator._delay(route)
+        fault = self.simulator._fault()
+        if fault:
+            status, headers = fault
+            self._send(route, status, "Service temporarily unavailable", headers)
+            return
+        handler(route)
+
+    def _route(self):
+        path = self.path_only
+        if path.startswith(BOOKEO_PREFIX + "/v2/bookings/"):
+            return "bookeo", self._bookeo
+        if path.startswith(B2C_PREFIX):
+            if path.endswith("/SelfAsserted"):
+                return "selfasserted", self._self_asserted
+            if path.endswith("/confirmed"):
+                return "confirmed", self._confirmed
+            return "signin", self._b2c_authorize
+        if path == "/en/SignIn":
+            return "signin", self._signin
+        if path == "/" and self.command == "POST":
+            return "complete_signin", self._complete_signin
+        if path.startswith("/en/CourseManagement"):
+            return "course_management", self._course_management
+        if path == "/_layout/tokenhtml":
+            return "tokenhtml", self._tokenhtml
+        if path.startswith("/_services/entity-grid-data.json/"):
+            return "grid", self._grid
+        if path == "/_api/$batch":
+            return "batch", self._batch
+        if path.startswith("/_api/crc_courseparticipants"):
+            return "participants", self._odata
+        if path.startswith("/_api/"):
+            return "contacts", self._odata
+        return "home", self._home
+
+    def _send(self, route: str, status: int, body: Any = "", headers: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(body, (dict, list)):
+            body, content_type = json.dumps(body), "application/json; charset=utf-8"
+        else:
+            content_type = "text/html; charset=utf-8"
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', content_type)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        with self.simulator._lock:
+            self.simulator.counts[(route, status)] += 1
+
+    def _redirect(self, route: str, location: str, cookie: Optional[str] = None) -> None:
+        headers = {'Location': location}
+        if cookie:
+            headers['Set-Cookie'] = f"{SESSION_COOKIE}={cookie}; Path=/; HttpOnly"
+        self._send(route, 302, "", headers)
+
+    def _session(self) -> Optional[str]:
+        for item in (self.headers.get('Cookie') or "").split(";"):
+            name, _, value = item.strip().partition("=")
+            if name == SESSION_COOKIE:
+                return value
+        return None
+
+    def _authenticated(self, route: str) -> bool:
+        """Answer like MyRC does for an expired session: redirect to SignIn."""
+        if self.simulator.has_session(self._session()):
+            return True
+        self._redirect(route, "/en/SignIn?returnUrl=%2Fen%2F")
+        return False
+
+    def _verified(self, route: str) -> bool:
+        if self.simulator.has_token(self.headers.get('__RequestVerificationToken')):
+            return True
+        self._send(route, 403, {'error': {'message': "The anti-forgery token could not be validated."}})
+        return False
+
+    # B2C
+
+    def _signin(self, route: str) -> None:
+        from cpr_bot import CprBot
+        self._redirect(route, f"{B2C_PREFIX}/{CprBot.B2C_TENANT}/oauth2/v2.0/authorize?p={CprBot.B2C_POLICY}")
+
+    def _b2c_authorize(self, route: str) -> None:
+        tx, csrf = self.simulator._new_transaction()
+        self._send(route, 200, self.simulator._settings_page(tx, csrf))
+
+    def _self_asserted(self, route: str) -> None:
+        if not self.headers.get('X-CSRF-TOKEN'):
+            self._send(route, 400, {'status': "400", 'message': "Missing CSRF token"})
+            return
+        self._send(route, 200, {'status': "200"})
+
+    def _confirmed(self, route: str) -> None:
+        tx = parse_qs(self.query).get('tx', [""])[0].replace("StateProperties=", "", 1)
+        self._send(route, 200, self.simulator.confirm(tx))
+
+    # MyRC
+
+    def _home(self, route: str) -> None:
+        self._send(route, 200, "<html><body>MyRC</body></html>")
+
+    def _complete_signin(self, route: str) -> None:
+        form = parse_qs(self.body.decode('utf-8'))
+        if not form.get('state') or not form.get('id_token'):
+            self._send(route, 400, "Missing state or id_token")
+            return
+        self._redirect(route, "/en/", cookie=self.simulator.new_session())
+
+    def _course_management(self, route: str) -> None:
+        if self._authenticated(route):
+            self._send(route, 200, f"<div class='entitylist' data-view-layouts='{self.simulator.layouts()}'></div>")
+
+    def _tokenhtml(self, route: str) -> None:
+        if self._authenticated(route):
+            token = self.simulator.new_token()
+            self._send(route, 200, f'<input name="__RequestVerificationToken" type="hidden" value="{token}" />')
+
+    def _grid(self, route: str) -> None:
+        if not self._authenticated(route) or not self._verified(route):
+            return
+        search = json.loads(self.body or b"{}")
+        if search.get('base64SecureConfiguration') != self.simulator.secure_config:
+            self._send(route, 500, {'error': {'message': "The SecureConfiguration is invalid or has expired."}})
+            return
+        page = self.simulator.grid_page(search.get('search', ""), int(search.get('page', 1)))
+        self._send(route, 200, page)
+
+    def _odata(self, route: str) -> None:
+        if not self._authenticated(route):
+            return
+        if self.command != "GET" and not self._verified(route):
+            return
+        path = self.path_only.split("/_api", 1)[1]
+        body = json.loads(self.body) if self.body else None
+        status, headers, body = self.simulator.odata(self.command, path, self.query, body)
+        self._send(route, status, body, headers)
+
+    def _batch(self, route: str) -> None:
+        if not self._authenticated(route) or not self._verified(route):
+            return
+        content_type, body = self.simulator.batch(self.headers.get('Content-Type', ""), self.body)
+        self._send(route, 200, body, {'Content-Type': content_type})
+
+    # Bookeo
+
+    def _bookeo(self, route: str) -> None:
+        item_id = self.path_only.rsplit("/", 1)[-1]
+        self.simulator.update_booking(item_id, json.loads(self.body or b"{}"))
+        self._send(route, 200, {})
+
+
+def main():
+    """Serve the simulator in the foreground."""
+    def flag_value(name: str, default: str) -> str:
+        return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+    rate_limit = flag_value("--rate-limit", "")
+    simulator = Simulator(
+        latency=float(flag_value("--latency", "0")),
+        pages=int(flag_value("--pages", "3")),
+        error_rate=float(flag_value("--error-rate", "0")),
+        rate_limit=float(rate_limit) if rate_limit else None,
+        port=int(flag_value("--port", "8080")),
+    )
+    print(f"Simulating MyRC at {simulator.myrc_url}, B2C at {simulator.b2c_url}, Bookeo at {simulator.bookeo_url}")
+    try:
+        simulator._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
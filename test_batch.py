@@ -0,0 +1,90 @@
+"""OData $batch requests against the simulator: round trip, and fallbacks to single requests."""
+
+import copy
+import json
+
+from cpr_bot import ODataBatch
+from loadgen import synthetic_event
+
+
+def prepared_bot(make_bot, event):
+    """A bot logged in, with a token and the event's course matched."""
+    bot = make_bot()
+    participants = bot.parse_event(copy.deepcopy(event))
+    bot.parsed_webhook = participants[0]
+    bot.checkpoint = {}
+    assert bot.prepare_booking() is None
+    return bot, participants
+
+
+def test_batch_round_trip(make_bot, simulator):
+    bot, participants = prepared_bot(make_bot, synthetic_event("t", 0, 1))
+    participant = participants[0]
+
+    batch = ODataBatch(f'{bot.MYRC_BASE_URL}/_api')
+    batch.add_request('GET', '/contacts', params=bot._contact_search_params(participant))
+    content_ids = batch.add_changeset([
+        ('POST', '/contacts', bot._contact_data(participant)),
+        ('POST', '/crc_courseparticipants', bot._participant_data(f"${batch.next_content_id}", participant)),
+    ])
+    lookup, changeset = bot._send_batch(batch)
+
+    assert content_ids == ["1", "2"]
+    assert lookup[0]['status'] == 200
+    assert json.loads(lookup[0]['body']) == {'value': []}
+    assert [r['status'] for r in changeset] == [204, 204]
+    assert [r['content_id'] for r in changeset] == content_ids
+    assert 'entityid' in changeset[0]['headers']
+
+
+def test_failed_changeset_returns_only_its_error(make_bot):
+    bot, participants = prepared_bot(make_bot, synthetic_event("t", 0, 1))
+    participant = participants[0]
+    assert bot.enroll_participants_batch([participant]) == ["Success"]
+
+    # Registering the same contact again fails inside the change set
+    contact_id = bot._search_contact_api(bot.verif_token)['contactid']
+    batch = ODataBatch(f'{bot.MYRC_BASE_URL}/_api')
+    batch.add_changeset([('POST', '/crc_courseparticipants',
+                          bot._participant_data(f"/contacts({contact_id})", participant))])
+    [changeset] = bot._send_batch(batch)
+    assert len(changeset) == 1
+    assert changeset[0]['status'] == 400
+    assert 'already registered' in changeset[0]['body']
+
+
+def test_booking_uses_two_batch_round_trips(make_bot, simulator):
+    bot = make_bot()
+    bot.run(synthetic_event("t", 0, 3))
+    assert bot.bookeo_response == ["Success"] * 3
+    assert simulator.counts[('batch', 200)] == 2
+    assert simulator.counts[('participants', 204)] == 0  # Nothing fell back to single requests
+
+
+def test_transient_changeset_failure_falls_back_to_single_requests(make_bot, simulator):
+    # Both lookups find no contact, then the first change set answers 503
+    simulator.fail_batch_parts((200, '{"value": []}'), (200, '{"value": []}'),
+                               (503, '{"error": {"message": "Service Unavailable"}}'))
+    bot = make_bot()
+    bot.run(synthetic_event("t", 0, 2))
+    assert bot.bookeo_response == ["Success", "Success"]
+    assert simulator.counts[('participants', 204)] == 1
+
+
+def test_non_json_lookup_falls_back_to_single_requests(make_bot, simulator):
+    simulator.fail_batch_parts((200, "<html><body>Sign in</body></html>"))
+    bot = make_bot()
+    bot.run(synthetic_event("t", 0, 2))
+    assert bot.bookeo_response == ["Success", "Success"]
+    assert simulator.counts[('participants', 204)] == 1
+
+
+def test_expired_session_during_batch_logs_in_again(make_bot, simulator):
+    bot = make_bot()
+    bot.run(synthetic_event("t", 0, 1))
+    simulator._sessions.clear()  # The session expires between bookings, inside the probe interval
+
+    bot.run(synthetic_event("t", 4, 2))
+    assert bot.bookeo_response == ["Success", "Success"]
+    assert simulator.counts[('batch', 302)] == 1
+    assert simulator.counts[('complete_signin', 302)] == 2
@@ -0,0 +1,55 @@
+"""BookeoClient: payload built from a copy, in-flight coalescing and the 429 cooldown."""
+
+import copy
+import threading
+import time
+
+from bookeo import BookeoClient
+from simulator import Simulator
+
+
+def booking_item():
+    return {
+        'bookingNumber': "B-1",
+        'startTime': "2030-01-14T09:00:00-05:00",
+        'endTime': "2030-01-14T17:00:00-05:00",
+        'customer': {'firstName': "Ada"},
+        'participants': {'numbers': [{'number': 1}], 'details': [{'personId': "p1"}]},
+    }
+
+
+def test_event_item_is_not_modified(simulator):
+    client = BookeoClient(base_url=simulator.bookeo_url)
+    item = booking_item()
+    original = copy.deepcopy(item)
+
+    assert client.update_booking("B1", item, "['Success']").ok
+    assert item == original
+    assert simulator.bookings["B1"] == {'bookingNumber': "B-1", 'participants': {'numbers': [{'number': 1}]},
+                                        'externalRef': "['Success']"}
+
+
+def test_updates_during_a_put_are_coalesced():
+    with Simulator(route_latency={'bookeo': 0.3}) as simulator:
+        client = BookeoClient(base_url=simulator.bookeo_url)
+        first = threading.Thread(target=client.update_booking, args=("B1", booking_item(), "first"))
+        first.start()
+        time.sleep(0.1)  # The first PUT is in flight
+        assert client.update_booking("B1", booking_item(), "second") is None
+        assert client.update_booking("B1", booking_item(), "third") is None
+        first.join()
+
+        assert simulator.counts[('bookeo', 200)] == 2
+        assert simulator.bookings["B1"]['externalRef'] == "third"
+
+
+def test_throttled_update_pauses_later_updates(monkeypatch):
+    monkeypatch.setattr(BookeoClient, "RETRY_TOTAL", 0)
+    with Simulator(rate_limit=1) as simulator:
+        client = BookeoClient(base_url=simulator.bookeo_url)
+        assert client.update_booking("B1", booking_item(), "first").status_code == 200
+        assert client.update_booking("B2", booking_item(), "first").status_code == 429
+
+        started = time.monotonic()
+        assert client.update_booking("B2", booking_item(), "second").status_code == 200
+        assert time.monotonic() - started >= 0.9  # Retry-After: 1
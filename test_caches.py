@@ -0,0 +1,56 @@
+"""Expiry of the course search and SecureConfiguration caches, and the stale-config refresh."""
+
+import time
+
+import cpr_bot
+from cpr_bot import CourseIndex, CourseSearchCache, SecureConfigCache
+from loadgen import synthetic_event
+
+
+class Clock:
+    """Stands in for time.monotonic()."""
+
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_course_cache_expires_negative_entries_sooner(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cpr_bot.time, "monotonic", clock)
+    cache = CourseSearchCache(ttl=300, negative_ttl=60)
+    cache.put("2030-01-14", CourseIndex([{'Id': "c1", 'Attributes': []}]))
+    cache.put("2030-01-15", CourseIndex([]))
+
+    clock.now += 61
+    assert cache.get("2030-01-14") is not None
+    assert cache.get("2030-01-15") is None
+
+    clock.now += 240
+    assert cache.get("2030-01-14") is None
+
+
+def test_secure_config_cache_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cpr_bot.time, "monotonic", clock)
+    cache = SecureConfigCache(ttl=100)
+    cache.put("config")
+    assert cache.get() == "config"
+
+    clock.now += 101
+    assert cache.get() is None
+
+
+def test_secure_config_is_fetched_once_and_refreshed_when_rejected(make_bot, simulator):
+    config_cache = SecureConfigCache()
+    bot = make_bot(config_cache=config_cache)
+    bot.run(synthetic_event("t", 0, 1))
+    simulator.rotate_config()
+    bot.run(synthetic_event("t", 1, 1))
+
+    assert bot.bookeo_response == ["Success"]
+    assert simulator.counts[('course_management', 200)] == 2
+    assert simulator.counts[('grid', 500)] == 1
+    assert config_cache.get() == simulator.secure_config
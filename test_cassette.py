@@ -0,0 +1,41 @@
+"""Cassettes: a simulator scenario recorded, then replayed offline under a request budget."""
+
+import pytest
+
+from bookeo import BookeoClient
+from cassette import Cassette, CassetteError
+from loadgen import synthetic_event
+
+
+def run_booking(make_bot, simulator, cassette, cookies_path):
+    """Book one two-participant event with all MyRC, B2C and Bookeo traffic through the cassette."""
+    bot = make_bot(transport=cassette.wrap,
+                   bookeo=BookeoClient(base_url=simulator.bookeo_url, transport=cassette.wrap))
+    bot.cookies_path = cookies_path
+    bot.run(synthetic_event("t", 0, 2))
+    return bot
+
+
+@pytest.fixture
+def recording(make_bot, simulator, tmp_path):
+    """Record the booking against the simulator, then stop it so replays can't reach it."""
+    cassette = Cassette(str(tmp_path / "booking.json"), mode="record")
+    bot = run_booking(make_bot, simulator, cassette, tmp_path / "record.pkl")
+    assert bot.bookeo_response == ["Success", "Success"]
+    cassette.save()
+    simulator.stop()
+    return cassette
+
+
+def test_replay_matches_the_recording_within_budget(make_bot, simulator, recording, tmp_path):
+    cassette = Cassette(str(recording.path), budget=recording.requests_made)
+    bot = run_booking(make_bot, simulator, cassette, tmp_path / "replay.pkl")
+
+    assert bot.bookeo_response == ["Success", "Success"]
+    assert cassette.counts == recording.counts
+
+
+def test_replay_over_budget_fails(make_bot, simulator, recording, tmp_path):
+    cassette = Cassette(str(recording.path), budget=recording.requests_made - 1)
+    with pytest.raises(CassetteError):
+        run_booking(make_bot, simulator, cassette, tmp_path / "replay.pkl")
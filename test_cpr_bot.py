@@ -0,0 +1,34 @@
+"""CprBot runs against the simulator: recovering from an expired verification token."""
+
+import time
+
+import pytest
+
+from loadgen import synthetic_event
+from simulator import Simulator
+
+TOKEN_TTL = 0.5
+
+
+@pytest.fixture
+def simulator():
+    """The shared simulator, rejecting verification tokens after TOKEN_TTL seconds."""
+    with Simulator(token_ttl=TOKEN_TTL) as sim:
+        yield sim
+
+
+def test_rejected_token_is_refreshed_and_the_request_replayed(make_bot, simulator):
+    bot = make_bot()
+    bot.run(synthetic_event("t", 0, 1))
+    assert bot.bookeo_response == ["Success"]
+    tokens_fetched = simulator.counts[('tokenhtml', 200)]
+
+    time.sleep(TOKEN_TTL + 0.1)
+    bot.run(synthetic_event("t", 1, 1))
+
+    assert bot.bookeo_response == ["Success"]
+    # Every search page carried the expired token; each was replayed, but the token was fetched once
+    assert simulator.counts[('grid', 403)] == simulator.pages
+    assert simulator.counts[('grid', 200)] == 2 * simulator.pages
+    assert simulator.counts[('tokenhtml', 200)] == tokens_fetched + 1
+    assert simulator.counts[('complete_signin', 302)] == 1  # No re-login
@@ -4,6 +4,9 @@ Dry Run Test - Simulates full registration flow without actually registering.
 Usage:
     python test_dry_run.py                    # Use default test data
     python test_dry_run.py --real             # Actually register (remove dry run)
+    python test_dry_run.py --record cassettes/dry_run.json   # Save the HTTP exchanges (redacted)
+    python test_dry_run.py --replay cassettes/dry_run.json   # Run offline from a recording
+    python test_dry_run.py --replay cassettes/dry_run.json --budget 12   # Fail above 12 requests
 """
 
 import sys
@@ -12,6 +15,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from bookeo import BookeoClient
+from cassette import Cassette
 from cpr_bot import CprBot
 
 # Test booking data - modify as needed
@@ -51,10 +56,24 @@ TEST_BOOKING = {
 }
 
 
+def flag_value(name):
+    """Return the value following a command-line flag, or None."""
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else None
+
+
 def main():
     # Check for --real flag to disable dry run
     dry_run = "--real" not in sys.argv
 
+    # Optional HTTP cassette: record live exchanges or replay them offline
+    cassette = None
+    budget = int(flag_value("--budget")) if "--budget" in sys.argv else None
+    if "--record" in sys.argv:
+        cassette = Cassette(flag_value("--record"), mode="record", budget=budget)
+    elif "--replay" in sys.argv:
+        cassette = Cassette(flag_value("--replay"), mode="replay", budget=budget)
+        os.environ['EMAIL_RECIPIENTS'] = '[]'  # Never email from a replay
+
     print("=" * 70)
     print("SaveALife CPR Bot - Registration Test")
     print("=" * 70)
@@ -76,7 +95,10 @@ def main():
             return
 
     # Create bot with dry_run flag
-    bot = CprBot(dry_run=dry_run)
+    if cassette:
+        bot = CprBot(dry_run=dry_run, transport=cassette.wrap, bookeo=BookeoClient(transport=cassette.wrap))
+    else:
+        bot = CprBot(dry_run=dry_run)
 
     # Run the registration
     result = bot.run(TEST_BOOKING)
@@ -84,6 +106,11 @@ def main():
     print("")
     print("=" * 70)
     print(f"Final Result: {result}")
+    if cassette:
+        print(f"HTTP requests: {cassette.requests_made} {dict(cassette.counts)}")
+        if cassette.mode == "record":
+            cassette.save()
+            print(f"Cassette saved: {cassette.path}")
     print("=" * 70)
 
 
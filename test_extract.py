@@ -0,0 +1,30 @@
+"""PageExtractor: anchored window first, whole page only for fields still missing."""
+
+from extract import PageExtractor, B2C_SETTINGS, SIGNIN_FORM
+
+FILLER = "<div>" + "x" * 20000 + "</div>"
+
+
+def test_fields_next_to_the_anchor():
+    page = FILLER + '<script>var SETTINGS = {"csrf": "abc", "transId": "StateProperties=xyz", "api": "Combined"};</script>'
+    assert B2C_SETTINGS.extract(page) == {'csrf': "abc", 'state_properties': "xyz", 'api': "Combined"}
+
+
+def test_field_outside_the_window_falls_back_to_whole_page():
+    page = '"transId": "StateProperties=far"' + FILLER + '{"csrf": "abc", "api": "Combined"}'
+    result = B2C_SETTINGS.extract(page)
+    assert result['state_properties'] == "far"
+    assert result.missing == ()
+
+
+def test_missing_fields_are_reported():
+    page = FILLER + "<input type='hidden' name='id_token' value='tok'/>"
+    result = SIGNIN_FORM.extract(page)
+    assert result == {'id_token': "tok"}
+    assert result.missing == ('state',)
+
+
+def test_alternative_patterns_are_tried_in_order():
+    extractor = PageExtractor('key', {'value': [r'key=(\d+)', r'key:(\w+)']})
+    assert extractor.extract("key:abc")['value'] == "abc"
+    assert extractor.extract("key=12 key:abc")['value'] == "12"
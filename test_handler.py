@@ -0,0 +1,36 @@
+"""Which ledger and pending queue the Lambda handler's processing paths run with."""
+
+import pytest
+
+import handler
+from ledger import DynamoLedger, Ledger
+from pending import PendingQueue
+
+
+@pytest.fixture(autouse=True)
+def fresh_stores(monkeypatch):
+    monkeypatch.setattr(handler, "_stores_created", False)
+    monkeypatch.setattr(handler, "_ledger", None)
+    monkeypatch.setattr(handler, "_pending_queue", None)
+    monkeypatch.delenv('LEDGER_TABLE', raising=False)
+    monkeypatch.delenv('LEDGER_PATH', raising=False)
+
+
+def test_no_store_runs_without_dedupe(capsys):
+    assert handler._stores() == (None, None)
+    assert "running without the idempotency ledger" in capsys.readouterr().out
+
+
+def test_ledger_path_holds_ledger_and_queue(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEDGER_PATH', str(tmp_path / "shared.sqlite3"))
+    ledger, queue = handler._stores()
+    assert isinstance(ledger, Ledger)
+    assert isinstance(queue, PendingQueue)
+
+
+def test_ledger_table_takes_precedence(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEDGER_TABLE', "cpr-ledger")
+    monkeypatch.setenv('LEDGER_PATH', str(tmp_path / "shared.sqlite3"))
+    ledger, queue = handler._stores()
+    assert isinstance(ledger, DynamoLedger) and ledger.table == "cpr-ledger"
+    assert isinstance(queue, PendingQueue)
@@ -0,0 +1,86 @@
+"""Ledger claim semantics, and how run() settles and releases claims."""
+
+import copy
+import time
+
+import pytest
+
+import ledger as ledger_module
+from ledger import Ledger, ParticipantsInProgress, participant_fingerprint
+from loadgen import synthetic_event
+from pending import PendingQueue
+
+
+def test_claim_is_exclusive_until_recorded(ledger):
+    assert ledger.claim("B1", "fp")
+    assert not ledger.claim("B1", "fp")
+
+    ledger.record("B1", "fp", "Failed to Add Participant")
+    assert ledger.claim("B1", "fp")
+
+
+def test_success_is_never_overwritten(ledger):
+    assert ledger.claim("B1", "fp")
+    ledger.record("B1", "fp", Ledger.SUCCESS)
+
+    assert not ledger.claim("B1", "fp")
+    ledger.record("B1", "fp", "Failure")
+    assert ledger.outcomes("B1") == {"fp": Ledger.SUCCESS}
+
+
+def test_stale_claim_can_be_taken_over(ledger, monkeypatch):
+    assert ledger.claim("B1", "fp")
+    later = time.time() + ledger.claim_ttl + 1
+    monkeypatch.setattr(ledger_module.time, "time", lambda: later)
+    assert ledger.claim("B1", "fp")
+
+
+def test_stores_share_one_file(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    ledger, queue = Ledger(path), PendingQueue(path)
+    ledger.record("B1", "fp", "No Courses Found")
+    queue.add({'itemId': "B1"}, "2030-01-14")
+
+    assert ledger.outcomes("B1") == {"fp": "No Courses Found"}
+    assert len(queue) == 1
+
+
+def test_run_that_raises_releases_its_claims(make_bot, ledger, monkeypatch):
+    bot = make_bot(ledger=ledger)
+    event = synthetic_event("t", 0, 2)
+
+    def crash(participants):
+        raise KeyError("boom")
+    monkeypatch.setattr(bot, "enroll_participants_batch", crash)
+    with pytest.raises(KeyError):
+        bot.run(copy.deepcopy(event))
+    assert sorted(ledger.outcomes(event['itemId']).values()) == ["Failure", "Failure"]
+
+    # The retry takes the released participants instead of skipping the booking
+    monkeypatch.delattr(bot, "enroll_participants_batch")
+    bot.run(copy.deepcopy(event))
+    assert bot.bookeo_response == ["Success", "Success"]
+
+
+def test_booking_claimed_elsewhere_is_not_settled(make_bot, ledger, simulator):
+    bot = make_bot(ledger=ledger)
+    event = synthetic_event("t", 0, 2)
+    for participant in bot.parse_event(copy.deepcopy(event)):
+        ledger.claim(event['itemId'], participant_fingerprint(participant))
+
+    with pytest.raises(ParticipantsInProgress):
+        bot.run(copy.deepcopy(event))
+    assert event['itemId'] not in simulator.bookings  # No Bookeo update for an unfinished booking
+
+
+def test_stale_claim_from_crashed_run_is_registered(make_bot, ledger, monkeypatch):
+    bot = make_bot(ledger=ledger)
+    event = synthetic_event("t", 0, 1)
+    participant = bot.parse_event(copy.deepcopy(event))[0]
+    assert ledger.claim(event['itemId'], participant_fingerprint(participant))
+
+    later = time.time() + ledger.claim_ttl + 1
+    monkeypatch.setattr(ledger_module.time, "time", lambda: later)
+    bot.run(copy.deepcopy(event))
+    assert bot.bookeo_response == ["Success"]
+    assert ledger.outcomes(event['itemId']) == {participant_fingerprint(participant): Ledger.SUCCESS}
@@ -45,7 +45,7 @@ def test_login():
             print("\n" + "=" * 50)
             print("LOGIN SUCCESSFUL!")
             print("=" * 50)
-            print(f"Secure config obtained: {bot.secure_config[:50]}...")
+            print(f"Secure config obtained: {bot._get_secure_config()[:50]}...")
             return True
         else:
             print("\n" + "=" * 50)
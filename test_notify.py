@@ -0,0 +1,75 @@
+"""Outbox claims: senders sharing the file never send a message twice."""
+
+import sqlite3
+import time
+
+import notify as notify_module
+from notify import NotificationDispatcher, Outbox
+
+
+class Connection:
+    """Stands in for SmtpConnection, recording what was sent."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+
+    def send(self, subject, body, recipients):
+        if self.fail:
+            raise OSError("connection refused")
+        self.sent.append(subject)
+
+    def close(self):
+        pass
+
+
+def test_claimed_messages_are_sent_once(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    first, second = Outbox(path), Outbox(path)
+    first.add("Success", "body", ["a@example.com"])
+    first.add("Failure", "body", ["a@example.com"])
+
+    assert [m[1] for m in first.claim()] == ["Success", "Failure"]
+    assert second.claim() == []
+
+
+def test_failed_send_releases_the_claim(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    outbox.add("Success", "body", ["a@example.com"])
+    assert NotificationDispatcher(outbox, Connection(fail=True)).flush() == 0
+
+    connection = Connection()
+    assert NotificationDispatcher(outbox, connection).flush() == 1
+    assert connection.sent == ["Success"]
+
+
+def test_stale_claim_can_be_taken_over(tmp_path, monkeypatch):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"), claim_ttl=60)
+    outbox.add("Success", "body", ["a@example.com"])
+    assert len(outbox.claim()) == 1
+
+    later = time.time() + 61
+    monkeypatch.setattr(notify_module.time, "time", lambda: later)
+    assert len(outbox.claim()) == 1
+
+
+def test_digest_claims_nothing_before_its_interval(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    outbox.add("Success", "body", ["a@example.com"])
+    dispatcher = NotificationDispatcher(outbox, Connection(), digest_interval=3600)
+
+    assert dispatcher.flush() == 0
+    assert dispatcher.flush(force=True) == 1
+
+
+def test_outbox_created_before_claims_is_migrated(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, subject TEXT NOT NULL, "
+                 "body TEXT NOT NULL, recipients TEXT NOT NULL, created_at REAL NOT NULL, "
+                 "attempts INTEGER NOT NULL DEFAULT 0)")
+    conn.execute("INSERT INTO outbox (subject, body, recipients, created_at) VALUES ('Success', '', '[]', 0)")
+    conn.commit()
+    conn.close()
+
+    assert [m[1] for m in Outbox(path).claim()] == ["Success"]
@@ -0,0 +1,22 @@
+"""process_pending: parked bookings are retried with one course search per date."""
+
+import copy
+
+from loadgen import COURSE_DATES, synthetic_event
+from pending import PendingQueue, process_pending
+
+
+def test_each_date_is_searched_once(make_bot, simulator, tmp_path):
+    queue = PendingQueue(str(tmp_path / "ledger.sqlite3"))
+    bot = make_bot(pending_queue=queue)
+    # Two bookings on the first date, one on the second
+    for n in (0, len(COURSE_DATES), 1):
+        event = synthetic_event("t", n, 1)
+        queue.add(event, bot.parse_event(copy.deepcopy(event))[0]['course_date'])
+
+    stats = process_pending(queue, bot)
+
+    assert stats == {'registered': 3, 'pending': 0, 'expired': 0}
+    assert len(queue) == 0
+    assert simulator.counts[('grid', 200)] == 2 * simulator.pages
+    assert simulator.counts[('participants', 204)] == 3
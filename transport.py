@@ -0,0 +1,72 @@
+"""
+Transport-level retry policy shared by the MyRC and Bookeo HTTP clients.
+"""
+
+import random
+
+import requests
+from urllib3.util.retry import Retry
+
+
+# Throttling and transient server errors worth retrying
+TRANSIENT_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# Statuses where the server refused the request without processing it,
+# so retrying is safe even for POSTs that create records
+REFUSED_STATUS_CODES = frozenset({429, 503})
+
+
+class SessionExpired(requests.exceptions.RequestException):
+    """MyRC answered with its sign-in page because the session has expired."""
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 20.0) -> float:
+    """Exponential backoff with full jitter for the given 1-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def classify_failure(error: requests.exceptions.RequestException) -> str:
+    """
+    Classify a failed request for the registration retry loops.
+
+    Returns:
+        "transient" - worth retrying after a backoff
+        "auth" - the MyRC session has likely expired; re-check it, then retry
+        "permanent" - retrying won't help
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return "transient"
+    if isinstance(error, SessionExpired):
+        return "auth"
+    if isinstance(error, requests.exceptions.InvalidJSONError):
+        # The portal serves its HTML sign-in page instead of JSON once the session expires
+        return "auth"
+
+    response = getattr(error, 'response', None)
+    if response is None:
+        return "transient"
+    if response.status_code in (401, 403):
+        return "auth"
+    if response.status_code in TRANSIENT_STATUS_CODES:
+        return "transient"
+    return "permanent"
+
+
+class TransportRetry(Retry):
+    """
+    urllib3 retry policy with failure classification and jittered backoff.
+
+    Connection errors are always retried. Transient status codes are retried
+    for idempotent methods, while POSTs only retry on REFUSED_STATUS_CODES so
+    a create that may have been applied is never replayed. Retry-After is
+    honoured by urllib3 for 429/503 responses.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if self.total and status_code in REFUSED_STATUS_CODES:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self) -> float:
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, super().get_backoff_time())
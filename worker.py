@@ -0,0 +1,203 @@
+"""
+Micro-batching worker for the CPR Bot.
+
+In worker mode the webhook ack path puts events on an EventQueue instead of
+invoking the function once per booking. The worker drains the queue in batches
+bounded by size and wait time, and runs each batch through AsyncCprBot on one
+long-lived CprBot. A burst of bookings then shares a single login and a single
+course search per date.
+
+The queue is a SQLite table. Every ack path and worker must see the same file,
+e.g. a local disk for a single host or EFS for Lambda.
+
+Usage:
+    python worker.py                   # Drain until the queue is empty
+    python worker.py --forever         # Keep polling for new events
+    python worker.py --max-batch 50 --max-wait 5
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, TYPE_CHECKING
+
+from ledger import Ledger, SqliteStore
+
+if TYPE_CHECKING:
+    from async_bot import AsyncCprBot
+
+DEFAULT_QUEUE_PATH = "/tmp/cpr_queue.sqlite3"
+
+# Not yet taken, or taken by a worker whose visibility timeout has passed
+_AVAILABLE = "taken_at IS NULL OR taken_at < ?"
+
+
+class EventQueue(SqliteStore):
+    """SQLite-backed queue of accepted webhook events awaiting the worker."""
+
+    SCHEMA = ("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            enqueued_at REAL NOT NULL,
+            taken_at REAL,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )
+    """,)
+
+    def __init__(self, path: Optional[str] = None, visibility_timeout: float = 900, max_attempts: int = 3):
+        """
+        Args:
+            path: SQLite file. Defaults to $EVENT_QUEUE_PATH or /tmp/cpr_queue.sqlite3.
+            visibility_timeout: Seconds after which events taken by a worker
+                                that never finished them can be taken again.
+            max_attempts: Batches an event may fail before it is dropped.
+        """
+        super().__init__(Path(path or os.environ.get('EVENT_QUEUE_PATH', DEFAULT_QUEUE_PATH)))
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def put(self, event: Dict[str, Any]) -> None:
+        """Enqueue an accepted webhook event."""
+        self._connect().execute(
+            "INSERT INTO events (event, enqueued_at) VALUES (?, ?)", (json.dumps(event), time.time())
+        )
+
+    def waiting(self) -> Tuple[int, Optional[float]]:
+        """Return (number of available events, enqueue time of the oldest one)."""
+        return self._connect().execute(
+            f"SELECT COUNT(*), MIN(enqueued_at) FROM events WHERE {_AVAILABLE}",
+            (time.time() - self.visibility_timeout,)
+        ).fetchone()
+
+    def take(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Atomically take up to limit of the oldest available events."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT id, event FROM events WHERE {_AVAILABLE} ORDER BY id LIMIT ?",
+                (now - self.visibility_timeout, limit)
+            ).fetchall()
+            conn.executemany("UPDATE events SET taken_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(row_id, json.loads(event)) for row_id, event in rows]
+
+    def done(self, ids: List[int]) -> None:
+        """Remove processed events."""
+        self._connect().executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
+
+    def release(self, ids: List[int]) -> None:
+        """Return failed events to the queue, dropping those out of attempts."""
+        conn = self._connect()
+        conn.executemany(
+            "UPDATE events SET taken_at = NULL, attempts = attempts + 1 WHERE id = ?", [(i,) for i in ids]
+        )
+        dropped = conn.execute("DELETE FROM events WHERE attempts >= ?", (self.max_attempts,)).rowcount
+        if dropped:
+            print(f"Dropped {dropped} event(s) after {self.max_attempts} failed attempts")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+def next_batch(queue: EventQueue, max_batch: int, max_wait: float, poll_interval: float = 0.2,
+               block: bool = False) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    Wait for a batch to fill, then take it.
+
+    A batch closes when max_batch events are waiting or the oldest one has
+    waited max_wait seconds, so a burst is collected into one batch while a
+    lone booking is delayed by at most max_wait.
+
+    Args:
+        queue: Queue to take from
+        max_batch: Largest batch to take
+        max_wait: Seconds the oldest event may wait for the batch to fill
+        poll_interval: Seconds between queue checks
+        block: Keep waiting when the queue is empty instead of returning []
+    """
+    while True:
+        count, oldest = queue.waiting()
+        if count >= max_batch or (count and time.time() - oldest >= max_wait):
+            return queue.take(max_batch)
+        if not count and not block:
+            return []
+        time.sleep(poll_interval)
+
+
+def process_batch(queue: EventQueue, engine: "AsyncCprBot", batch: List[Tuple[int, Dict[str, Any]]]) -> int:
+    """
+    Run one batch through the engine's shared session.
+
+    An event that raised, or whose result still has participants another run
+    holds "In Progress", goes back to the queue instead of being deleted.
+
+    Returns:
+        Number of events that failed and were returned to the queue
+    """
+    ids = [row_id for row_id, _ in batch]
+    results = engine.run_many([event for _, event in batch], return_exceptions=True)
+
+    failed = []
+    for row_id, result in zip(ids, results):
+        if isinstance(result, Exception):
+            print(f"Event {row_id} failed: {result}")
+            failed.append(row_id)
+        elif Ledger.IN_PROGRESS in (result.get('bookeo_response') or []):
+            print(f"Event {row_id} has participants still in progress, returning it to the queue")
+            failed.append(row_id)
+    queue.done([i for i in ids if i not in failed])
+    if failed:
+        queue.release(failed)
+    return len(failed)
+
+
+def drain(queue: EventQueue, engine: "AsyncCprBot", max_batch: int = 20, max_wait: float = 2.0,
+          forever: bool = False) -> int:
+    """
+    Drain the queue batch by batch.
+
+    Args:
+        queue: Queue to drain
+        engine: Async engine; its CprBot's login and course cache carry over between batches
+        max_batch: Largest batch to run at once
+        max_wait: Seconds the oldest event may wait for its batch to fill
+        forever: Keep polling once the queue is empty
+
+    Returns:
+        Number of events processed
+    """
+    processed = 0
+    while True:
+        batch = next_batch(queue, max_batch, max_wait, block=forever)
+        if not batch:
+            return processed
+        started = time.monotonic()
+        failed = process_batch(queue, engine, batch)
+        processed += len(batch)
+        print(f"Batch of {len(batch)} events done in {time.monotonic() - started:.1f}s ({failed} failed)")
+
+
+def main():
+    from async_bot import AsyncCprBot
+    from cpr_bot import CprBot
+    from pending import PendingQueue
+
+    max_batch = int(sys.argv[sys.argv.index("--max-batch") + 1]) if "--max-batch" in sys.argv else 20
+    max_wait = float(sys.argv[sys.argv.index("--max-wait") + 1]) if "--max-wait" in sys.argv else 2.0
+
+    bot = CprBot(ledger=Ledger(), pending_queue=PendingQueue())
+    engine = AsyncCprBot(concurrency=8, bot=bot)
+    processed = drain(EventQueue(), engine, max_batch, max_wait, forever="--forever" in sys.argv)
+    print(f"Worker processed {processed} events")
+
+
+if __name__ == "__main__":
+    main()